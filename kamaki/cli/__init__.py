@@ -292,7 +292,9 @@ def init_cached_authenticator(config_argument, cloud, logger):
                     astakos.authenticate(token)
                 else:
                     tmp_base = CachedAstakosClient(url, token)
-                    from kamaki.cli.cmds import CommandInit
+                    from kamaki.cli.cmds import (
+                        CommandInit, get_response_cache)
+                    tmp_base.response_cache = get_response_cache(_cnf)
                     fake_cmd = CommandInit(dict(config=config_argument))
                     fake_cmd.client = astakos
                     fake_cmd._set_log_params()
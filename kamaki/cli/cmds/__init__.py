@@ -35,6 +35,7 @@ from sys import stdin, stdout, stderr
 from traceback import format_exc
 
 from kamaki.cli.logger import get_logger
+from kamaki.clients import JSONLinesWriter, ResponseCache
 from kamaki.cli.utils import (
     print_list, print_dict, print_json, print_items, ask_user, pref_enc,
     filter_dicts_by_dict)
@@ -44,6 +45,8 @@ from kamaki.cli.cmds import errors
 
 
 log = get_logger(__name__)
+_request_log_writers = dict()
+_response_caches = dict()
 
 
 def dont_raise(*errs):
@@ -61,6 +64,24 @@ def dont_raise(*errs):
     return decorator
 
 
+def get_response_cache(config):
+    """:returns: (ResponseCache) the cache set by global.response_cache and
+        global.response_cache_ttl, or None if response_cache is not set
+    """
+    try:
+        path = config.get('global', 'response_cache')
+        if not path:
+            return None
+        ttl = float(config.get('global', 'response_cache_ttl') or 0)
+        cache = _response_caches.get((path, ttl))
+        if cache is None:
+            cache = _response_caches[(path, ttl)] = ResponseCache(path, ttl)
+        return cache
+    except Exception as e:
+        log.debug('Failed to set up response_cache %s' % e)
+        return None
+
+
 def client_log(func):
     def wrap(self, *args, **kwargs):
         try:
@@ -129,7 +150,15 @@ class CommandInit(object):
                 TOKEN = TOKEN or astakos.token
             else:
                 raise CLIBaseUrlError(service=service)
-        return cls(URL, TOKEN)
+        client = cls(URL, TOKEN)
+        pool_size = self._custom_pool_size(service)
+        if pool_size:
+            client.poolsize = int(pool_size)
+        pool_prewarm = self._custom_pool_prewarm(service)
+        if pool_prewarm:
+            client.POOL_PREWARM = int(pool_prewarm)
+        client.response_cache = get_response_cache(self.config)
+        return client
 
     @errors.Astakos.project_id
     def _project_id_exists(self, project_id):
@@ -184,6 +213,14 @@ class CommandInit(object):
     def _custom_version(self, service):
         return self.config.get_cloud(self.cloud, '%s_version' % service)
 
+    @dont_raise(KeyError)
+    def _custom_pool_size(self, service):
+        return self.config.get_cloud(self.cloud, '%s_pool_size' % service)
+
+    @dont_raise(KeyError)
+    def _custom_pool_prewarm(self, service):
+        return self.config.get_cloud(self.cloud, '%s_pool_prewarm' % service)
+
     def _uuids2usernames(self, uuids):
         return self.astakos.post_user_catalogs(uuids)
 
@@ -217,6 +254,18 @@ class CommandInit(object):
         except Exception as e:
             log.debug('Failed to read custom log_pid setting:'
                 '%s\n default for log_pid is off' % e)
+        try:
+            request_log = self['config'].get('global', 'request_log')
+            if request_log:
+                writer = _request_log_writers.get(request_log)
+                if writer is None:
+                    writer = JSONLinesWriter(request_log)
+                    _request_log_writers[request_log] = writer
+                hooks = getattr(self.client, 'request_hooks', None)
+                if hooks is not None and writer not in hooks:
+                    hooks.append(writer)
+        except Exception as e:
+            log.debug('Failed to set up request_log %s' % e)
 
     def _safe_progress_bar(
             self, msg, arg='progress_bar', countdown=False, timeout=100):
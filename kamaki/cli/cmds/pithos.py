@@ -35,11 +35,12 @@ from time import localtime, strftime
 from io import StringIO
 from pydoc import pager
 from os import path, walk, makedirs
-from threading import activeCount, enumerate as activethreads
 
-from kamaki.clients.pithos import PithosClient, ClientError
+from kamaki.clients.pithos import (
+    PithosClient, ClientError, BlockHashCache, UploadJournal)
 
 from kamaki.cli import command
+from kamaki.cli.logger import get_logger
 from kamaki.cli.cmdtree import CommandTree
 from kamaki.cli.cmds import (
     CommandInit, dont_raise, OptionalOutput, NameFilter, errors, client_log)
@@ -58,6 +59,37 @@ container_cmds = CommandTree(
 sharer_cmds = CommandTree('sharer', 'Pithos+/Storage sharers')
 group_cmds = CommandTree('group', 'Pithos+/Storage user groups')
 namespaces = [file_cmds, container_cmds, sharer_cmds, group_cmds]
+log = get_logger(__name__)
+_hash_caches = dict()
+
+
+def get_hash_cache(config):
+    """:returns: (BlockHashCache) the cache set by global.hash_cache, or None
+        if hash_cache is not set
+    """
+    try:
+        path = config.get('global', 'hash_cache')
+        if not path:
+            return None
+        cache = _hash_caches.get(path)
+        if cache is None:
+            cache = _hash_caches[path] = BlockHashCache(path)
+        return cache
+    except Exception as e:
+        log.debug('Failed to set up hash_cache %s' % e)
+        return None
+
+
+def get_upload_journal(config):
+    """:returns: (UploadJournal) the journal set by global.upload_journal, or
+        None if upload_journal is not set
+    """
+    try:
+        path = config.get('global', 'upload_journal')
+        return UploadJournal(path) if path else None
+    except Exception as e:
+        log.debug('Failed to set up upload_journal %s' % e)
+        return None
 
 
 class _PithosInit(CommandInit):
@@ -88,6 +120,8 @@ class _PithosInit(CommandInit):
     @client_log
     def _run(self):
         self.client = self.get_client(PithosClient, 'pithos')
+        self.client.hash_cache = get_hash_cache(self.config)
+        self.client.upload_journal = get_upload_journal(self.config)
         self.endpoint_url = self.client.endpoint_url
         self.token = self.client.token
         self._set_account()
@@ -95,6 +129,18 @@ class _PithosInit(CommandInit):
         self.container = self._custom_container() or 'pithos'
         self.client.container = self.container
 
+    def _stop_workers(self):
+        """Cancel the pending transfers of the client and wait for the
+        running ones. The worker threads are shared, so they are not joined
+        """
+        self.client.stop_workers()
+        self._err.write('\nWait for running transfers: ')
+        while not self.client.join_workers(0.5):
+            self._err.write('.')
+            self._err.flush()
+        self._err.write('done\n')
+        self._err.flush()
+
     def main(self):
         self._run()
 
@@ -895,10 +941,14 @@ class file_upload(_PithosContainer):
     """Upload a file
 
     The default destination is /pithos/NAME
-    where NAME is the base name of the source path"""
+    where NAME is the base name of the source path
+    Use - as the source path to upload from the standard input (e.g., a pipe)
+    to an explicit destination"""
 
     arguments = dict(
-        max_threads=IntArgument('default: 5', '--threads'),
+        max_threads=IntArgument(
+            'max concurrent block transfers, adapted to the network '
+            '(default: 16)', '--threads'),
         content_encoding=ValueArgument(
             'set MIME content type', '--content-encoding'),
         content_disposition=ValueArgument(
@@ -921,12 +971,21 @@ class file_upload(_PithosContainer):
         recursive=FlagArgument(
             'Recursively upload directory *contents* + subdirectories',
             ('-r', '--recursive')),
+        max_files=IntArgument(
+            'max files uploaded in parallel with -r (default: 8)',
+            '--max-files'),
         unchunked=FlagArgument(
             'Upload file as one block (not recommended)', '--unchunked'),
         md5_checksum=ValueArgument(
             'Confirm upload with a custom checksum (MD5)', '--etag'),
         use_hashes=FlagArgument(
             'Source file contains hashmap not data', '--source-is-hashmap'),
+        stream_window=DataSizeArgument(
+            'max memory for blocks when uploading from the standard input '
+            '(default: 64MiB)', '--stream-window'),
+        batch_size=DataSizeArgument(
+            'max bytes of missing blocks sent in one request '
+            '(default: 16MiB)', '--batch-size'),
     )
 
     def _sharing(self):
@@ -939,12 +998,13 @@ class file_upload(_PithosContainer):
             sharing['write'] = self['uuid_for_write_permission']
         return sharing or None
 
-    def _check_container_limit(self, path):
+    def _check_container_limit(self, path, path_size=None):
         cl_dict = self.client.get_container_limit()
         container_limit = int(cl_dict['x-container-policy-quota'])
         r = self.client.container_get()
         used_bytes = sum(int(o['bytes']) for o in r.json)
-        path_size = get_path_size(path)
+        if path_size is None:
+            path_size = get_path_size(path)
         if container_limit and path_size > (container_limit - used_bytes):
             raise CLIError(
                 'Container %s (limit(%s) - used(%s)) < (size(%s) of %s)' % (
@@ -961,85 +1021,101 @@ class file_upload(_PithosContainer):
                     '\t/file containerlimit set <new limit> %s' % (
                         self.client.container)])
 
+    def _tree_src_dst(self, local_path, remote_path):
+        """Walk the local tree once, create the remote directories in bulk
+
+        :returns: (list) the (local file path, remote path) pairs
+        """
+        lpath = path.abspath(local_path)
+        rpath = remote_path or path.basename(lpath)
+        if not self['recursive']:
+            raise CLIError('%s is a directory' % lpath, details=[
+                'Use %s to upload directories & contents' % (
+                    self.arguments['recursive'].lvalue)])
+        robj = self.client.container_get(path=rpath)
+        if not self['overwrite']:
+            if robj.json:
+                raise CLIError(
+                    'Objects/files prefixed as %s already exist' % rpath,
+                    details=['Existing objects:'] + ['\t/%s\t[%s]' % (
+                        o['name'],
+                        o['content_type']) for o in robj.json] + [
+                        'Use -f to add, overwrite or resume'])
+            else:
+                try:
+                    topobj = self.client.get_object_info(rpath)
+                    if not self.object_is_dir(topobj):
+                        raise CLIError(
+                            'Object /%s/%s exists but not a directory' % (
+                                self.container, rpath),
+                            details=['Use -f to overwrite'])
+                except ClientError as ce:
+                    if ce.status not in (404, ):
+                        raise
+        dirs, files, size = [], [], 0
+        for top, subdirs, fnames in walk(lpath):
+            try:
+                rel_path = rpath + top.split(lpath)[1]
+            except IndexError:
+                rel_path = rpath
+            rel_path = rel_path.replace(path.sep, '/')
+            dirs.append(rel_path)
+            for f in fnames:
+                fpath = path.join(top, f)
+                if path.isfile(fpath):
+                    pathfix = f.replace(path.sep, '/')
+                    files.append((fpath, '%s/%s' % (rel_path, pathfix)))
+                    size += path.getsize(fpath)
+                else:
+                    self.error('%s is not a regular file' % fpath)
+        self._check_container_limit(lpath, size)
+        for rel_path in dirs:
+            self.error('mkdir /%s/%s' % (self.client.container, rel_path))
+        self.client.create_directories(dirs)
+        return files
+
     def _src_dst(self, local_path, remote_path, objlist=None):
         lpath = path.abspath(local_path)
         short_path = path.basename(path.abspath(local_path))
         rpath = remote_path or short_path
         if path.isdir(lpath):
-            if not self['recursive']:
-                raise CLIError('%s is a directory' % lpath, details=[
-                    'Use %s to upload directories & contents' % (
-                        self.arguments['recursive'].lvalue)])
-            robj = self.client.container_get(path=rpath)
+            for fpath, frpath in self._tree_src_dst(lpath, rpath):
+                yield open(fpath, 'rb'), frpath
+            return
+        if not path.isfile(lpath):
+            raise CLIError(('%s is not a regular file' % lpath) if (
+                path.exists(lpath)) else '%s does not exist' % lpath)
+        try:
+            robj = self.client.get_object_info(rpath)
+            if remote_path and self.object_is_dir(robj):
+                rpath += '/%s' % (short_path.replace(path.sep, '/'))
+                self.client.get_object_info(rpath)
             if not self['overwrite']:
-                if robj.json:
-                    raise CLIError(
-                        'Objects/files prefixed as %s already exist' % rpath,
-                        details=['Existing objects:'] + ['\t/%s\t[%s]' % (
-                            o['name'],
-                            o['content_type']) for o in robj.json] + [
-                            'Use -f to add, overwrite or resume'])
-                else:
-                    try:
-                        topobj = self.client.get_object_info(rpath)
-                        if not self.object_is_dir(topobj):
-                            raise CLIError(
-                                'Object /%s/%s exists but not a directory' % (
-                                    self.container, rpath),
-                                details=['Use -f to overwrite'])
-                    except ClientError as ce:
-                        if ce.status not in (404, ):
-                            raise
-            self._check_container_limit(lpath)
-            prev = ''
-            for top, subdirs, files in walk(lpath):
-                if top != prev:
-                    prev = top
-                    try:
-                        rel_path = rpath + top.split(lpath)[1]
-                    except IndexError:
-                        rel_path = rpath
-                    self.error('mkdir /%s/%s' % (
-                        self.client.container, rel_path))
-                    self.client.create_directory(rel_path)
-                for f in files:
-                    fpath = path.join(top, f)
-                    if path.isfile(fpath):
-                        rel_path = rel_path.replace(path.sep, '/')
-                        pathfix = f.replace(path.sep, '/')
-                        yield open(fpath, 'rb'), '%s/%s' % (rel_path, pathfix)
-                    else:
-                        self.error('%s is not a regular file' % fpath)
-        else:
-            if not path.isfile(lpath):
-                raise CLIError(('%s is not a regular file' % lpath) if (
-                    path.exists(lpath)) else '%s does not exist' % lpath)
-            try:
-                robj = self.client.get_object_info(rpath)
-                if remote_path and self.object_is_dir(robj):
-                    rpath += '/%s' % (short_path.replace(path.sep, '/'))
-                    self.client.get_object_info(rpath)
-                if not self['overwrite']:
-                    raise CLIError(
-                        'Object /%s/%s already exists' % (
-                            self.container, rpath),
-                        details=['use -f to overwrite / resume'])
-            except ClientError as ce:
-                if ce.status in (404, ):
-                    self._container_exists()
-                else:
-                    raise
-            self._check_container_limit(lpath)
-            yield open(lpath, 'rb'), rpath
+                raise CLIError(
+                    'Object /%s/%s already exists' % (
+                        self.container, rpath),
+                    details=['use -f to overwrite / resume'])
+        except ClientError as ce:
+            if ce.status in (404, ):
+                self._container_exists()
+            else:
+                raise
+        self._check_container_limit(lpath)
+        yield open(lpath, 'rb'), rpath
 
     def _run(self, local_path, remote_path):
-        self.client.MAX_THREADS = int(self['max_threads'] or 5)
+        self.client.MAX_THREADS = int(self['max_threads'] or 16)
+        if self['batch_size']:
+            self.client.BATCH_SIZE = self['batch_size']
         params = dict(
             content_encoding=self['content_encoding'],
             content_type=self['content_type'],
             content_disposition=self['content_disposition'],
             sharing=self._sharing(),
             public=self['public'])
+        if path.isdir(path.abspath(local_path)) and not (
+                self['unchunked'] or self['use_hashes']):
+            return self._run_tree(local_path, remote_path, params)
         container_info_cache = dict()
         rpref = 'pithos://%s' if self['account'] else ''
         for f, rpath in self._src_dst(local_path, remote_path):
@@ -1071,23 +1147,7 @@ class file_upload(_PithosContainer):
                         container_info_cache=container_info_cache,
                         **params)
                 except KeyboardInterrupt:
-                    timeout = 0.5
-                    msg = '\n'
-                    while activeCount() > 1:
-                        msg += 'Wait for %s threads: ' % (activeCount() - 1)
-                        self._err.write(msg)
-                        for thread in activethreads():
-                            try:
-                                thread.join(timeout)
-                                self._err.write(
-                                    '.' if thread.isAlive() else '*')
-                                self._err.flush()
-                            except RuntimeError:
-                                continue
-                            finally:
-                                timeout += 0.1
-                                self._err.flush()
-                                msg = '\b' * len(msg)
+                    self._stop_workers()
                     raise CLIError('Upload canceled by user')
                 except Exception:
                     self._safe_progress_bar_finish(progress_bar)
@@ -1096,8 +1156,94 @@ class file_upload(_PithosContainer):
                     self._safe_progress_bar_finish(progress_bar)
             self.error('Upload completed')
 
+    def _run_tree(self, local_path, remote_path, params):
+        """Upload the files of a directory tree in parallel, with one progress
+        bar for all of them"""
+        files = self._tree_src_dst(local_path, remote_path)
+        rpref = 'pithos://%s' if self['account'] else ''
+
+        def uploads():
+            for fpath, rpath in files:
+                upload_params = dict(params)
+                if not (self['content_type'] and self['content_encoding']):
+                    ctype, cenc = guess_mime_type(fpath)
+                    upload_params['content_type'] = (
+                        self['content_type'] or ctype)
+                    upload_params['content_encoding'] = (
+                        self['content_encoding'] or cenc)
+                yield rpath, open(fpath, 'rb'), upload_params
+
+        (progress_bar, upload_cb) = self._safe_progress_bar(
+            'Uploading %s files' % len(files))
+        progress = upload_cb(len(files)) if upload_cb else None
+        if progress:
+            progress.next()
+        failed = []
+        try:
+            for future in self.client.upload_objects(
+                    uploads(), max_files=self['max_files']):
+                rpath, f = future.args
+                f.close()
+                if future.exception:
+                    failed.append('%s: %s' % (f.name, future.exception))
+                elif not progress:
+                    self.error('%s --> %s/%s/%s' % (
+                        f.name, rpref, self.client.container, rpath))
+                if progress:
+                    progress.next()
+        except KeyboardInterrupt:
+            self._stop_workers()
+            raise CLIError('Upload canceled by user')
+        finally:
+            self._safe_progress_bar_finish(progress_bar)
+        if failed:
+            raise CLIError(
+                '%s of %s files failed to upload' % (len(failed), len(files)),
+                details=failed)
+        self.error('Upload completed')
+
+    def _run_stream(self, remote_path):
+        for arg in ('unchunked', 'use_hashes', 'recursive'):
+            if self[arg]:
+                raise CLIInvalidArgument(
+                    'Cannot use %s when uploading from the standard input' % (
+                        self.arguments[arg].lvalue))
+        try:
+            self.client.get_object_info(remote_path)
+            if not self['overwrite']:
+                raise CLIError(
+                    'Object /%s/%s already exists' % (
+                        self.container, remote_path),
+                    details=['use -f to overwrite'])
+        except ClientError as ce:
+            if ce.status in (404, ):
+                self._container_exists()
+            else:
+                raise
+        self.client.MAX_THREADS = int(self['max_threads'] or 16)
+        ctype, cenc = guess_mime_type(remote_path)
+        rpref = 'pithos://%s' if self['account'] else ''
+        self.error('<stdin> --> %s/%s/%s' % (
+            rpref, self.client.container, remote_path))
+        self.client.upload_from_stream(
+            remote_path, self._in,
+            window=self['stream_window'],
+            etag=self['md5_checksum'],
+            content_encoding=self['content_encoding'] or cenc,
+            content_type=self['content_type'] or ctype,
+            content_disposition=self['content_disposition'],
+            sharing=self._sharing(),
+            public=self['public'])
+        self.error('Upload completed')
+
     def main(self, local_path, remote_path_or_url=None):
         super(self.__class__, self)._run(remote_path_or_url)
+        if local_path == '-':
+            if not self.path:
+                raise CLISyntaxError(
+                    'Missing destination for the standard input',
+                    details=['Usage: /file upload - <remote path>'])
+            return self._run_stream(remote_path=self.path)
         if local_path.endswith('.') or local_path.endswith(path.sep):
             remote_path = self.path or ''
         else:
@@ -1203,7 +1349,12 @@ class file_download(_PithosContainer):
             '--if-unmodified-since'),
         object_version=ValueArgument(
             'download a file of a specific version', '--object-version'),
-        max_threads=IntArgument('default: 5', '--threads'),
+        max_threads=IntArgument(
+            'max concurrent block transfers, adapted to the network '
+            '(default: 16)', '--threads'),
+        range_size=DataSizeArgument(
+            'max bytes of adjacent blocks fetched in one request '
+            '(default: 32MiB)', '--range-size'),
         progress_bar=ProgressBarArgument(
             'do not show progress bar', ('-N', '--no-progress-bar'),
             default=False),
@@ -1351,7 +1502,9 @@ class file_download(_PithosContainer):
     @errors.Pithos.local_path
     @errors.Pithos.local_path_download
     def _run(self, local_path):
-        self.client.MAX_THREADS = int(self['max_threads'] or 5)
+        self.client.MAX_THREADS = int(self['max_threads'] or 16)
+        if self['range_size']:
+            self.client.RANGE_SIZE = self['range_size']
         progress_bar = None
         try:
             for rpath, output_file in self._src_dst(local_path):
@@ -1374,21 +1527,7 @@ class file_download(_PithosContainer):
                     if_modified_since=self['modified_since_date'],
                     if_unmodified_since=self['unmodified_since_date'])
         except KeyboardInterrupt:
-            timeout = 0.5
-            msg = '\n'
-            while activeCount() > 1:
-                msg += 'Wait for %s threads: ' % (activeCount() - 1)
-                self._err.write(msg)
-                for thread in activethreads():
-                    try:
-                        thread.join(timeout)
-                        self._err.write('.' if thread.isAlive() else '*')
-                        self._err.flush()
-                    except RuntimeError:
-                        continue
-                    finally:
-                        msg = '\b' * len(msg)
-                        timeout += 0.1
+            self._stop_workers()
             raise CLIError('Download canceled by user')
         finally:
             self._safe_progress_bar_finish(progress_bar)
@@ -32,20 +32,35 @@
 
 from urllib2 import quote, unquote
 from urlparse import urlparse
-from threading import Thread
+from threading import Thread, Event, Lock, local
+from Queue import Queue
+from os import (
+    getpid, makedirs, rename, fdopen, open as os_open,
+    O_WRONLY, O_CREAT, O_TRUNC)
+from os.path import (
+    join as path_join, isdir as path_isdir, expanduser as path_expanduser)
+from hashlib import sha256
 from json import dumps, loads
 from time import time
-from httplib import ResponseNotReady, HTTPException
+from httplib import HTTPException
+from socket import timeout as SocketTimeout, error as SocketError
 from time import sleep
-from random import random
+from random import uniform
+from email.utils import parsedate_tz, mktime_tz
+from functools import wraps
 from logging import getLogger
+import atexit
+import re
 
+from objpool import PoolLimitError
 from objpool.http import PooledHTTPConnection
 
 
 TIMEOUT = 60.0   # seconds
 HTTP_METHODS = ['GET', 'POST', 'PUT', 'HEAD', 'DELETE', 'COPY', 'MOVE']
 
+_ID_RE = re.compile(r'^([0-9]+|[0-9a-fA-F-]{32,36})$')
+
 log = getLogger(__name__)
 sendlog = getLogger('%s.send' % __name__)
 recvlog = getLogger('%s.recv' % __name__)
@@ -131,7 +146,19 @@ class RequestManager(Logged):
 
     def __init__(
             self, method, url, path,
-            data=None, headers={}, params={}):
+            data=None, headers={}, params={},
+            connect_timeout=None, read_timeout=None, timeout=None):
+        """
+        :param connect_timeout: (float) seconds to wait for a connection to
+            be established (default: TIMEOUT)
+
+        :param read_timeout: (float) seconds to wait for a socket to send or
+            receive any data (default: TIMEOUT)
+
+        :param timeout: (float) seconds to wait for the whole response,
+            i.e., the headers and the body, after the request is sent. If not
+            set, only read_timeout applies
+        """
         method = method.upper()
         assert method in HTTP_METHODS, 'Invalid http method %s' % method
         if headers:
@@ -140,6 +167,11 @@ class RequestManager(Logged):
         self.method, self.data = method, data
         self.scheme, self.netloc = self._connection_info(url, path, params)
         self._headers_to_quote, self._header_prefices = [], []
+        self.connect_timeout = connect_timeout or TIMEOUT
+        self.read_timeout = read_timeout or TIMEOUT
+        self.timeout, self.deadline = timeout, None
+        self.sent, self._sock = False, None
+        self.timings, self._encoded = None, False
 
     def dump_log(self):
         plog = ('\t[%s]' % self) if self.LOG_PID else ''
@@ -153,12 +185,18 @@ class RequestManager(Logged):
         if self.data:
             sendlog.info('data size: %s%s' % (len(self.data), plog))
             if self.LOG_DATA:
-                sendlog.info(self.data.replace(self._token, '...') if (
-                    self._token) else self.data)
+                data = '%s' % self.data
+                sendlog.info(data.replace(self._token, '...') if (
+                    self._token) else data)
         else:
             sendlog.info('data size: 0%s' % plog)
 
     def _encode_headers(self):
+        """Encode and quote the headers once, so that retries of perform do
+        not quote them again"""
+        if self._encoded:
+            return
+        self._encoded = True
         headers = dict()
         for k, v in self.headers.items():
             key = k.lower()
@@ -169,32 +207,89 @@ class RequestManager(Logged):
             headers[k] = quote(val) if quotable else val
         self.headers = headers
 
-    def perform(self, conn):
+    def _settimeout(self, sock):
+        """Set the socket timeout to read_timeout, but not past the deadline
+
+        :raises SocketTimeout: if the deadline has passed
+        """
+        timeout = self.read_timeout
+        if self.deadline is not None:
+            timeout = min(timeout, self.deadline - time())
+            if timeout <= 0:
+                raise SocketTimeout('timed out')
+        if sock is not None:
+            sock.settimeout(timeout)
+
+    def read(self, response, amt=None):
+        """Read the body of the response of this request, so that the
+        deadline (if timeout is set) is not exceeded, even if the body
+        trickles in
+
+        :param response: (HTTPResponse) as returned by perform
+
+        :param amt: (int) max bytes to read (default: all of it)
+
+        :raises SocketTimeout: if the deadline has passed
         """
+        if self.deadline is None:
+            return response.read() if amt is None else response.read(amt)
+        if amt is not None:
+            self._settimeout(self._sock)
+            return response.read(amt)
+        chunks = []
+        while True:
+            self._settimeout(self._sock)
+            chunk = response.read(ResponseManager.CHUNK_SIZE)
+            if not chunk:
+                return ''.join(chunks)
+            chunks.append(chunk)
+
+    def perform(self, conn):
+        """If self.timings is a dict, the connect time and the time to the
+        first byte of the response (ttfb) are recorded in it
+
         :param conn: (httplib connection object)
 
         :returns: (HTTPResponse)
+
+        :raises SocketTimeout: if the connection or the response are not
+            ready on time
         """
         self._encode_headers()
         self.dump_log()
-        conn.request(
-            method=self.method.upper(),
-            url=self.path.encode('utf-8'),
-            headers=self.headers,
-            body=self.data)
-        sendlog.info('')
-        keep_trying = TIMEOUT
-        while keep_trying > 0:
-            try:
-                return conn.getresponse()
-            except ResponseNotReady:
-                wait = 0.03 * random()
-                sleep(wait)
-                keep_trying -= wait
-        plog = ('\t[%s]' % self) if self.LOG_PID else ''
-        logmsg = 'Kamaki Timeout %s %s%s' % (self.method, self.path, plog)
-        recvlog.debug(logmsg)
-        raise ClientError('HTTPResponse takes too long - kamaki timeout')
+        self.sent, timings = False, self.timings
+        if timings is not None:
+            start = time()
+        try:
+            if conn.sock is None:
+                conn.timeout = self.connect_timeout
+                conn.connect()
+                if timings is not None:
+                    timings['connect'] = timings.get('connect', 0.0) + (
+                        time() - start)
+            if conn.sock is not None:
+                conn.sock.settimeout(self.read_timeout)
+            conn.request(
+                method=self.method.upper(),
+                url=self.path.encode('utf-8'),
+                headers=self.headers,
+                body=self.data)
+            self.sent = True
+            sendlog.info('')
+            if self.timeout:
+                self.deadline = time() + self.timeout
+            #  keep the socket, since conn drops it if the response closes it
+            self._sock = conn.sock
+            self._settimeout(conn.sock)
+            r = conn.getresponse()
+            if timings is not None:
+                timings['ttfb'] = time() - start
+        except SocketTimeout:
+            plog = ('\t[%s]' % self) if self.LOG_PID else ''
+            logmsg = 'Kamaki Timeout %s %s%s' % (self.method, self.path, plog)
+            recvlog.debug(logmsg)
+            raise
+        return r
 
     @property
     def headers_to_quote(self):
@@ -215,21 +310,289 @@ class RequestManager(Logged):
         self._header_prefices = list(set(self._header_prefices))
 
 
+def _retry_after_seconds(value):
+    """:returns: (float) seconds to wait, from a Retry-After header value
+    (seconds or HTTP date), or None if the value is not valid"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        date = parsedate_tz(value) if value else None
+        return max(0.0, mktime_tz(date) - time()) if date else None
+
+
+class RetryPolicy(object):
+    """Decide if and when a failed request is retried
+
+    Responses 429 and 503, as well as connections that failed before the
+    request was sent, are retried for any method. Responses 502 and 504, as
+    well as connections lost after the request was sent, are retried only if
+    the request is idempotent. The delay is an exponential backoff with full
+    jitter, or the Retry-After of the response.
+
+    Retries are limited per request (retries) and per operation, i.e., for
+    all requests sharing the policy: budget + budget_ratio * requests
+    """
+
+    RETRIES = 3
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'COPY')
+    RETRY_ANY = (429, 503)
+    RETRY_IDEMPOTENT = (502, 504)
+
+    def __init__(
+            self,
+            retries=RETRIES, backoff=0.05, max_backoff=5.0,
+            max_retry_after=30.0, budget=10, budget_ratio=0.1):
+        """
+        :param retries: (int) max retries per request
+
+        :param backoff: (float) seconds, the base of the exponential backoff
+
+        :param max_backoff: (float) seconds, the max backoff
+
+        :param max_retry_after: (float) seconds, the max Retry-After to obey
+
+        :param budget: (int) retries per operation, regardless of requests
+
+        :param budget_ratio: (float) extra retries per operation, as a ratio
+            of the requests of the operation
+        """
+        self.retries, self.backoff, self.max_backoff = (
+            retries, backoff, max_backoff)
+        self.max_retry_after = max_retry_after
+        self.budget, self.budget_ratio = budget, budget_ratio
+        self.requests, self.retried = 0, 0
+        self._lock = Lock()
+
+    def operation(self):
+        """:returns: (RetryPolicy) a copy of this policy, with a new budget"""
+        return RetryPolicy(
+            self.retries, self.backoff, self.max_backoff,
+            self.max_retry_after, self.budget, self.budget_ratio)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def delay(self, attempt, retry_after=None):
+        """:returns: (float) seconds to wait before a retry
+
+        :param attempt: (int) number of failed attempts so far, minus one
+
+        :param retry_after: (str) the Retry-After header of the response
+        """
+        seconds = _retry_after_seconds(retry_after)
+        if seconds is not None:
+            return min(seconds, self.max_retry_after)
+        return uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def retry(
+            self, method, attempt,
+            status=None, sent=True, idempotent=None, retry_after=None):
+        """
+        :param method: (str) the HTTP method of the request
+
+        :param attempt: (int) number of failed attempts so far, minus one
+
+        :param status: (int) the response status, None if the connection
+            failed
+
+        :param sent: (bool) if the request was sent before the failure
+
+        :param idempotent: (bool) overrides the method-based rule, e.g., for
+            POST requests that can safely be repeated
+
+        :param retry_after: (str) the Retry-After header of the response
+
+        :returns: (float) seconds to wait before a retry, None for no retry
+        """
+        if idempotent is None:
+            idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        if status is None:
+            retryable = idempotent or not sent
+        else:
+            retryable = status in self.RETRY_ANY or (
+                idempotent and status in self.RETRY_IDEMPOTENT)
+        if not retryable or attempt >= self.retries:
+            return None
+        with self._lock:
+            if self.retried >= self.budget + self.budget_ratio * self.requests:
+                return None
+            self.retried += 1
+        return self.delay(attempt, retry_after)
+
+
+def retry_budget(method):
+    """Decorator: all requests of a client method share a retry budget"""
+
+    @wraps(method)
+    def wrap(self, *args, **kwargs):
+        self._sync_retry_limit()
+        policy = self.retry_policy
+        self.retry_policy = policy.operation()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.retry_policy = policy
+    return wrap
+
+
+class RequestAggregator(object):
+    """A request hook: aggregate requests per method and path
+
+    e.g., client.request_hooks.append(RequestAggregator())
+    """
+
+    def __init__(self):
+        self.stats, self._lock = dict(), Lock()
+
+    def __call__(self, event):
+        key = (event['method'], event['path'])
+        with self._lock:
+            stats = self.stats.setdefault(key, dict(
+                requests=0, errors=0, retries=0,
+                bytes_sent=0, bytes_received=0,
+                connect_time=0.0, total_time=0.0, max_time=0.0))
+            stats['requests'] += 1
+            stats['errors'] += 1 if (
+                event['error'] or (event['status'] or 0) >= 400) else 0
+            for k in ('retries', 'bytes_sent', 'bytes_received'):
+                stats[k] += event[k]
+            stats['connect_time'] += event['connect_time']
+            stats['total_time'] += event['total_time']
+            stats['max_time'] = max(stats['max_time'], event['total_time'])
+
+    def summary(self):
+        """:returns: (list of dicts) per method and path, sorted by total
+        time, descending"""
+        with self._lock:
+            rows = [dict(method=m, path=p, **stats) for (
+                m, p), stats in self.stats.items()]
+        return sorted(rows, key=lambda row: row['total_time'], reverse=True)
+
+
+class JSONLinesWriter(object):
+    """A request hook: write each request as a JSON line to a file
+
+    e.g., client.request_hooks.append(JSONLinesWriter('requests.jsonl'))
+    """
+
+    def __init__(self, path_or_file):
+        """:param path_or_file: (str or file) a path to append to, or an
+            open file"""
+        self.file = open(path_or_file, 'a') if isinstance(
+            path_or_file, basestring) else path_or_file
+        self._lock = Lock()
+
+    def __call__(self, event):
+        line = dumps(dict(event, time=time())) + '\n'
+        with self._lock:
+            self.file.write(line)
+            self.file.flush()
+
+
+class ConnectionStats(object):
+    """Connection counters of a netloc
+
+    opened: connections established
+    reused: requests sent over an already established connection
+    discarded: connections closed instead of returning to the pool
+    waited: requests which waited for a free connection of the pool
+    wait_time: total seconds spent waiting for a free connection
+    """
+
+    WAIT_THRESHOLD = 0.001
+
+    def __init__(self):
+        self.opened, self.reused, self.discarded, self.waited = 0, 0, 0, 0
+        self.wait_time = 0.0
+        self._lock = Lock()
+
+    def count(self, **counters):
+        with self._lock:
+            for k, v in counters.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def count_wait(self, seconds):
+        if seconds > self.WAIT_THRESHOLD:
+            self.count(waited=1, wait_time=seconds)
+
+    def release(self, pooled, close=False):
+        """Return a connection to its pool, count it if it is discarded
+
+        :param pooled: (PooledHTTPConnection) an acquired connection
+
+        :param close: (bool) close the connection, so that it is not reused
+        """
+        conn = pooled.obj
+        connected = conn.sock is not None
+        if close:
+            conn.close()
+        pooled.release()
+        if connected and conn.sock is None:
+            self.count(discarded=1)
+
+    def as_dict(self):
+        with self._lock:
+            return dict(
+                opened=self.opened, reused=self.reused,
+                discarded=self.discarded, waited=self.waited,
+                wait_time=self.wait_time)
+
+
+_connection_stats = dict()
+_connection_stats_lock = Lock()
+
+
+def get_connection_stats(netloc):
+    """:returns: (ConnectionStats) the connection counters of a netloc"""
+    with _connection_stats_lock:
+        return _connection_stats.setdefault(netloc, ConnectionStats())
+
+
 class ResponseManager(Logged):
     """Manage the http request and handle the response data, headers, etc."""
 
-    def __init__(self, request, poolsize=None, connection_retry_limit=0):
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+            self, request,
+            poolsize=None, connection_retry_limit=0, stream=False,
+            retry_policy=None, idempotent=None, hooks=None,
+            path_template=None):
         """
         :param request: (RequestManager)
 
         :param poolsize: (int) the size of the connection pool
 
-        :param connection_retry_limit: (int)
+        :param connection_retry_limit: (int) used if retry_policy is not set
+
+        :param stream: (bool) if set, the response body is not loaded in
+            memory. It should be consumed with iter_content, which releases
+            the connection when the body is exhausted
+
+        :param retry_policy: (RetryPolicy)
+
+        :param idempotent: (bool) if set, overrides the method-based
+            idempotency rule of the retry policy
+
+        :param hooks: (list of callables) each hook is called with a dict
+            describing the request, when it is completed or failed (method,
+            netloc, path, status, bytes_sent, bytes_received, connect_time,
+            ttfb, total_time, retries, error)
+
+        :param path_template: (str) the path reported to hooks, e.g.,
+            /{account}/{container}/{object} (default: the request path)
         """
-        self.CONNECTION_TRY_LIMIT = 1 + connection_retry_limit
+        self.retry_policy = retry_policy or RetryPolicy(
+            retries=connection_retry_limit)
+        self.idempotent = idempotent
+        self.hooks, self.path_template = hooks, path_template
+        self.retries, self._bytes_received = 0, 0
         self.request = request
         self._request_performed = False
         self.poolsize = poolsize
+        self.stream = stream
+        self._pooled, self._response = None, None
         self._headers_to_decode, self._header_prefices = [], []
 
     def _get_headers_to_decode(self, headers):
@@ -246,22 +609,77 @@ class ResponseManager(Logged):
     def _get_response(self):
         if self._request_performed:
             return
+        if not self.hooks:
+            return self._perform()
+        self.request.timings, self._start = dict(), time()
+        try:
+            self._perform()
+        except Exception as err:
+            self._emit(error=err)
+            raise
+        if not self.stream:
+            self._bytes_received = len(self._content or '')
+            self._emit()
+
+    def _emit(self, error=None):
+        """Call the hooks with a description of the request"""
+        timings, request = self.request.timings or dict(), self.request
+        event = dict(
+            method=request.method,
+            netloc=request.netloc,
+            path=self.path_template or request.path.split('?')[0],
+            status=getattr(self, '_status_code', None),
+            bytes_sent=len(request.data) if request.data else 0,
+            bytes_received=self._bytes_received,
+            connect_time=timings.get('connect', 0.0),
+            ttfb=timings.get('ttfb'),
+            total_time=time() - self._start,
+            retries=self.retries,
+            error=('%s' % error) if error else None)
+        for hook in self.hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                log.debug('Request hook %s failed: %s' % (hook, e))
 
+    def _perform(self):
         pool_kw = dict(size=self.poolsize) if self.poolsize else dict()
-        for retries in range(1, self.CONNECTION_TRY_LIMIT + 1):
+        policy, method = self.retry_policy, self.request.method
+        policy.count_request()
+        stats = get_connection_stats(self.request.netloc)
+        attempt = 0
+        while True:
+            pooled = PooledHTTPConnection(
+                self.request.netloc, self.request.scheme, **pool_kw)
             try:
-                with PooledHTTPConnection(
-                        self.request.netloc, self.request.scheme,
-                        **pool_kw) as connection:
-                    self.request.LOG_TOKEN = self.LOG_TOKEN
-                    self.request.LOG_DATA = self.LOG_DATA
-                    self.request.LOG_PID = self.LOG_PID
-                    r = self.request.perform(connection)
-                    plog = ''
-                    if self.LOG_PID:
-                        recvlog.info('\n%s <-- %s <-- [req: %s]\n' % (
-                            self, r, self.request))
-                        plog = '\t[%s]' % self
+                start = time()
+                connection = pooled.acquire()
+                stats.count_wait(time() - start)
+                if connection.sock is None:
+                    stats.count(opened=1)
+                else:
+                    stats.count(reused=1)
+                self.request.LOG_TOKEN = self.LOG_TOKEN
+                self.request.LOG_DATA = self.LOG_DATA
+                self.request.LOG_PID = self.LOG_PID
+                r = self.request.perform(connection)
+                plog = ''
+                if self.LOG_PID:
+                    recvlog.info('\n%s <-- %s <-- [req: %s]\n' % (
+                        self, r, self.request))
+                    plog = '\t[%s]' % self
+                delay = policy.retry(
+                    method, attempt,
+                    status=r.status,
+                    idempotent=self.idempotent,
+                    retry_after=r.getheader('retry-after'))
+                if delay is not None:
+                    r.read()
+                    recvlog.info('%d %s, retry in %.3f secs%s' % (
+                        r.status, r.reason, delay, plog))
+                    _count_retry(
+                        r.status in ConcurrencyLimit.OVERLOAD_STATUSES)
+                else:
                     self._request_performed = True
                     self._status_code, self._status = r.status, unquote(
                         r.reason)
@@ -276,27 +694,89 @@ class ResponseManager(Logged):
                         self._headers[k] = unquote(v).decode('utf-8') if (
                             k.lower()) in enc_headers else v
                         recvlog.info('  %s: %s%s' % (k, v, plog))
-                    self._content = r.read()
-                    recvlog.info('data size: %s%s' % (
-                        len(self._content) if self._content else 0, plog))
-                    if self.LOG_DATA and self._content:
-                        data = '%s%s' % (self._content, plog)
-                        if self._token:
-                            data = data.replace(self._token, '...')
-                        recvlog.info(data)
+                    if self.stream:
+                        #  Keep the connection until the body is consumed
+                        self._pooled, self._response = pooled, r
+                        self._content = None
+                        recvlog.info('data size: %s (streamed)%s' % (
+                            r.getheader('content-length', '?'), plog))
+                    else:
+                        self._content = self.request.read(r)
+                        recvlog.info('data size: %s%s' % (
+                            len(self._content) if self._content else 0,
+                            plog))
+                        if self.LOG_DATA and self._content:
+                            data = '%s%s' % (self._content, plog)
+                            if self._token:
+                                data = data.replace(self._token, '...')
+                            recvlog.info(data)
                     recvlog.info('-             -        -     -   -  - -')
-                break
-            except Exception as err:
-                if isinstance(err, HTTPException):
-                    if retries >= self.CONNECTION_TRY_LIMIT:
+                    break
+            except (HTTPException, SocketError) as err:
+                if pooled.obj is not None:
+                    stats.release(pooled, close=True)
+                delay = policy.retry(
+                    method, attempt,
+                    sent=self.request.sent, idempotent=self.idempotent)
+                if delay is None:
+                    if isinstance(err, SocketTimeout):
+                        raise ClientError(
+                            'HTTPResponse takes too long - kamaki timeout')
+                    if isinstance(err, HTTPException):
                         raise ClientError(
                             'Connection to %s failed %s times (%s: %s )' % (
-                                self.request.url, retries, type(err), err))
-                else:
-                    from traceback import format_stack
-                    recvlog.debug(
-                        '\n'.join(['%s' % type(err)] + format_stack()))
+                                self.request.url, attempt + 1, type(err),
+                                err))
                     raise
+                recvlog.info('%s: %s, retry in %.3f secs' % (
+                    type(err), err, delay))
+                _count_retry(True)
+            except Exception as err:
+                from traceback import format_stack
+                recvlog.debug(
+                    '\n'.join(['%s' % type(err)] + format_stack()))
+                raise
+            finally:
+                if pooled.obj is not None and pooled is not self._pooled:
+                    stats.release(pooled)
+            attempt += 1
+            self.retries = attempt
+            sleep(delay)
+
+    def release(self):
+        """Return a streamed connection to the pool. If the body is not fully
+        consumed, the connection is closed, so that it is not reused"""
+        pooled, r = self._pooled, self._response
+        self._pooled, self._response = None, None
+        if pooled is not None:
+            get_connection_stats(self.request.netloc).release(
+                pooled, close=not r.isclosed())
+            if self.hooks:
+                self._emit()
+
+    def iter_content(self, chunk_size=None):
+        """Iterate over the response body
+
+        :param chunk_size: (int) max bytes per chunk (default: CHUNK_SIZE)
+
+        :returns: (generator of str) chunks of the response body. In stream
+            mode, data are read from the connection as they are requested
+        """
+        self._get_response()
+        if self._response is None:
+            if self._content:
+                yield self._content
+            return
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        try:
+            while True:
+                chunk = self.request.read(self._response, chunk_size)
+                if not chunk:
+                    break
+                self._bytes_received += len(chunk)
+                yield chunk
+        finally:
+            self.release()
 
     @property
     def status_code(self):
@@ -316,6 +796,8 @@ class ResponseManager(Logged):
     @property
     def content(self):
         self._get_response()
+        if self._response is not None:
+            self._content = ''.join(self.iter_content())
         return self._content
 
     @property
@@ -323,8 +805,7 @@ class ResponseManager(Logged):
         """
         :returns: (str) content
         """
-        self._get_response()
-        return '%s' % self._content
+        return '%s' % self.content
 
     @property
     def headers_to_decode(self):
@@ -349,12 +830,113 @@ class ResponseManager(Logged):
         """
         :returns: (dict) squeezed from json-formated content
         """
-        self._get_response()
         try:
-            return loads(self._content)
+            return loads(self.content)
+        except ValueError as err:
+            raise ClientError('Response not formated in JSON - %s' % err)
+
+
+class CachedResponse(object):
+    """A response served from a ResponseCache, with the ResponseManager
+    attributes needed to read it"""
+
+    status_code, status = 200, 'OK'
+
+    def __init__(self, entry):
+        self.headers = dict(entry['headers'])
+        self.text = entry['text']
+        self.content = self.text.encode('utf-8')
+
+    @property
+    def json(self):
+        try:
+            return loads(self.content)
         except ValueError as err:
             raise ClientError('Response not formated in JSON - %s' % err)
 
+    def release(self):
+        pass
+
+
+class ResponseCache(object):
+    """An on-disk cache of GET responses, for read-mostly listings
+
+    Responses with an ETag or Last-Modified header are revalidated with
+    If-None-Match / If-Modified-Since and served from the cache on a 304.
+    If ttl is set, cached responses (with or without validators) are served
+    for ttl seconds without any request.
+    Entries are kept per URL and token, in files named after a hash of both,
+    so that tokens are not written to the disk. The cache directory and
+    files are only accessible by their owner.
+
+    e.g., client.response_cache = ResponseCache('~/.kamaki.cache', ttl=60)
+    """
+
+    def __init__(self, path, ttl=0):
+        """
+        :param path: (str) the cache directory, created if missing
+
+        :param ttl: (float) seconds to serve a response without a request
+        """
+        self.path, self.ttl = path_expanduser(path), ttl
+        self.hits, self.revalidated, self.misses = 0, 0, 0
+
+    def _file(self, url, token):
+        return path_join(
+            self.path, sha256('%s\n%s' % (token, url)).hexdigest())
+
+    def get(self, url, token):
+        """:returns: (dict) the cached entry of url for token, or None"""
+        try:
+            with open(self._file(url, token)) as f:
+                entry = loads(f.read())
+        except (IOError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def is_fresh(self, entry):
+        return bool(self.ttl) and 0 <= time() - entry['time'] < self.ttl
+
+    def validators(self, entry):
+        """:returns: (dict) the conditional headers to revalidate entry"""
+        headers, validators = dict(), dict(
+            [(k.lower(), v) for k, v in entry['headers'].items()])
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last-modified' in validators:
+            headers['If-Modified-Since'] = validators['last-modified']
+        return headers
+
+    def set(self, url, token, headers, text):
+        """Cache a response, if it can be revalidated or ttl is set
+
+        :returns: (dict) the new entry or None
+        """
+        keys = [k.lower() for k in headers]
+        if not (self.ttl or 'etag' in keys or 'last-modified' in keys):
+            return None
+        entry = dict(url=url, time=time(), headers=headers, text=text)
+        self._write(url, token, entry)
+        return entry
+
+    def refresh(self, url, token, entry):
+        """Mark entry as revalidated now"""
+        entry['time'] = time()
+        self._write(url, token, entry)
+
+    def _write(self, url, token, entry):
+        filename = self._file(url, token)
+        tmp = '%s.%s' % (filename, getpid())
+        try:
+            if not path_isdir(self.path):
+                makedirs(self.path, 0700)
+            fd = os_open(tmp, O_WRONLY | O_CREAT | O_TRUNC, 0600)
+            with fdopen(fd, 'w') as f:
+                f.write(dumps(entry))
+            rename(tmp, filename)
+        except (IOError, OSError) as e:
+            log.debug('Failed to cache %s: %s' % (url, e))
+
 
 class SilentEvent(Thread):
     """Thread-run method(*args, **kwargs)"""
@@ -382,11 +964,362 @@ class SilentEvent(Thread):
             self._exception = e
 
 
+_running = local()
+
+
+def _count_retry(overload):
+    """Count a retried request on the Future run by this thread, if any
+
+    :param overload: (bool) the request failed because the server is
+        overloaded or unreachable (e.g., 503, timeout)
+    """
+    future = getattr(_running, 'future', None)
+    if future is not None:
+        future.retries += 1
+        future.overloaded = future.overloaded or overload
+
+
+class Future(object):
+    """The result of method(*args, **kwargs), when run by a WorkerPool
+
+    retries: requests retried while running the method
+    overloaded: some of them were retried because the server was overloaded
+    """
+
+    def __init__(self, method, *args, **kwargs):
+        self.method, self.args, self.kwargs = method, args, kwargs
+        self._done, self._lock, self._callbacks = Event(), Lock(), []
+        self._started, self._cancelled = False, False
+        self.elapsed, self.retries, self.overloaded = 0.0, 0, False
+
+    @property
+    def exception(self):
+        return getattr(self, '_exception', False)
+
+    @property
+    def value(self):
+        return getattr(self, '_value', None)
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def done(self):
+        return self._done.is_set()
+
+    def isAlive(self):
+        """Thread-like interface: alive means not done yet"""
+        return not self.done()
+
+    is_alive = isAlive
+
+    def join(self, timeout=None):
+        """Thread-like interface: wait for the method call to finish"""
+        self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """Wait for the method call to finish
+
+        :returns: the value of the method call
+
+        :raises: the exception of the method call, if any
+        """
+        self.join(timeout)
+        if self.exception:
+            raise self.exception
+        return self.value
+
+    def add_done_callback(self, callback):
+        """Call callback(self) when done, or now if already done"""
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        """Do not run the method, if it has not started yet
+
+        :returns: (bool) True if cancelled, False if already started
+        """
+        with self._lock:
+            if self._started or self._cancelled:
+                return self._cancelled
+            self._cancelled = True
+        self._exception = ClientError('Operation canceled')
+        self._finish()
+        return True
+
+    def run(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._started = True
+        start, outer = time(), getattr(_running, 'future', None)
+        _running.future = self
+        try:
+            self._value = self.method(*(self.args), **(self.kwargs))
+        except Exception as e:
+            recvlog.debug('Future %s got exception %s\n<%s %s' % (
+                self,
+                type(e),
+                e.status if isinstance(e, ClientError) else '',
+                e))
+            self._exception = e
+        finally:
+            _running.future = outer
+            self.elapsed = time() - start
+            self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class WorkerPool(object):
+    """A fixed number of persistent threads, running Futures from a bounded
+    task queue"""
+
+    def __init__(self, size=1):
+        self.size, self.closed, self._pid = 0, False, getpid()
+        self._tasks = Queue(maxsize=2 * size)
+        self._lock, self._workers = Lock(), []
+        self.resize(size)
+
+    def _work(self):
+        while True:
+            future = self._tasks.get()
+            if future is None:
+                break
+            future.run()
+
+    def resize(self, size):
+        """Start or stop workers so that exactly size workers are running"""
+        assert isinstance(size, int) and size > 0, 'Pool size not a +int'
+        with self._lock:
+            stopping = max(0, self.size - size)
+            self._workers = [w for w in self._workers if w.is_alive()]
+            for i in range(self.size, size):
+                worker = Thread(target=self._work, name='kamaki-worker')
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+            self.size = size
+            with self._tasks.not_full:
+                self._tasks.maxsize = 2 * size
+                self._tasks.not_full.notify_all()
+        #  may block until there is room in the queue, so not under _lock
+        for i in range(stopping):
+            self._tasks.put(None)
+
+    def submit(self, future):
+        """Queue a Future to run, block if the task queue is full"""
+        assert not self.closed, 'Worker pool is shut down'
+        self._tasks.put(future)
+        return future
+
+    def run(self, futures, limit=None):
+        """Run futures, keeping up to limit of them in flight
+
+        :param futures: (iterable of Future) is consumed lazily, one Future
+            at a time as a slot becomes free
+
+        :param limit: (int or callable returning int) max Futures in flight
+            (default: the pool size)
+
+        :returns: (generator of Future) the Futures, in order of completion
+        """
+        finished, flying = Queue(), set()
+        try:
+            for future in futures:
+                while len(flying) >= max(
+                        1, limit() if callable(limit) else (
+                            limit or self.size)):
+                    done = finished.get()
+                    flying.discard(done)
+                    yield done
+                flying.add(future)
+                future.add_done_callback(finished.put)
+                self.submit(future)
+            while flying:
+                done = finished.get()
+                flying.discard(done)
+                yield done
+        finally:
+            for future in list(flying):
+                future.cancel()
+
+    def shutdown(self, timeout=None):
+        """Cancel queued Futures, stop the workers after their current task
+
+        :param timeout: (float) if set, wait up to timeout seconds for the
+            workers to exit
+        """
+        with self._lock:
+            self.closed = True
+            while not self._tasks.empty():
+                future = self._tasks.get_nowait()
+                if future is not None:
+                    future.cancel()
+            stopping, self.size = self.size, 0
+        for i in range(stopping):
+            self._tasks.put(None)
+        if timeout is not None:
+            deadline = time() + timeout
+            for worker in self._workers:
+                worker.join(max(0.0, deadline - time()))
+
+
+class ConcurrencyLimit(object):
+    """Adapt the number of operations in flight, up to max_limit
+
+    Completed operations are measured in windows of "limit" operations. The
+    limit doubles while the goodput of a window improves (slow start), then
+    grows by one on improvement (additive increase). It drops by one if the
+    goodput drops, or if it does not improve while latency grows, and it is
+    halved if the server is overloaded (multiplicative decrease), i.e., if
+    an operation fails or has its requests retried because of overload.
+    Several runs may share a limit: each of them gets the slots which are not
+    taken by the others (see share), but always at least one.
+    """
+
+    TOLERANCE = 0.05
+    PROBE_AFTER = 4
+    OVERLOAD_STATUSES = (429, 502, 503, 504)
+
+    def __init__(self, max_limit=1, limit=1):
+        assert isinstance(max_limit, int) and max_limit > 0, (
+            'Max limit not a +int')
+        self.max_limit, self.limit = max_limit, max(1, min(limit, max_limit))
+        self.slow_start = True
+        self._rate, self._min_latency, self._stable = None, None, 0
+        self.flying, self._lock = 0, Lock()
+        self._reset_window()
+
+    def __call__(self):
+        return self.limit
+
+    def share(self, own):
+        """:returns: (int) the limit of a run with own operations in flight"""
+        return max(1, self.limit - self.flying + own)
+
+    def started(self, future):
+        """Count an operation in flight until it completes"""
+        with self._lock:
+            self.flying += 1
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        with self._lock:
+            self.flying -= 1
+
+    def _reset_window(self):
+        self._window_start, self._window_ops = time(), 0
+        self._window_units, self._window_latency = 0, 0.0
+        self._overloaded = False
+
+    def _is_overload(self, err):
+        if isinstance(err, ClientError):
+            return err.status in self.OVERLOAD_STATUSES or not err.status
+        return isinstance(err, (HTTPException, IOError))
+
+    def update(self, future, nbytes=None):
+        """Measure a completed operation
+
+        :param future: (Future) a completed operation
+
+        :param nbytes: (int) bytes transferred by the operation. If None,
+            goodput is measured in operations per second
+        """
+        with self._lock:
+            self._update(future, nbytes)
+
+    def _update(self, future, nbytes):
+        self._window_ops += 1
+        overload = future.overloaded or bool(
+            future.exception and self._is_overload(future.exception))
+        if overload and not self._overloaded:
+            self._overloaded = True
+            self.slow_start, self._rate = False, None
+            self.limit = max(1, self.limit // 2)
+        if not future.exception:
+            self._window_units += 1 if nbytes is None else nbytes
+            self._window_latency += future.elapsed
+            self._min_latency = min(
+                future.elapsed, self._min_latency or future.elapsed)
+        if self._window_ops >= self.limit:
+            self._close_window()
+
+    def _close_window(self):
+        elapsed = max(time() - self._window_start, 1e-6)
+        rate = self._window_units / elapsed
+        successes = self._window_ops - (1 if self._overloaded else 0)
+        latency = self._window_latency / max(successes, 1)
+        if self._overloaded:
+            pass
+        elif self._rate is None or rate > self._rate * (1 + self.TOLERANCE):
+            self._stable = 0
+            self._increase()
+        elif rate < self._rate * (1 - self.TOLERANCE) or (
+                latency > 2 * (self._min_latency or latency)):
+            self.slow_start, self._stable = False, 0
+            self.limit = max(1, self.limit - 1)
+        else:
+            self.slow_start = False
+            self._stable += 1
+            if self._stable >= self.PROBE_AFTER:
+                self._stable = 0
+                self._increase()
+        self._rate = rate
+        self._reset_window()
+
+    def _increase(self):
+        self.limit = min(
+            self.max_limit, self.limit * 2 if (
+                self.slow_start) else self.limit + 1)
+
+
+_worker_pool = None
+_worker_pool_lock = Lock()
+
+
+@atexit.register
+def _shutdown_worker_pool():
+    """Let idle workers exit before the interpreter tears down, since daemon
+    threads blocked on the task queue would fail noisily"""
+    pool = _worker_pool
+    if pool is not None and not pool.closed and pool._pid == getpid():
+        pool.shutdown(timeout=1.0)
+
+
+def get_worker_pool(size=1):
+    """
+    :param size: (int) the minimum number of workers
+
+    :returns: (WorkerPool) the process-wide worker pool
+    """
+    global _worker_pool
+    with _worker_pool_lock:
+        pool = _worker_pool
+        if pool is None or pool.closed or pool._pid != getpid():
+            pool = _worker_pool = WorkerPool(size)
+        elif pool.size < size:
+            pool.resize(size)
+        return pool
+
+
 class Client(Logged):
     service_type = ''
     MAX_THREADS = 1
     DATE_FORMATS = ['%a %b %d %H:%M:%S %Y', ]
     CONNECTION_RETRY_LIMIT = 0
+    CONNECT_TIMEOUT = None
+    READ_TIMEOUT = None
+    RETRY_LIMIT = RetryPolicy.RETRIES
+    POOL_PREWARM = 0
 
     def __init__(self, endpoint_url, token, base_url=None):
         #  BW compatibility - keep base_url for some time
@@ -396,11 +1329,24 @@ class Client(Logged):
         self.token = token
         self.headers, self.params = dict(), dict()
         self.poolsize = None
+        self._retry_limits = (self.RETRY_LIMIT, self.CONNECTION_RETRY_LIMIT)
+        self.retry_policy = RetryPolicy(retries=max(self._retry_limits))
+        self.request_hooks = []
+        self.response_cache = None
+        #  shared with clones: pending operations and a count of stops
+        self._pending, self._pending_lock, self._stops = set(), Lock(), [0]
         self.request_headers_to_quote = []
         self.request_header_prefices_to_quote = []
         self.response_headers = []
         self.response_header_prefices = []
 
+    def _path_template(self, path):
+        """:returns: (str) the path with ids replaced by {id}, so that
+        requests of the same kind are reported under the same path"""
+        return '/'.join([
+            '{id}' if _ID_RE.match(p) else p for p in path.split(
+                '?')[0].split('/')])
+
     @staticmethod
     def _unquote_header_keys(headers, prefices):
         new_keys = dict()
@@ -419,36 +1365,172 @@ class Client(Logged):
         for old, new in new_keys.items():
             headers[new] = headers.pop(old)
 
-    def _init_thread_limit(self, limit=1):
-        assert isinstance(limit, int) and limit > 0, 'Thread limit not a +int'
-        self._thread_limit = limit
-        self._elapsed_old = 0.0
-        self._elapsed_new = 0.0
-
-    def _watch_thread_limit(self, threadlist):
-        self._thread_limit = getattr(self, '_thread_limit', 1)
-        self._elapsed_new = getattr(self, '_elapsed_new', 0.0)
-        self._elapsed_old = getattr(self, '_elapsed_old', 0.0)
-        recvlog.debug('# running threads: %s' % len(threadlist))
-        if self._elapsed_old and self._elapsed_old >= self._elapsed_new and (
-                self._thread_limit < self.MAX_THREADS):
-            self._thread_limit += 1
-        elif self._elapsed_old <= self._elapsed_new and self._thread_limit > 1:
-            self._thread_limit -= 1
-
-        self._elapsed_old = self._elapsed_new
-        if len(threadlist) >= self._thread_limit:
-            self._elapsed_new = 0.0
-            for thread in threadlist:
-                begin_time = time()
-                thread.join()
-                self._elapsed_new += time() - begin_time
-            self._elapsed_new = self._elapsed_new / len(threadlist)
-            return []
-        return threadlist
+    def _sync_retry_limit(self):
+        """Apply RETRY_LIMIT and CONNECTION_RETRY_LIMIT to retry_policy, if
+        they are set after the client is created"""
+        limits = (self.RETRY_LIMIT, self.CONNECTION_RETRY_LIMIT)
+        if limits != self._retry_limits:
+            self._retry_limits = limits
+            self.retry_policy.retries = max(limits)
+
+    def _concurrency_limit(self):
+        """:returns: (ConcurrencyLimit) up to MAX_THREADS, but not more than
+        the connection pool size. It is kept between calls, and reset if
+        MAX_THREADS or poolsize change"""
+        max_limit = min(self.MAX_THREADS, self.poolsize or self.MAX_THREADS)
+        limit = getattr(self, '_concurrency', None)
+        if limit is None or limit.max_limit != max_limit:
+            limit = self._concurrency = ConcurrencyLimit(max_limit)
+        return limit
+
+    def prewarm_connections(self, num):
+        """Establish up to num connections to the endpoint, in parallel, and
+        keep them in the connection pool, so that parallel operations do
+        not pay the connection (and TLS) handshakes. Only free pool slots
+        are used (it never waits for a connection) and each connection is
+        released as soon as it is established
+
+        :param num: (int) connections to have ready, capped by the size of
+            the connection pool
+
+        :returns: (int) the number of connections established
+        """
+        parsed = urlparse(self.endpoint_url)
+        scheme, netloc = parsed.scheme, parsed.netloc
+        pool_kw = dict(size=self.poolsize) if self.poolsize else dict()
+        pool = PooledHTTPConnection(netloc, scheme, **pool_kw).get_pool()
+        stats, connections = get_connection_stats(netloc), []
+        for i in range(min(num, pool.size)):
+            try:
+                connections.append(pool.pool_get(blocking=False))
+            except PoolLimitError:
+                break
+
+        def connect(conn):
+            try:
+                conn.timeout = self.CONNECT_TIMEOUT or TIMEOUT
+                conn.connect()
+                stats.count(opened=1)
+            finally:
+                pool.pool_put(conn)
+
+        futures = []
+        for conn in connections:
+            if conn.sock is None:
+                futures.append(Future(connect, conn))
+            else:
+                pool.pool_put(conn)
+        if futures:
+            for future in get_worker_pool(len(futures)).run(futures):
+                if future.exception:
+                    log.debug('Failed to prewarm a connection to %s: %s' % (
+                        netloc, future.exception))
+        sendlog.info('prewarmed %s connections to %s' % (
+            len(futures), netloc))
+        return len([f for f in futures if not f.exception])
+
+    def _prewarm(self):
+        """Pre-warm up to POOL_PREWARM connections (but no more than the
+        concurrency limit) before a parallel transfer"""
+        if self.POOL_PREWARM:
+            self.prewarm_connections(
+                min(self.POOL_PREWARM, self._concurrency_limit().max_limit))
+
+    def connection_stats(self):
+        """:returns: (dict) the connection counters of the endpoint netloc
+            (opened, reused, discarded, waited, wait_time)"""
+        netloc = urlparse(self.endpoint_url).netloc
+        return get_connection_stats(netloc).as_dict()
+
+    def _run_async(self, futures, size_of=None, max_flying=None):
+        """Run futures on the process-wide worker pool. The number of futures
+        in flight adapts to goodput and server errors, up to MAX_THREADS
+
+        :param futures: (iterable of Future)
+
+        :param size_of: (method(Future)) returns the bytes transferred by a
+            successful Future. If not given, goodput is measured in
+            operations per second
+
+        :param max_flying: (int or callable returning int) if given, never
+            run more futures at once
+
+        :returns: (generator of Future) the Futures, in order of completion
+
+        Concurrent calls on clients with the same ConcurrencyLimit (e.g.,
+        clones) share its slots
+        """
+        limit, own = self._concurrency_limit(), set()
+        pool = get_worker_pool(self.MAX_THREADS)
+
+        def counted(futures):
+            for future in futures:
+                yield future
+                #  resumed for the next Future, so this one is submitted
+                own.add(future)
+                limit.started(future)
+
+        def own_limit():
+            flying = max_flying() if callable(max_flying) else max_flying
+            return min(limit.share(len(own)), limit.max_limit if (
+                flying is None) else flying)
+
+        for future in pool.run(
+                counted(self._tracked(futures)), limit=own_limit):
+            own.discard(future)
+            limit.update(future, None if (
+                size_of is None or future.exception) else size_of(future))
+            yield future
+        sendlog.info('connections: %s' % self.connection_stats())
+
+    def _tracked(self, futures):
+        """Keep futures as pending operations of this client (and its
+        clones) until they are done, so that stop_workers can cancel them.
+        After stop_workers, the rest of the futures are cancelled"""
+        stops = self._stops[0]
+        for future in futures:
+            with self._pending_lock:
+                if stops != self._stops[0]:
+                    future.cancel()
+                self._pending.add(future)
+            future.add_done_callback(self._untrack)
+            yield future
+
+    def _untrack(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def stop_workers(self):
+        """Cancel the pending operations of this client (and its clones).
+        Running ones finish. The worker pool is shared by all clients, so it
+        is not shut down"""
+        with self._pending_lock:
+            self._stops[0] += 1
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
+
+    def join_workers(self, timeout=None):
+        """Wait for the pending operations of this client (and its clones),
+        e.g., the running ones after stop_workers
+
+        :param timeout: (float) max seconds to wait, forever if None
+
+        :returns: (bool) True if no operation is pending
+        """
+        deadline = None if timeout is None else time() + timeout
+        while True:
+            with self._pending_lock:
+                pending = list(self._pending)
+            if not pending:
+                return True
+            left = None if deadline is None else deadline - time()
+            if left is not None and left <= 0:
+                return False
+            pending[0].join(left)
 
     def async_run(self, method, kwarg_list):
-        """Fire threads of operations
+        """Run operations on the worker pool
 
         :param method: the method to run in each thread
 
@@ -458,29 +1540,12 @@ class Client(Logged):
         :returns: (list) the results of each method call w.r. to the order of
             kwarg_list
         """
-        flying, results = {}, {}
-        self._init_thread_limit()
-        for index, kwargs in enumerate(kwarg_list):
-            self._watch_thread_limit(flying.values())
-            flying[index] = SilentEvent(method=method, **kwargs)
-            flying[index].start()
-            unfinished = {}
-            for key, thread in flying.items():
-                if thread.isAlive():
-                    unfinished[key] = thread
-                elif thread.exception:
-                    raise thread.exception
-                else:
-                    results[key] = thread.value
-            flying = unfinished
-        sendlog.info('- - - wait for threads to finish')
-        for key, thread in flying.items():
-            if thread.isAlive():
-                thread.join()
-            if thread.exception:
-                raise thread.exception
-            results[key] = thread.value
-        return results.values()
+        futures = [Future(method, **kwargs) for kwargs in kwarg_list]
+        for future in self._run_async(futures):
+            if future.exception:
+                raise future.exception
+        sendlog.info('- - - all operations finished')
+        return [future.value for future in futures]
 
     def set_header(self, name, value, iff=True):
         """Set a header 'name':'value'"""
@@ -500,16 +1565,31 @@ class Client(Logged):
         These classes perform a lazy http request. Present method, by default,
         enforces them to perform the http call. Hint: call present method with
         success=None to get a non-performed ResponseManager object.
+        Call with stream=True to consume the response body with iter_content
+        instead of loading it in memory.
+        Call with timeout=SECONDS to set a deadline for this request. Connect
+        and read timeouts are set by CONNECT_TIMEOUT and READ_TIMEOUT.
+        Failed requests are retried as decided by retry_policy. Call with
+        idempotent=True for non-idempotent methods (e.g., POST) which can be
+        safely repeated.
+        Call GET with cache=True to use response_cache, if set. A cached
+        response is a CachedResponse object.
         """
         assert isinstance(method, str) or isinstance(method, unicode)
         assert method
         assert isinstance(path, str) or isinstance(path, unicode)
+        self._sync_retry_limit()
         try:
             headers = dict(self.headers)
             headers.update(async_headers)
             params = dict(self.params)
             params.update(async_params)
             success = kwargs.pop('success', 200)
+            stream = kwargs.pop('stream', False)
+            timeout = kwargs.pop('timeout', None)
+            idempotent = kwargs.pop('idempotent', None)
+            cache = kwargs.pop('cache', False) and (
+                method.upper() == 'GET') and self.response_cache
             data = kwargs.pop('data', None)
             headers.setdefault('X-Auth-Token', self.token)
             if 'json' in kwargs:
@@ -521,14 +1601,30 @@ class Client(Logged):
             sendlog.debug('\n\nCMT %s@%s%s', method, self.endpoint_url, plog)
             req = RequestManager(
                 method, self.endpoint_url, path,
-                data=data, headers=headers, params=params)
+                data=data, headers=headers, params=params,
+                connect_timeout=self.CONNECT_TIMEOUT,
+                read_timeout=self.READ_TIMEOUT,
+                timeout=timeout)
             req.headers_to_quote = self.request_headers_to_quote
             req.header_prefices = self.request_header_prefices_to_quote
+            if cache:
+                url = '%s://%s%s' % (req.scheme, req.netloc, req.path)
+                entry = cache.get(url, headers['X-Auth-Token'])
+                if entry and cache.is_fresh(entry):
+                    cache.hits += 1
+                    return CachedResponse(entry)
+                if entry:
+                    req.headers.update(cache.validators(entry))
             #  req.log()
             r = ResponseManager(
                 req,
                 poolsize=self.poolsize,
-                connection_retry_limit=self.CONNECTION_RETRY_LIMIT)
+                stream=stream,
+                retry_policy=self.retry_policy,
+                idempotent=idempotent,
+                hooks=self.request_hooks,
+                path_template=self._path_template(path) if (
+                    self.request_hooks) else None)
             r.headers_to_decode = self.response_headers
             r.header_prefices = self.response_header_prefices
             r.LOG_TOKEN, r.LOG_DATA, r.LOG_PID = (
@@ -538,6 +1634,20 @@ class Client(Logged):
             self.headers = dict()
             self.params = dict()
 
+        if cache:
+            if entry and r.status_code == 304:
+                cache.revalidated += 1
+                cache.refresh(url, r._token, entry)
+                return CachedResponse(entry)
+            cache.misses += 1
+            if r.status_code == 200:
+                try:
+                    text = r.content.decode('utf-8')
+                except UnicodeError:
+                    pass
+                else:
+                    cache.set(url, r._token, dict(r.headers), text)
+
         if success is not None:
             # Success can either be an int or a collection
             success = (success,) if isinstance(success, int) else success
@@ -32,6 +32,7 @@
 # or implied, of GRNET S.A.
 
 from logging import getLogger
+from json import dumps, loads
 import inspect
 from astakosclient import AstakosClient as OriginalAstakosClient
 from astakosclient import AstakosClientException, parse_endpoints
@@ -178,13 +179,30 @@ class CachedAstakosClient(Client):
         authentication information for this token will be available
 
         :param token: (str) custom token to authenticate
+
+        If response_cache is set with a ttl, the authentication information
+        (e.g., the service catalog) is cached for ttl seconds. The token
+        itself is not cached
         """
         token = self._resolve_token(token)
         astakos = LoggedAstakosClient(
             self.endpoint_url, token, logger=getLogger('astakosclient'))
         astakos.LOG_TOKEN = getattr(self, 'LOG_TOKEN', False)
         astakos.LOG_DATA = getattr(self, 'LOG_DATA', False)
-        r = astakos.authenticate()
+        cache, url = self.response_cache, '%s/tokens' % self.endpoint_url
+        entry = cache.get(url, token) if cache else None
+        if entry and cache.is_fresh(entry):
+            cache.hits += 1
+            r = loads(entry['text'])
+            r['access'].setdefault('token', dict())['id'] = token
+        else:
+            r = astakos.authenticate()
+            if cache:
+                cache.misses += 1
+                access = dict(r['access'])
+                access['token'] = dict(access.get('token', dict()))
+                access['token'].pop('id', None)
+                cache.set(url, token, dict(), dumps(dict(r, access=access)))
         uuid = r['access']['user']['id']
         self._uuids[token] = uuid
         self._cache[uuid] = r
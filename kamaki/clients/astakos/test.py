@@ -255,6 +255,32 @@ class CachedAstakosClient(TestCase):
         self.assertEqual(self.client._astakos[uuid].LOG_TOKEN, 'tkn')
         self.assertEqual(self.client._astakos[uuid].LOG_DATA, 'dt')
 
+    @patch('%s.LoggedAstakosClient.__init__' % astakos_pkg, return_value=None)
+    @patch(
+        '%s.LoggedAstakosClient.authenticate' % astakos_pkg,
+        return_value=example)
+    def test_authenticate_cache(self, authenticate, super_init):
+        from json import dumps, loads
+        from os import listdir
+        from shutil import rmtree
+        from tempfile import mkdtemp
+        from kamaki.clients import ResponseCache
+        path = mkdtemp()
+        try:
+            self.client.response_cache = ResponseCache(path, ttl=60)
+            self.assertEqual(self.client.authenticate(), example)
+            for name in listdir(path):
+                self.assertFalse(self.token in open('%s/%s' % (
+                    path, name)).read())
+            client = astakos.CachedAstakosClient(self.url, self.token)
+            client.response_cache = self.client.response_cache
+            self.assertEqual(client.authenticate(), loads(dumps(example)))
+            self.assertEqual(client.get_token(42), self.token)
+            self.assertEqual(len(authenticate.mock_calls), 1)
+            self.assertEqual(client.response_cache.hits, 1)
+        finally:
+            rmtree(path)
+
     @patch(
         '%s.CachedAstakosClient.get_token' % astakos_pkg, return_value='t1')
     def test_remove_user(self, get_token):
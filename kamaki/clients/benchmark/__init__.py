@@ -0,0 +1,286 @@
+# Copyright 2013-2014 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""Throughput benchmarks of kamaki clients against a local stand-in server
+
+The stand-in (kamaki.clients.benchmark.server) runs in a child process, so
+that the CPU time measured is the cost of kamaki alone. e.g.,
+    $ python -m kamaki.clients.benchmark --size 256 --threads 8
+    $ python -m kamaki.clients.benchmark upload --latency 0.02 --error-rate .01
+"""
+
+from multiprocessing import Process, Pipe
+from tempfile import NamedTemporaryFile
+from json import dumps
+from time import time
+from sys import stdout
+import os
+
+from kamaki.clients import RequestAggregator
+from kamaki.clients.astakos import CachedAstakosClient
+from kamaki.clients.pithos import PithosClient
+from kamaki.clients.cyclades import CycladesComputeClient
+from kamaki.clients.benchmark.server import (
+    StandInServer, IMAGES, BLOCK_SIZE, DEFAULT_TOKEN)
+
+BENCHMARKS = ('upload', 'download', 'listing', 'cluster', 'files')
+MB = 1024 * 1024
+
+
+def _serve(conn, kwargs):
+    server = StandInServer(**kwargs)
+    conn.send(server.auth_url)
+    conn.close()
+    server.httpd.serve_forever()
+
+
+class Benchmark(object):
+    """Measure kamaki operations against a StandInServer
+
+    e.g.,
+        bench = Benchmark(size=64 * MB, threads=8, latency=0.01)
+        bench.start()
+        results = bench.run(('upload', 'download'))
+        bench.stop()
+    """
+
+    container = 'benchmark'
+
+    def __init__(
+            self,
+            size=64 * MB, objects=200, servers=20, threads=8,
+            **server_kwargs):
+        """
+        :param size: (int) bytes to upload and download
+
+        :param objects: (int) objects in the container to list, and files
+            to upload in parallel (size bytes in total)
+
+        :param servers: (int) servers to create in a cluster
+
+        :param threads: (int) max concurrent operations (MAX_THREADS)
+
+        :param server_kwargs: StandInServer arguments, e.g., block_size,
+            latency, bandwidth, error_rate
+        """
+        self.size, self.objects, self.servers = size, objects, servers
+        self.threads = threads
+        self.server_kwargs = server_kwargs
+        self.process, self.aggregator = None, RequestAggregator()
+
+    def start(self):
+        """Start the stand-in server and set up the clients"""
+        parent, child = Pipe()
+        self.process = Process(target=_serve, args=(child, self.server_kwargs))
+        self.process.daemon = True
+        self.process.start()
+        auth_url = parent.recv()
+        token = self.server_kwargs.get('token', DEFAULT_TOKEN)
+        astakos = CachedAstakosClient(auth_url, token)
+        account = astakos.authenticate()['access']['user']['id']
+        self.pithos = PithosClient(
+            astakos.get_endpoint_url(PithosClient.service_type), token,
+            account, self.container)
+        self.cyclades = CycladesComputeClient(
+            astakos.get_endpoint_url(CycladesComputeClient.service_type),
+            token)
+        for client in (self.pithos, self.cyclades):
+            client.MAX_THREADS = self.threads
+            client.request_hooks.append(self.aggregator)
+        self.pithos.create_container(self.container)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def _requests(self):
+        return sum([r['requests'] for r in self.aggregator.summary()])
+
+    def _measure(self, name, method, nbytes=0, items=0):
+        """Run method and measure wall time, CPU time and requests
+
+        :returns: (dict) name, seconds, cpu, bytes, requests, items,
+            mb_per_sec, requests_per_sec, items_per_sec, cpu_per_gb
+        """
+        requests, cpu = self._requests(), sum(os.times()[:2])
+        start = time()
+        method()
+        seconds = max(time() - start, 1e-6)
+        cpu = sum(os.times()[:2]) - cpu
+        requests = self._requests() - requests
+        return dict(
+            name=name, seconds=seconds, cpu=cpu,
+            bytes=nbytes, requests=requests, items=items,
+            mb_per_sec=nbytes / seconds / MB if nbytes else None,
+            requests_per_sec=requests / seconds,
+            items_per_sec=items / seconds if items else None,
+            cpu_per_gb=cpu * 1024 * MB / nbytes if nbytes else None)
+
+    def _source(self):
+        src = getattr(self, '_src', None)
+        if src is None:
+            src = self._src = NamedTemporaryFile(prefix='kamaki-bench-')
+            left = self.size
+            while left > 0:
+                chunk = os.urandom(min(left, 4 * MB))
+                src.write(chunk)
+                left -= len(chunk)
+            src.flush()
+        return src
+
+    def upload(self):
+        src = self._source()
+
+        def upload():
+            with open(src.name, 'rb') as f:
+                self.pithos.upload_object('upload', f)
+        return self._measure('upload', upload, nbytes=self.size)
+
+    def download(self):
+        with open(self._source().name, 'rb') as f:
+            self.pithos.upload_object('download', f)
+
+        def download():
+            with NamedTemporaryFile(prefix='kamaki-bench-') as f:
+                self.pithos.download_object('download', f)
+        return self._measure('download', download, nbytes=self.size)
+
+    def files(self):
+        sources = getattr(self, '_files', None)
+        if sources is None:
+            fsize = max(1, self.size // self.objects)
+            sources = self._files = []
+            for i in range(self.objects):
+                src = NamedTemporaryFile(prefix='kamaki-bench-')
+                src.write(os.urandom(fsize))
+                src.flush()
+                sources.append(src)
+
+        def files():
+            uploads = (('files/%s' % i, open(src.name, 'rb')) for (
+                i, src) in enumerate(sources))
+            for future in self.pithos.upload_objects(uploads):
+                future.args[1].close()
+                if future.exception:
+                    raise future.exception
+        nbytes = sum([os.fstat(src.fileno()).st_size for src in sources])
+        return self._measure(
+            'files', files, nbytes=nbytes, items=len(sources))
+
+    def listing(self, rounds=10):
+        for i in range(self.objects):
+            self.pithos.object_put(
+                'listing/%s' % i, data='%s' % i, content_type='text/plain')
+
+        def listing():
+            for i in range(rounds):
+                self.pithos.list_objects(prefix='listing/')
+        return self._measure('listing', listing, items=self.objects * rounds)
+
+    def cluster(self):
+        image_id = IMAGES[0]['id']
+
+        def cluster():
+            servers = [dict(
+                name='bench-%s' % i, flavor_id=1, image_id=image_id) for (
+                i) in range(self.servers)]
+            self.cyclades.async_run(self.cyclades.create_server, servers)
+        return self._measure('cluster', cluster, items=self.servers)
+
+    def run(self, names=BENCHMARKS):
+        """:returns: (list of dicts) the results of the named benchmarks"""
+        return [getattr(self, name)() for name in names]
+
+
+def print_results(results, out=stdout):
+    out.write('%-10s %8s %9s %9s %9s %9s\n' % (
+        'benchmark', 'secs', 'MB/s', 'req/s', 'items/s', 'CPU s/GB'))
+    for r in results:
+        out.write('%-10s %8.3f %9s %9.1f %9s %9s\n' % (
+            r['name'], r['seconds'],
+            '-' if r['mb_per_sec'] is None else '%.2f' % r['mb_per_sec'],
+            r['requests_per_sec'],
+            '-' if r['items_per_sec'] is None else '%.1f' % (
+                r['items_per_sec']),
+            '-' if r['cpu_per_gb'] is None else '%.2f' % r['cpu_per_gb']))
+
+
+def main(argv):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(
+        description='Benchmark kamaki against a local Synnefo stand-in')
+    parser.add_argument(
+        'benchmarks', nargs='*', metavar='BENCHMARK',
+        help='any of %s (default: all)' % ', '.join(BENCHMARKS))
+    parser.add_argument(
+        '--size', type=int, default=64, help='MB to transfer (default: 64)')
+    parser.add_argument(
+        '--block-size', type=int, default=BLOCK_SIZE // 1024,
+        help='KB per Pithos block (default: %s)' % (BLOCK_SIZE // 1024))
+    parser.add_argument('--objects', type=int, default=200)
+    parser.add_argument('--servers', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument(
+        '--latency', type=float, default=0.0, help='seconds per response')
+    parser.add_argument('--bandwidth', type=float, default=None, help='MB/s')
+    parser.add_argument(
+        '--error-rate', type=float, default=0.0,
+        help='ratio of responses replaced by errors, e.g., 0.01')
+    parser.add_argument(
+        '--json', action='store_true', help='print results in JSON')
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %s' % name)
+    bench = Benchmark(
+        size=args.size * MB, objects=args.objects, servers=args.servers,
+        threads=args.threads,
+        block_size=args.block_size * 1024, latency=args.latency,
+        bandwidth=args.bandwidth * MB if args.bandwidth else None,
+        error_rate=args.error_rate)
+    bench.start()
+    try:
+        results = bench.run(args.benchmarks or BENCHMARKS)
+    finally:
+        bench.stop()
+    if args.json:
+        stdout.write(dumps(results, indent=2) + '\n')
+    else:
+        print_results(results)
+
+
+if __name__ == '__main__':
+    from sys import argv
+    main(argv[1:])
@@ -0,0 +1,775 @@
+# Copyright 2013-2014 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+"""A local stand-in for a Synnefo deployment, for offline benchmarks
+
+It implements enough of Astakos (tokens, user catalogs), Pithos (accounts,
+containers, block POST, hashmap PUT/GET with missing hash lists, ranged GETs,
+listings) and Cyclades (servers, flavors, images) to run kamaki unchanged.
+Everything is kept in memory. Latency, bandwidth and errors can be injected.
+
+Run it stand-alone and point kamaki to it:
+    $ python -m kamaki.clients.benchmark.server --port 8080
+    $ kamaki config set cloud.local.url http://127.0.0.1:8080/identity/v2.0
+    $ kamaki config set cloud.local.token <the printed token>
+"""
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+from urllib import unquote
+from threading import Thread, Lock
+from hashlib import new as newhashlib
+from email.utils import formatdate
+from json import dumps, loads
+from random import random
+from time import time, sleep
+from uuid import uuid4
+import socket
+
+
+DEFAULT_TOKEN = 'st4nd-1n-t0k3n'
+DEFAULT_UUID = 'a1b2c3d4-0000-4000-8000-standin00001'
+DEFAULT_USER = 'user@example.com'
+BLOCK_SIZE = 4 * 1024 * 1024
+BLOCK_HASH = 'sha256'
+
+FLAVORS = [
+    dict(id=i, name='C%sR%sD20' % (i, 1024 * i), ram=1024 * i, vcpus=i,
+         disk=20, links=[]) for i in range(1, 5)]
+IMAGES = [dict(
+    id='standin-image-debian', name='Debian', status='ACTIVE', progress=100,
+    metadata=dict(os='debian', users='root'), links=[])]
+
+
+class Link(object):
+    """A shared link of limited bandwidth, i.e., a token bucket which delays
+    data so that the aggregate rate does not exceed bandwidth bytes/sec"""
+
+    def __init__(self, bandwidth=None):
+        self.bandwidth, self._next, self._lock = bandwidth, 0.0, Lock()
+
+    def consume(self, nbytes):
+        if not self.bandwidth:
+            return
+        with self._lock:
+            now = time()
+            start = max(now, self._next)
+            self._next = start + float(nbytes) / self.bandwidth
+            wait = self._next - now
+        sleep(wait)
+
+
+class Store(object):
+    """In-memory Pithos data: content-addressed blocks, containers and
+    objects (as hashmaps)"""
+
+    def __init__(self, block_size=BLOCK_SIZE, block_hash=BLOCK_HASH):
+        self.block_size, self.block_hash = block_size, block_hash
+        self.blocks, self.containers, self.objects = dict(), dict(), dict()
+        self.lock = Lock()
+
+    def hash_block(self, block):
+        h = newhashlib(self.block_hash)
+        h.update(block.rstrip('\x00'))
+        return h.hexdigest()
+
+    def put_blocks(self, data):
+        """:returns: (list) the hashes of the blocks of data"""
+        hashes = []
+        for start in range(0, len(data), self.block_size) or [0]:
+            block = data[start:start + self.block_size]
+            h = self.hash_block(block)
+            with self.lock:
+                self.blocks[h] = block
+            hashes.append(h)
+        return hashes
+
+    def object_hash(self, hashes):
+        h = newhashlib(self.block_hash)
+        h.update(''.join(hashes))
+        return h.hexdigest()
+
+    def read(self, obj, start, end):
+        """:returns: (str) bytes start to end (inclusive) of an object"""
+        data, bs = [], self.block_size
+        for i in range(start // bs, end // bs + 1):
+            block = self.blocks[obj['hashes'][i]]
+            block += '\x00' * (min(bs, obj['bytes'] - i * bs) - len(block))
+            data.append(block[
+                max(start - i * bs, 0):min(end - i * bs + 1, bs)])
+        return ''.join(data)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Route requests to Astakos, Pithos or Cyclades handlers"""
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    CHUNK_SIZE = 64 * 1024
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def standin(self):
+        return self.server.standin
+
+    def _read_body(self):
+        length = int(self.headers.get('content-length') or 0)
+        chunks = []
+        while length > 0:
+            chunk = self.rfile.read(min(length, self.CHUNK_SIZE))
+            if not chunk:
+                break
+            self.standin.link.consume(len(chunk))
+            chunks.append(chunk)
+            length -= len(chunk)
+        return ''.join(chunks)
+
+    def _send(self, status, body='', headers=None, content_length=None):
+        self.send_response(status)
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = dumps(body)
+            headers.setdefault('Content-Type', 'application/json')
+        headers['Content-Length'] = '%s' % (
+            len(body) if content_length is None else content_length)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            for start in range(0, len(body), self.CHUNK_SIZE):
+                chunk = body[start:start + self.CHUNK_SIZE]
+                self.standin.link.consume(len(chunk))
+                self.wfile.write(chunk)
+
+    def _handle(self):
+        standin = self.standin
+        self.body = self._read_body()
+        standin.count_request()
+        if standin.latency:
+            sleep(standin.latency)
+        if standin.error_rate and random() < standin.error_rate:
+            return self._send(standin.error_status, headers={
+                'Retry-After': '0'})
+        parsed = urlparse(self.path)
+        self.params = dict([(k, v[0]) for k, v in parse_qs(
+            parsed.query, keep_blank_values=True).items()])
+        path = [unquote(p) for p in parsed.path.split('/')[1:]]
+        service, path = path[0], path[2:]
+        if service == 'identity':
+            return self._identity(path)
+        if self.headers.get('x-auth-token') != standin.token:
+            return self._send(401, dict(unauthorized=dict(
+                code=401, message='Invalid token')))
+        handler = {
+            'account': self._account,
+            'compute': self._compute,
+            'object-store': self._pithos}.get(service)
+        if handler is None:
+            return self._send(404)
+        return handler(path)
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = _handle
+    do_COPY = do_MOVE = _handle
+
+    #  Astakos
+
+    def _identity(self, path):
+        if path != ['tokens'] or self.command != 'POST':
+            return self._send(404)
+        token = self.headers.get('x-auth-token')
+        if self.body:
+            body = loads(self.body)
+            token = body.get('auth', {}).get('token', {}).get('id', token)
+        if token != self.standin.token:
+            return self._send(401, dict(unauthorized=dict(
+                code=401, message='Invalid token')))
+        return self._send(200, self.standin.access())
+
+    def _account(self, path):
+        if path == ['user_catalogs'] and self.command == 'POST':
+            uuids = loads(self.body or '{}').get('uuids') or []
+            catalog = dict([(u, DEFAULT_USER) for u in uuids if (
+                u == self.standin.uuid)])
+            return self._send(200, dict(
+                uuid_catalog=catalog,
+                displayname_catalog={DEFAULT_USER: self.standin.uuid}))
+        return self._send(404)
+
+    #  Pithos
+
+    def _pithos(self, path):
+        account = path[0] if path else ''
+        container = path[1] if len(path) > 1 else ''
+        obj = '/'.join(path[2:])
+        if not account:
+            return self._send(404)
+        if obj:
+            return getattr(self, '_object_%s' % self.command.lower())(
+                account, container, obj)
+        if container:
+            return getattr(self, '_container_%s' % self.command.lower())(
+                account, container)
+        return getattr(self, '_account_%s' % self.command.lower())(account)
+
+    def _list(self, names, info):
+        """Apply listing params (prefix, delimiter, marker, limit)"""
+        prefix = self.params.get('prefix', self.params.get('path', ''))
+        delimiter = self.params.get('delimiter')
+        marker, limit = self.params.get('marker'), int(
+            self.params.get('limit') or 10000)
+        result, subdirs = [], set()
+        for name in sorted(names):
+            if not name.startswith(prefix) or (marker and name <= marker):
+                continue
+            if delimiter:
+                i = name.find(delimiter, len(prefix))
+                if i >= 0:
+                    subdir = name[:i + len(delimiter)]
+                    if subdir not in subdirs:
+                        subdirs.add(subdir)
+                        result.append(dict(subdir=subdir))
+                    continue
+            result.append(info(name))
+            if len(result) >= limit:
+                break
+        if self.params.get('format') == 'json':
+            return self._send(200, result)
+        if not result:
+            return self._send(204)
+        body = '\n'.join([
+            r.get('name', r.get('subdir')) for r in result]) + '\n'
+        return self._send(
+            200, body, {'Content-Type': 'text/plain; charset=utf-8'})
+
+    def _container_stats(self, account, container):
+        store = self.standin.store
+        objects = [o for (a, c, n), o in store.objects.items() if (
+            a, c) == (account, container)]
+        return len(objects), sum([o['bytes'] for o in objects])
+
+    def _account_head(self, account):
+        store = self.standin.store
+        containers = [c for a, c in store.containers if a == account]
+        return self._send(204, headers={
+            'X-Account-Container-Count': len(containers),
+            'X-Account-Bytes-Used': sum([self._container_stats(
+                account, c)[1] for c in containers]),
+            'X-Account-Policy-Quota': 0})
+
+    def _account_get(self, account):
+        store = self.standin.store
+
+        def info(name):
+            count, size = self._container_stats(account, name)
+            return dict(
+                name=name, count=count, bytes=size,
+                last_modified=store.containers[(account, name)]['modified'],
+                x_container_policy=dict(quota='0', versioning='auto'))
+
+        return self._list(
+            [c for a, c in store.containers if a == account], info)
+
+    def _account_post(self, account):
+        return self._send(202)
+
+    def _container_headers(self, account, container):
+        store = self.standin.store
+        count, size = self._container_stats(account, container)
+        meta = store.containers[(account, container)]
+        headers = {
+            'X-Container-Block-Size': store.block_size,
+            'X-Container-Block-Hash': store.block_hash,
+            'X-Container-Object-Count': count,
+            'X-Container-Bytes-Used': size,
+            'X-Container-Policy-Quota': 0,
+            'X-Container-Policy-Versioning': 'auto',
+            'Last-Modified': meta['modified']}
+        for k, v in meta['meta'].items():
+            headers['X-Container-Meta-%s' % k] = v
+        return headers
+
+    def _missing_container(self, account, container):
+        if (account, container) not in self.standin.store.containers:
+            self._send(404, dict(itemNotFound=dict(
+                code=404, message='Container does not exist')))
+            return True
+        return False
+
+    def _meta(self, prefix):
+        prefix = prefix.lower()
+        return dict([(k[len(prefix):], v) for k, v in self.headers.items() if (
+            k.lower().startswith(prefix))])
+
+    def _container_put(self, account, container):
+        store = self.standin.store
+        with store.lock:
+            exists = (account, container) in store.containers
+            if not exists:
+                store.containers[(account, container)] = dict(
+                    modified=formatdate(usegmt=True), meta=dict())
+            store.containers[(account, container)]['meta'].update(
+                self._meta('x-container-meta-'))
+        return self._send(202 if exists else 201)
+
+    def _container_head(self, account, container):
+        if self._missing_container(account, container):
+            return
+        return self._send(204, headers=self._container_headers(
+            account, container))
+
+    def _container_get(self, account, container):
+        if self._missing_container(account, container):
+            return
+        objects = self.standin.store.objects
+
+        def info(name):
+            obj = objects[(account, container, name)]
+            return dict(
+                name=name, bytes=obj['bytes'], hash=obj['hash'],
+                content_type=obj['content_type'],
+                last_modified=obj['modified'], x_object_hash=obj['hash'],
+                x_object_version=obj['version'])
+
+        return self._list(
+            [n for a, c, n in objects if (a, c) == (account, container)],
+            info)
+
+    def _container_post(self, account, container):
+        if self._missing_container(account, container):
+            return
+        store = self.standin.store
+        if 'update' in self.params and self.body and (
+                self.headers.get('content-type') == (
+                    'application/octet-stream')):
+            hashes = store.put_blocks(self.body)
+            return self._send(202, hashes if (
+                self.params.get('format') == 'json') else '\n'.join(hashes))
+        store.containers[(account, container)]['meta'].update(
+            self._meta('x-container-meta-'))
+        return self._send(202)
+
+    def _container_delete(self, account, container):
+        if self._missing_container(account, container):
+            return
+        store = self.standin.store
+        with store.lock:
+            for key in [k for k in store.objects if k[:2] == (
+                    account, container)]:
+                store.objects.pop(key)
+            store.containers.pop((account, container))
+        return self._send(204)
+
+    def _object_headers(self, obj):
+        headers = {
+            'Content-Type': obj['content_type'],
+            'ETag': obj['hash'],
+            'X-Object-Hash': obj['hash'],
+            'X-Object-Version': obj['version'],
+            'X-Object-Version-Timestamp': obj['timestamp'],
+            'X-Object-Modified-By': self.standin.uuid,
+            'X-Object-UUID': obj['uuid'],
+            'Last-Modified': obj['modified']}
+        for k, v in obj['meta'].items():
+            headers['X-Object-Meta-%s' % k] = v
+        return headers
+
+    def _get_object(self, account, container, name):
+        obj = self.standin.store.objects.get((account, container, name))
+        if obj is None:
+            self._send(404, dict(itemNotFound=dict(
+                code=404, message='Object does not exist')))
+        return obj
+
+    def _save_object(self, account, container, name, hashes, size, **kw):
+        store = self.standin.store
+        now = time()
+        with store.lock:
+            old = store.objects.get((account, container, name), {})
+            obj = dict(
+                hashes=hashes, bytes=size, hash=store.object_hash(hashes),
+                content_type=kw.get('content_type') or old.get(
+                    'content_type', 'application/octet-stream'),
+                meta=kw.get('meta', old.get('meta', dict())),
+                version=old.get('version', 0) + 1, timestamp=now,
+                uuid=old.get('uuid', '%s' % uuid4()),
+                modified=formatdate(now, usegmt=True))
+            store.objects[(account, container, name)] = obj
+        return obj
+
+    def _object_put(self, account, container, name):
+        if self._missing_container(account, container):
+            return
+        store = self.standin.store
+        exists = (account, container, name) in store.objects
+        if self.headers.get('if-none-match') == '*' and exists:
+            return self._send(412)
+        content_type = self.headers.get('content-type')
+        source = self.headers.get('x-copy-from') or self.headers.get(
+            'x-move-from')
+        if source:
+            src = self._get_object(account, *(
+                source.lstrip('/').split('/', 1)))
+            if src is None:
+                return
+            obj = self._save_object(
+                account, container, name, src['hashes'], src['bytes'],
+                content_type=src['content_type'], meta=dict(src['meta']))
+            if self.headers.get('x-move-from'):
+                store.objects.pop(tuple([account] + source.lstrip(
+                    '/').split('/', 1)))
+            return self._send(201, headers=dict(ETag=obj['hash']))
+        if 'hashmap' in self.params:
+            hashmap = loads(self.body)
+            missing = [h for h in hashmap['hashes'] if h not in store.blocks]
+            if missing:
+                return self._send(409, missing)
+            size, hashes = hashmap['bytes'], hashmap['hashes']
+        else:
+            size, hashes = len(self.body), store.put_blocks(self.body)
+        obj = self._save_object(
+            account, container, name, hashes, size,
+            content_type=content_type, meta=self._meta('x-object-meta-'))
+        return self._send(201, headers={
+            'ETag': obj['hash'], 'X-Object-Version': obj['version']})
+
+    def _ranges(self, size):
+        """:returns: (list of (start, end)) from the Range header"""
+        header = self.headers.get('range')
+        if not header or not header.startswith('bytes='):
+            return None
+        ranges = []
+        for r in header[len('bytes='):].split(','):
+            start, sep, end = r.strip().partition('-')
+            if start:
+                start, end = int(start), min(int(end or size - 1), size - 1)
+            else:
+                start, end = max(size - int(end), 0), size - 1
+            if start <= end:
+                ranges.append((start, end))
+        return ranges
+
+    def _object_get(self, account, container, name):
+        obj = self._get_object(account, container, name)
+        if obj is None:
+            return
+        store, headers = self.standin.store, self._object_headers(obj)
+        if 'hashmap' in self.params:
+            return self._send(200, dict(
+                block_size=store.block_size, block_hash=store.block_hash,
+                bytes=obj['bytes'], hashes=obj['hashes']), headers)
+        size = obj['bytes']
+        ranges = self._ranges(size)
+        if ranges is None:
+            body = store.read(obj, 0, size - 1) if size else ''
+            return self._send(200, body, headers)
+        if not ranges:
+            return self._send(416, headers={
+                'Content-Range': 'bytes */%s' % size})
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers['Content-Range'] = 'bytes %s-%s/%s' % (start, end, size)
+            return self._send(206, store.read(obj, start, end), headers)
+        boundary = uuid4().hex
+        parts = []
+        for start, end in ranges:
+            parts.append('--%s\r\nContent-Type: %s\r\n' % (
+                boundary, obj['content_type']))
+            parts.append('Content-Range: bytes %s-%s/%s\r\n\r\n' % (
+                start, end, size))
+            parts.append(store.read(obj, start, end))
+            parts.append('\r\n')
+        parts.append('--%s--\r\n' % boundary)
+        headers['Content-Type'] = 'multipart/byteranges; boundary=%s' % (
+            boundary)
+        return self._send(206, ''.join(parts), headers)
+
+    def _object_head(self, account, container, name):
+        obj = self._get_object(account, container, name)
+        if obj is None:
+            return
+        return self._send(
+            200, headers=self._object_headers(obj),
+            content_length=obj['bytes'])
+
+    def _object_post(self, account, container, name):
+        obj = self._get_object(account, container, name)
+        if obj is None:
+            return
+        store = self.standin.store
+        meta = dict(obj['meta'])
+        meta.update(self._meta('x-object-meta-'))
+        content_range = self.headers.get('content-range')
+        if content_range and self.body:
+            #  Only appending is supported (Content-Range: bytes */*)
+            data = store.read(obj, 0, obj['bytes'] - 1) if obj['bytes'] else ''
+            data += self.body
+            obj = self._save_object(
+                account, container, name, store.put_blocks(data), len(data),
+                meta=meta)
+        else:
+            obj['meta'] = meta
+        return self._send(204, headers={'ETag': obj['hash']})
+
+    def _object_delete(self, account, container, name):
+        if self._get_object(account, container, name) is None:
+            return
+        with self.standin.store.lock:
+            self.standin.store.objects.pop((account, container, name), None)
+        return self._send(204)
+
+    def _object_copy(self, account, container, name):
+        return self._send(501)
+
+    _object_move = _container_copy = _container_move = _object_copy
+    _account_put = _account_delete = _account_copy = _object_copy
+    _account_move = _object_copy
+
+    #  Cyclades
+
+    def _compute(self, path):
+        path = [p for p in path if p]
+        if not path:
+            return self._send(404)
+        kind, rest = path[0], path[1:]
+        if kind == 'flavors':
+            return self._catalog('flavor', FLAVORS, rest)
+        if kind == 'images':
+            return self._catalog('image', IMAGES, rest)
+        if kind == 'servers':
+            return self._servers(rest)
+        return self._send(404)
+
+    def _catalog(self, kind, items, rest):
+        if not rest or rest == ['detail']:
+            body = dumps({'%ss' % kind: items})
+            etag = '"%s"' % newhashlib('md5', body).hexdigest()
+            if self.headers.get('if-none-match') == etag:
+                return self._send(304, headers={'ETag': etag})
+            return self._send(200, body, {
+                'Content-Type': 'application/json', 'ETag': etag})
+        for item in items:
+            if '%s' % item['id'] == rest[0]:
+                return self._send(200, {kind: item})
+        return self._send(404, dict(itemNotFound=dict(
+            code=404, message='%s not found' % kind)))
+
+    def _servers(self, rest):
+        standin = self.standin
+        if not rest and self.command == 'POST':
+            req = loads(self.body)['server']
+            server = standin.create_server(req)
+            return self._send(
+                202, dict(server=dict(server, adminPass='st4nd1n')),
+                {'Location': '%s/compute/v2.0/servers/%s' % (
+                    standin.url, server['id'])})
+        if not rest or rest == ['detail']:
+            servers = [standin.server_status(s) for s in sorted(
+                standin.servers.values(), key=lambda s: s['id'])]
+            if not rest:
+                servers = [dict(id=s['id'], name=s['name'], links=[]) for (
+                    s) in servers]
+            return self._send(200, dict(servers=servers))
+        server = standin.servers.get(rest[0])
+        if server is None:
+            return self._send(404, dict(itemNotFound=dict(
+                code=404, message='Server not found')))
+        if self.command == 'DELETE':
+            standin.servers.pop(rest[0], None)
+            return self._send(204)
+        if rest[1:] == ['action']:
+            return self._send(202)
+        return self._send(200, dict(server=standin.server_status(server)))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class StandInServer(object):
+    """A local HTTP server which plays Astakos, Pithos and Cyclades
+
+    e.g.,
+        server = StandInServer(block_size=1024 * 1024, latency=0.01)
+        server.start()
+        astakos = CachedAstakosClient(server.auth_url, server.token)
+        ...
+        server.stop()
+    """
+
+    def __init__(
+            self, host='127.0.0.1', port=0,
+            block_size=BLOCK_SIZE, latency=0.0, bandwidth=None,
+            error_rate=0.0, error_status=503, build_time=0.0,
+            token=DEFAULT_TOKEN, uuid=DEFAULT_UUID):
+        """
+        :param host: (str) the address to bind to
+
+        :param port: (int) the port to bind to, 0 for a free one
+
+        :param block_size: (int) Pithos block size in bytes
+
+        :param latency: (float) seconds to delay each response
+
+        :param bandwidth: (int) max bytes/sec for all data sent and received
+
+        :param error_rate: (float) ratio of requests which fail with
+            error_status, e.g., 0.01 for 1%
+
+        :param error_status: (int) the status of injected errors
+
+        :param build_time: (float) seconds until new servers are ACTIVE
+
+        :param token: (str) the only valid token
+
+        :param uuid: (str) the uuid of the user (and Pithos account)
+        """
+        self.httpd = _ThreadingHTTPServer((host, port), StandInHandler)
+        self.httpd.standin = self
+        self.store = Store(block_size)
+        self.link = Link(bandwidth)
+        self.latency, self.build_time = latency, build_time
+        self.error_rate, self.error_status = error_rate, error_status
+        self.token, self.uuid = token, uuid
+        self.servers, self.requests = dict(), 0
+        self._lock, self._thread = Lock(), None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    @property
+    def auth_url(self):
+        return '%s/identity/v2.0' % self.url
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def access(self):
+        """:returns: (dict) the Astakos response to a token request"""
+        url = self.url
+
+        def service(name, type_, version, path):
+            return dict(name=name, type=type_, endpoints=[dict(
+                versionId=version, publicURL='%s/%s' % (url, path),
+                region='default', **{'SNF:uiURL': '%s/ui' % url})])
+
+        return dict(access=dict(
+            token=dict(
+                id=self.token, expires='2100-01-01T00:00:00+00:00',
+                tenant=dict(id=self.uuid, name=DEFAULT_USER)),
+            user=dict(
+                id=self.uuid, name=DEFAULT_USER, roles=[], roles_links=[]),
+            serviceCatalog=[
+                service('astakos_account', 'account', 'v1.0', 'account/v1.0'),
+                service(
+                    'astakos_identity', 'identity', 'v2.0', 'identity/v2.0'),
+                service(
+                    'pithos_object-store', 'object-store', 'v1',
+                    'object-store/v1'),
+                service('cyclades_compute', 'compute', 'v2.0', 'compute/v2.0'),
+                service('cyclades_plankton', 'image', 'v1.0', 'image/v1.0'),
+            ]))
+
+    def create_server(self, req):
+        with self._lock:
+            server_id = '%s' % (len(self.servers) + 1)
+            server = dict(
+                id=server_id, name=req.get('name'),
+                flavor=dict(id=req.get('flavorRef')),
+                image=dict(id=req.get('imageRef')),
+                metadata=req.get('metadata', {}), user_id=self.uuid,
+                created=time(), status='BUILD', progress=0, links=[])
+            self.servers[server_id] = server
+        return server
+
+    def server_status(self, server):
+        if time() - server['created'] >= self.build_time:
+            server.update(status='ACTIVE', progress=100)
+        return dict([(k, v) for k, v in server.items() if k != 'created'])
+
+    def start(self):
+        """Serve in a background (daemon) thread"""
+        self._thread = Thread(target=self.httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main(argv):
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description='A local Synnefo stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+    parser.add_argument(
+        '--latency', type=float, default=0.0, help='seconds per response')
+    parser.add_argument(
+        '--bandwidth', type=float, default=None, help='bytes/sec')
+    parser.add_argument(
+        '--error-rate', type=float, default=0.0, help='e.g., 0.01 for 1%%')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--build-time', type=float, default=0.0)
+    parser.add_argument('--token', default=DEFAULT_TOKEN)
+    args = parser.parse_args(argv)
+    server = StandInServer(
+        args.host, args.port,
+        block_size=args.block_size, latency=args.latency,
+        bandwidth=args.bandwidth, error_rate=args.error_rate,
+        error_status=args.error_status, build_time=args.build_time,
+        token=args.token)
+    print 'Authentication URL: %s' % server.auth_url
+    print 'Token: %s' % server.token
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    from sys import argv
+    main(argv[1:])
@@ -0,0 +1,418 @@
+# Copyright 2013-2014 GRNET S.A. All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or
+# without modification, are permitted provided that the following
+# conditions are met:
+#
+#   1. Redistributions of source code must retain the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above
+#      copyright notice, this list of conditions and the following
+#      disclaimer in the documentation and/or other materials
+#      provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY GRNET S.A. ``AS IS'' AND ANY EXPRESS
+# OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL GRNET S.A OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF
+# USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED
+# AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and
+# documentation are those of the authors and should not be
+# interpreted as representing official policies, either expressed
+# or implied, of GRNET S.A.
+
+from unittest import TestCase
+from StringIO import StringIO
+from tempfile import NamedTemporaryFile
+from threading import Thread
+import os
+
+from kamaki.clients import (
+    ClientError, RequestAggregator, RetryPolicy)
+from kamaki.clients.astakos import CachedAstakosClient
+from kamaki.clients.pithos import PithosClient
+from kamaki.clients.cyclades import CycladesComputeClient
+from kamaki.clients import benchmark
+from kamaki.clients.benchmark import server
+
+block_size = 64 * 1024
+
+
+class StandInServer(TestCase):
+    """End-to-end: real kamaki clients against a local StandInServer"""
+
+    def setUp(self):
+        self.server = server.StandInServer(block_size=block_size).start()
+        self.astakos = CachedAstakosClient(
+            self.server.auth_url, self.server.token)
+        self.astakos.authenticate()
+        self.pithos = PithosClient(
+            self.astakos.get_endpoint_url(PithosClient.service_type),
+            self.server.token, self.server.uuid, 'c0nt41n3r')
+        self.pithos.create_container('c0nt41n3r')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_upload_download(self):
+        data = os.urandom(5 * block_size + 123)
+        with NamedTemporaryFile() as src:
+            src.write(data)
+            src.flush()
+            src.seek(0)
+            self.pithos.upload_object('obj', src)
+        info = self.pithos.get_object_info('obj')
+        self.assertEqual(int(info['content-length']), len(data))
+        with NamedTemporaryFile() as dst:
+            self.pithos.download_object('obj', dst)
+            dst.seek(0)
+            self.assertEqual(dst.read(), data)
+        self.assertEqual(
+            self.pithos.download_to_string('obj', range_str='10-20'),
+            data[10:21])
+
+    def test_upload_objects(self):
+        self.pithos.create_directories(['d', 'd/e'])
+        sources = []
+        for i in range(5):
+            src = NamedTemporaryFile()
+            src.write(os.urandom(i * block_size // 2 + 1))
+            src.flush()
+            src.seek(0)
+            sources.append(src)
+        done = list(self.pithos.upload_objects(
+            [('d/o%s' % i, src) for i, src in enumerate(sources)],
+            max_files=2))
+        self.assertEqual([f.exception for f in done], [False] * 5)
+        for i, src in enumerate(sources):
+            src.seek(0)
+            self.assertEqual(
+                self.pithos.download_to_string('d/o%s' % i), src.read())
+        info = self.pithos.get_object_info('d/e')
+        self.assertEqual(info['content-type'], 'application/directory')
+
+    def test_upload_objects_prewarm(self):
+        #  a new netloc, for a new connection pool of 8
+        pithos = PithosClient(
+            self.pithos.endpoint_url.replace('127.0.0.1', 'localhost'),
+            self.server.token, self.server.uuid, 'c0nt41n3r')
+        pithos.poolsize = pithos.POOL_PREWARM = pithos.MAX_THREADS = 8
+        pithos.SMALL_OBJECT_SIZE = 0
+        sources = []
+        for i in range(16):
+            src = NamedTemporaryFile()
+            src.write(os.urandom(3 * block_size))
+            src.flush()
+            sources.append(src)
+        done = []
+        upload = Thread(target=lambda: done.extend(pithos.upload_objects(
+            [('o%s' % i, src) for i, src in enumerate(sources)],
+            max_files=8)))
+        upload.daemon = True
+        upload.start()
+        upload.join(60)
+        self.assertFalse(upload.is_alive())
+        self.assertEqual([f.exception for f in done], [False] * 16)
+        self.assertTrue(pithos.connection_stats()['opened'] <= 8)
+
+    def test_upload_objects_once(self):
+        self.pithos.SMALL_OBJECT_SIZE = 0
+        self.pithos.BATCH_SIZE = block_size
+        data, sources = os.urandom(10 * block_size), []
+        for i in range(4):
+            src = NamedTemporaryFile()
+            src.write(data + str(i))
+            src.flush()
+            sources.append(src)
+        start = self.server.requests
+        done = list(self.pithos.upload_objects(
+            [('o%s' % i, src) for i, src in enumerate(sources)],
+            max_files=4))
+        self.assertEqual([f.exception for f in done], [False] * 4)
+        #  10 shared blocks, 4 tails, 2 hashmap PUTs and 1 HEAD per file
+        self.assertTrue(self.server.requests - start <= 10 + 4 + 4 * 3)
+        for i in range(4):
+            with NamedTemporaryFile() as dst:
+                self.pithos.download_object('o%s' % i, dst)
+                dst.seek(0)
+                self.assertEqual(dst.read(), data + str(i))
+
+    def test_upload_batches(self):
+        self.pithos.SMALL_OBJECT_SIZE = 0
+        requests = []
+        for name, batch_size in (('single', block_size), (
+                'batched', 4 * block_size)):
+            self.pithos.BATCH_SIZE = batch_size
+            data = os.urandom(10 * block_size + 123)
+            start = self.server.requests
+            with NamedTemporaryFile() as src:
+                src.write(data)
+                src.flush()
+                self.pithos.upload_object(name, src)
+            requests.append(self.server.requests - start)
+            self.assertEqual(self.pithos.download_to_string(name), data)
+        #  11 blocks: one POST per block vs 3 POSTs of 4, 4 and 3 blocks
+        self.assertEqual(requests[0] - requests[1], 8)
+
+    def test_upload_sparse_file(self):
+        self.pithos.SMALL_OBJECT_SIZE = 0
+        self.pithos.BATCH_SIZE = block_size
+        data = os.urandom(block_size + 7)
+        with NamedTemporaryFile() as src:
+            src.seek(3 * block_size)
+            src.write(data)
+            src.truncate(10 * block_size)
+            src.flush()
+            start = self.server.requests
+            self.pithos.upload_object('sparse', src)
+        #  container info, hashmap, 3 blocks (zero block once) and hashmap
+        self.assertEqual(self.server.requests - start, 6)
+        with NamedTemporaryFile() as dst:
+            self.pithos.download_object('sparse', dst)
+            dst.seek(0)
+            self.assertEqual(dst.read(), '\x00' * 3 * block_size + data + (
+                '\x00' * (6 * block_size - 7)))
+
+    def test_download_to_pipe(self):
+        from threading import Thread
+        self.pithos.SMALL_OBJECT_SIZE = 0
+        data = os.urandom(20 * block_size + 5)
+        with NamedTemporaryFile() as src:
+            src.write(data)
+            src.flush()
+            self.pithos.upload_object('obj', src)
+        read_fd, write_fd = os.pipe()
+        received = []
+        reader = Thread(target=lambda: received.append(
+            os.fdopen(read_fd, 'rb').read()))
+        reader.start()
+        self.pithos.STREAM_WINDOW = 3 * block_size
+        with os.fdopen(write_fd, 'wb') as dst:
+            self.pithos.download_object('obj', dst)
+        reader.join()
+        self.assertEqual(received, [data])
+
+    def test_iter_object_blocks(self):
+        self.pithos.SMALL_OBJECT_SIZE = 0
+        block = os.urandom(block_size)
+        data = block + os.urandom(3 * block_size) + block + '123'
+        with NamedTemporaryFile() as src:
+            src.write(data)
+            src.flush()
+            self.pithos.upload_object('obj', src)
+        chunks = list(self.pithos.iter_object_blocks(
+            'obj', window=2 * block_size, chunk_size=1000))
+        self.assertEqual(max(len(c) for c in chunks), 1000)
+        self.assertEqual(''.join(chunks), data)
+        self.assertEqual(self.pithos.download_to_string('obj'), data)
+        self.assertEqual(
+            self.pithos.download_to_string('obj', range_str='-3'), '123')
+
+    def test_download_ranges(self):
+        self.pithos.SMALL_OBJECT_SIZE = 0
+        block = os.urandom(block_size)
+        data = os.urandom(8 * block_size) + block + block + '123'
+        with NamedTemporaryFile() as src:
+            src.write(data)
+            src.flush()
+            self.pithos.upload_object('obj', src)
+        requests = []
+        for range_size in (block_size, 4 * block_size):
+            self.pithos.RANGE_SIZE = range_size
+            start = self.server.requests
+            with NamedTemporaryFile() as dst:
+                self.pithos.download_object('obj', dst)
+                dst.seek(0)
+                self.assertEqual(dst.read(), data)
+            self.assertEqual(self.pithos.download_to_string('obj'), data)
+            requests.append(self.server.requests - start)
+        #  file: 10 unique blocks in requests of 4, 4 and 2 (block 9 is
+        #  written from block 8), string: 11 blocks in ranges of 4, 4 and 3
+        self.assertEqual(requests[0] - requests[1], (10 - 3) + (11 - 3))
+
+    def test_download_scattered_ranges(self):
+        self.pithos.SMALL_OBJECT_SIZE = 0
+        data = os.urandom(8 * block_size)
+        self.pithos.upload_from_string('obj', data)
+        crange = '5-9,%s-%s,100-200,-3' % (3 * block_size, 3 * block_size + 9)
+        expected = data[5:10] + data[100:201] + data[
+            3 * block_size:3 * block_size + 10] + data[-3:]
+        start = self.server.requests
+        self.assertEqual(
+            ''.join(self.pithos.iter_object_blocks('obj', range_str=crange)),
+            expected)
+        #  one request for the hashmap and one for all the ranges
+        self.assertEqual(self.server.requests - start, 2)
+        self.pithos.MAX_RANGES = 2
+        self.assertEqual(
+            self.pithos.download_to_string('obj', range_str=crange), expected)
+
+        with NamedTemporaryFile() as dst:
+            damaged = bytearray(data)
+            for i in (1, 3, 6):
+                damaged[i * block_size] ^= 1
+            dst.write(damaged)
+            dst.flush()
+            self.pithos.MAX_RANGES = 128
+            start = self.server.requests
+            self.pithos.download_object('obj', dst, resume=True)
+            dst.seek(0)
+            self.assertEqual(dst.read(), data)
+        #  the three damaged blocks are fetched again in one request
+        self.assertEqual(self.server.requests - start, 2)
+
+    def test_upload_small_object(self):
+        cache = dict()
+        with NamedTemporaryFile() as src:
+            src.write('2KB' * 700)
+            src.flush()
+            #  the container info (block size) and the object
+            src.seek(0)
+            requests = self.server.requests
+            self.pithos.upload_object(
+                'small', src, content_type='text/x',
+                container_info_cache=cache)
+            self.assertEqual(self.server.requests - requests, 2)
+            src.seek(0)
+            requests = self.server.requests
+            self.pithos.upload_object(
+                'small', src, content_type='text/x',
+                container_info_cache=cache)
+            self.assertEqual(self.server.requests - requests, 1)
+        self.assertEqual(self.pithos.download_to_string('small'), '2KB' * 700)
+        info = self.pithos.get_object_info('small')
+        self.assertEqual(info['content-type'], 'text/x')
+
+    def test_list_objects(self):
+        for i in range(5):
+            self.pithos.upload_from_string('o%s' % i, 'data %s' % i)
+        self.assertEqual(
+            sorted([o['name'] for o in self.pithos.list_objects()]),
+            ['o%s' % i for i in range(5)])
+        r = self.pithos.get_container_info()
+        self.assertEqual(r['x-container-object-count'], '5')
+
+    def test_create_servers(self):
+        cyclades = CycladesComputeClient(
+            self.astakos.get_endpoint_url(
+                CycladesComputeClient.service_type),
+            self.server.token)
+        image_id = server.IMAGES[0]['id']
+        servers = [dict(
+            name='vm%s' % i, flavor_id=1, image_id=image_id) for (
+            i) in range(3)]
+        servers = cyclades.async_run(cyclades.create_server, servers)
+        self.assertEqual(
+            sorted([s['name'] for s in servers]), ['vm0', 'vm1', 'vm2'])
+        self.assertEqual(len(cyclades.list_servers()), 3)
+
+    def test_response_cache(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from kamaki.clients import ResponseCache
+        cyclades = CycladesComputeClient(
+            self.astakos.get_endpoint_url(
+                CycladesComputeClient.service_type),
+            self.server.token)
+        cache = cyclades.response_cache = ResponseCache(mkdtemp())
+        try:
+            flavors = cyclades.list_flavors()
+            self.assertEqual(cyclades.list_flavors(), flavors)
+            self.assertEqual((cache.misses, cache.revalidated), (1, 1))
+            requests = self.server.requests
+            cache.ttl = 60
+            self.assertEqual(cyclades.list_flavors(), flavors)
+            self.assertEqual(cache.hits, 1)
+            self.assertEqual(self.server.requests, requests)
+            cyclades.list_flavors(detail=True)
+            self.assertEqual(cache.misses, 2)
+        finally:
+            rmtree(cache.path)
+
+    def test_error_injection(self):
+        aggregator = RequestAggregator()
+        self.pithos.request_hooks.append(aggregator)
+        self.server.error_rate = 1.0
+        self.assertRaises(ClientError, self.pithos.get_container_info)
+        self.server.error_rate = 0.3
+        self.pithos.retry_policy = RetryPolicy(retries=10, backoff=0.001)
+        for i in range(5):
+            self.pithos.upload_from_string('o%s' % i, 'data %s' % i)
+        self.assertEqual(len(self.pithos.list_objects()), 5)
+        retries = sum([r['retries'] for r in aggregator.summary()])
+        self.assertTrue(retries > 0)
+
+    def test_error_injection_backoff(self):
+        self.server.error_rate = 0.3
+        self.pithos.retry_policy = RetryPolicy(
+            retries=10, backoff=0.001, budget=100)
+        self.pithos.MAX_THREADS = 8
+        self.pithos.BATCH_SIZE = block_size
+        limit, overloaded = self.pithos._concurrency_limit(), []
+        update = limit.update
+
+        def spy(future, nbytes=None):
+            overloaded.append(future.overloaded)
+            update(future, nbytes)
+
+        limit.update = spy
+        with NamedTemporaryFile() as src:
+            src.write(os.urandom(32 * block_size))
+            src.flush()
+            src.seek(0)
+            self.pithos.upload_object('obj', src)
+        #  retried 503s are reported to the concurrency limit
+        self.assertTrue(any(overloaded))
+        self.assertFalse(limit.slow_start)
+
+
+class Benchmark(TestCase):
+
+    def test_run(self):
+        bench = benchmark.Benchmark(
+            size=3 * block_size, objects=3, servers=2, threads=2,
+            block_size=block_size)
+        bench.start()
+        try:
+            results = bench.run()
+        finally:
+            bench.stop()
+        self.assertEqual(
+            [r['name'] for r in results], list(benchmark.BENCHMARKS))
+        for r in results:
+            self.assertTrue(r['requests'] > 0)
+            self.assertTrue(r['seconds'] > 0)
+        upload, download = results[:2]
+        self.assertEqual(upload['bytes'], 3 * block_size)
+        self.assertTrue(upload['mb_per_sec'] > 0)
+        self.assertEqual(results[2]['items'], 3 * 10)
+        self.assertEqual(results[3]['items'], 2)
+        self.assertEqual(results[4]['items'], 3)
+        self.assertEqual(results[4]['bytes'], 3 * block_size)
+        out = StringIO()
+        benchmark.print_results(results, out)
+        self.assertEqual(len(out.getvalue().splitlines()), 6)
+
+
+if __name__ == '__main__':
+    from sys import argv
+    from kamaki.clients.test import runTestCase
+    not_found = True
+    if not argv[1:] or argv[1] == 'StandInServer':
+        not_found = False
+        runTestCase(StandInServer, 'StandIn Server', argv[2:])
+    if not argv[1:] or argv[1] == 'Benchmark':
+        not_found = False
+        runTestCase(Benchmark, 'Benchmark', argv[2:])
+    if not_found:
+        print('TestCase %s not found' % argv[1])
@@ -293,7 +293,7 @@ class ComputeClient(ComputeRestClient):
 
     def list_flavors(self, detail=False, response_headers=dict(
             previous=None, next=None)):
-        r = self.flavors_get(detail=bool(detail))
+        r = self.flavors_get(detail=bool(detail), cache=True)
         for k, v in response_headers.items():
             response_headers[k] = r.headers.get(k, v)
         return r.json['flavors']
@@ -304,7 +304,7 @@ class ComputeClient(ComputeRestClient):
 
     def list_images(self, detail=False, response_headers=dict(
             next=None, previous=None)):
-        r = self.images_get(detail=bool(detail))
+        r = self.images_get(detail=bool(detail), cache=True)
         for k, v in response_headers.items():
             response_headers[k] = r.headers.get(k, v)
         return r.json['images']
@@ -650,7 +650,8 @@ class ComputeClient(TestCase):
         FR.json = flavor_list
         for detail in ('', 'detail'):
             r = self.client.list_flavors(detail=bool(detail))
-            self.assertEqual(FG.mock_calls[-1], call(detail=bool(detail)))
+            self.assertEqual(
+                FG.mock_calls[-1], call(detail=bool(detail), cache=True))
             self.assertEqual(r, flavor_list['flavors'])
 
     @patch('%s.flavors_get' % compute_pkg, return_value=FR())
@@ -665,7 +666,8 @@ class ComputeClient(TestCase):
         FR.json = img_list
         for detail in ('', 'detail'):
             r = self.client.list_images(detail=detail)
-            self.assertEqual(IG.mock_calls[-1], call(detail=bool(detail)))
+            self.assertEqual(
+                IG.mock_calls[-1], call(detail=bool(detail), cache=True))
             expected = img_list['images']
             for i in range(len(r)):
                 self.assert_dicts_are_equal(expected[i], r[i])
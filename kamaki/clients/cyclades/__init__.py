@@ -206,7 +206,7 @@ class CycladesNetworkClient(NetworkClient):
 
     def list_networks(self, detail=None):
         path = path4url('networks', 'detail' if detail else '')
-        r = self.get(path, success=200)
+        r = self.get(path, success=200, cache=True)
         return r.json['networks']
 
     def create_network(self, type, name=None, shared=None, project_id=None):
@@ -132,7 +132,8 @@ class CycladesNetworkClient(TestCase):
         for detail in (True, None):
             self.assertEqual(self.client.list_networks(detail), 'ret val')
             path = '/networks/detail' if detail else '/networks'
-            self.assertEqual(get.mock_calls[-1], call(path, success=200))
+            self.assertEqual(
+                get.mock_calls[-1], call(path, success=200, cache=True))
 
     @patch(
         'kamaki.clients.network.rest_api.NetworkRestClient.networks_post',
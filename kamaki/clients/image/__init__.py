@@ -91,7 +91,8 @@ class ImageClient(Client):
         if order:
             async_params['sort_key'] = order
 
-        r = self.get(path, async_params=async_params, success=200)
+        r = self.get(
+            path, async_params=async_params, success=200, cache=True)
         return r.json
 
     def get_meta(self, image_id):
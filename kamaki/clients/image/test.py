@@ -180,7 +180,7 @@ class ImageClient(TestCase):
             filters['sort_dir'] = 'desc' if order.startswith('-') else 'asc'
             self.assertEqual(get.mock_calls[-1], call(
                 '/images/%s' % ('detail' if detail else ''),
-                async_params=filters, success=200))
+                async_params=filters, success=200, cache=True))
             for i in range(len(r)):
                 self.assert_dicts_are_equal(r[i], example_images[i])
 
@@ -39,7 +39,7 @@ class NetworkClient(NetworkRestClient, Waiter):
     """OpenStack Network API 2.0 client"""
 
     def list_networks(self):
-        r = self.networks_get(success=200)
+        r = self.networks_get(success=200, cache=True)
         return r.json['networks']
 
     def create_network(self, name, admin_state_up=None, shared=None):
@@ -232,7 +232,7 @@ class NetworkClient(TestCase):
     def test_list_networks(self, networks_get):
         FakeObject.json = dict(networks='ret val')
         self.assertEqual(self.client.list_networks(), 'ret val')
-        networks_get.assert_called_once_with(success=200)
+        networks_get.assert_called_once_with(success=200, cache=True)
 
     @patch(
         'kamaki.clients.network.NetworkClient.networks_post',
@@ -31,27 +31,111 @@
 # interpreted as representing official policies, either expressed
 # or implied, of GRNET S.A.
 
-from threading import enumerate as activethreads
-
-from os import fstat
-from hashlib import new as newhashlib
-from time import time
+from threading import Lock, Event
+
+from os import fstat, stat, makedirs, remove, rename, getpid
+from os.path import (
+    abspath as path_abspath, dirname as path_dirname, join as path_join,
+    expanduser as path_expanduser, isdir as path_isdir)
+from stat import S_ISREG
+from hashlib import new as newhashlib, sha256
+from json import dumps, loads
+import sqlite3
+from time import time, sleep
 from StringIO import StringIO
+from collections import deque, OrderedDict
+from functools import partial
+from copy import copy
+from multiprocessing import cpu_count
 
 from binascii import hexlify
 
-from kamaki.clients import SilentEvent, sendlog
+from kamaki.clients import (
+    Future, WorkerPool, log, sendlog, retry_budget, get_worker_pool)
 from kamaki.clients.pithos.rest_api import PithosRestClient
 from kamaki.clients.storage import ClientError
-from kamaki.clients.utils import path4url, filter_in, readall
+from kamaki.clients.utils import (
+    path4url, filter_in, readall, BlockReader, data_extents, pwrite,
+    preallocate, content_range, iter_byteranges)
+
+
+def _unpadded_size(block, chunk=4096):
+    """:returns: (int) the size of block without its trailing zeros, which
+        are stripped in chunks, so that block is not copied"""
+    end = len(block)
+    while end > 0:
+        start = max(0, end - chunk)
+        tail = block[start:end].rstrip('\x00')
+        if tail:
+            return start + len(tail)
+        end = start
+    return 0
 
 
 def _pithos_hash(block, blockhash):
+    """:param block: (str or buffer)"""
     h = newhashlib(blockhash)
-    h.update(block.rstrip('\x00'))
+    h.update(buffer(block, 0, _unpadded_size(block)))
     return h.hexdigest()
 
 
+def _unique(hashes):
+    """:returns: (list) hashes without repetitions, in order"""
+    return list(OrderedDict.fromkeys(hashes))
+
+
+def _is_seekable(f):
+    """:returns: (bool) False for streams, like pipes and terminals"""
+    try:
+        f.tell()
+        return not f.isatty()
+    except (AttributeError, ValueError, EnvironmentError):
+        return False
+
+
+def _hash_threads():
+    try:
+        return min(cpu_count(), 16)
+    except NotImplementedError:
+        return 1
+
+
+def _data_size(future):
+    """:returns: (int) the size of the data sent by a Future"""
+    return len(future.kwargs['data'])
+
+
+def _batch_size(future):
+    """:returns: (int) the size of the blocks sent by a Future"""
+    return sum(len(data) for data in future.kwargs['data'])
+
+
+def _block_batches(hashes, block_of, blocksize, max_size):
+    """Group blocks for _put_blocks, up to max_size bytes per batch. A batch
+    ends at a partial block, since the server splits data at blocksize
+
+    :param hashes: (list of str) the hashes of the blocks, in order
+
+    :param block_of: (method(hash)) returns the data of a block
+
+    :returns: (generator of tuples) (hashes, data) lists per batch
+    """
+    batch, batch_data, batch_size = [], [], 0
+    for hash in hashes:
+        data = block_of(hash)
+        if batch and batch_size + len(data) > max_size:
+            yield batch, batch_data
+            batch, batch_data, batch_size = [], [], 0
+        batch.append(hash)
+        batch_data.append(data)
+        batch_size += len(data)
+        if len(data) < blocksize:
+            yield batch, batch_data
+            batch, batch_data, batch_size = [], [], 0
+    if batch:
+        yield batch, batch_data
+
+
 def _range_up(start, end, max_value, a_range):
     """
     :param start: (int) the window bottom
@@ -99,9 +183,362 @@ def _range_up(start, end, max_value, a_range):
     return ','.join(selected)
 
 
+def _parse_ranges(range_str):
+    """:param range_str: (str) ranges in the form x-y[,x'-y'[...]] (e.g., the
+        output of _range_up)
+
+    :returns: (list of tuples) (start, end) sorted, with overlapping and
+        adjacent ranges merged
+    """
+    ranges = []
+    for start, end in sorted(tuple(int(v) for v in r.split('-')) for (
+            r) in range_str.split(',')):
+        if ranges and start <= ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], max(end, ranges[-1][1]))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def _group_ranges(ranges, max_ranges, max_size):
+    """Group ranges for multi-range requests, splitting the larger ones
+
+    :param ranges: (list of tuples) (start, end) sorted ranges
+
+    :returns: (generator of lists) up to max_ranges ranges and (unless a
+        range is larger) up to max_size bytes per group
+    """
+    group, size = [], 0
+    for start, end in ranges:
+        for piece in xrange(start, end + 1, max_size):
+            piece_end = min(piece + max_size - 1, end)
+            piece_size = piece_end - piece + 1
+            if group and (
+                    len(group) >= max_ranges or size + piece_size > max_size):
+                yield group
+                group, size = [], 0
+            group.append((piece, piece_end))
+            size += piece_size
+    if group:
+        yield group
+
+
+def _clip_pieces(pieces, ranges):
+    """:param pieces: (iterable of tuples) (position, data)
+
+    :param ranges: (list of tuples) (start, end) sorted ranges
+
+    :returns: (generator of tuples) (position, data) of the parts of pieces
+        within ranges
+    """
+    for position, data in pieces:
+        for start, end in ranges:
+            start = max(start, position) - position
+            end = min(end + 1, position + len(data)) - position
+            if start < end:
+                yield position + start, data if (
+                    start == 0 and end == len(data)) else data[start:end]
+
+
+def _missing_ranges(received, ranges):
+    """:param received: (list of tuples) (position, size) of the data
+        received, without overlaps
+
+    :param ranges: (list of tuples) (start, end) requested ranges
+
+    :returns: (list of tuples) the ranges not fully received
+    """
+    missing = []
+    for start, end in ranges:
+        size = sum(max(0, min(end + 1, p + s) - max(start, p)) for (
+            p, s) in received)
+        if size < end - start + 1:
+            missing.append((start, end))
+    return missing
+
+
+def _response_ranges(r, ranges):
+    """:param r: the response of a ranged GET, in stream mode
+
+    :param ranges: (list of tuples) (start, end) the requested ranges. A 206
+        body without a Content-Range starts at the first one, a 200 body is
+        the whole object and only its parts within ranges are returned
+
+    :returns: (generator of tuples) (position, data) of the body, which is
+        parsed as it arrives if it is multipart/byteranges
+    """
+    ctype = r.headers.get('content-type', '')
+    if r.status_code == 206 and ctype.startswith('multipart/byteranges'):
+        boundary = ctype.partition('boundary=')[2].partition(';')[0]
+        try:
+            for position, data in iter_byteranges(
+                    r.iter_content(), str(boundary.strip('" '))):
+                yield position, data
+        except ValueError as ve:
+            raise ClientError('%s' % ve)
+        return
+    if r.status_code != 206:
+        start = 0
+        for chunk in r.iter_content():
+            for piece in _clip_pieces([(start, chunk)], ranges):
+                yield piece
+            start += len(chunk)
+        return
+    start = ranges[0][0]
+    if r.headers.get('content-range'):
+        start = content_range(r.headers['content-range'])[0]
+    for chunk in r.iter_content():
+        yield start, chunk
+        start += len(chunk)
+
+
+class BlockHashCache(object):
+    """An on-disk (SQLite) cache of the block hashes of local files
+
+    Entries are kept per file path, container block size and block hash
+    algorithm, along with the inode, size and modification time of the file.
+    An entry is used only while these still match, otherwise it is dropped.
+    Files modified less than RACY_TIME seconds before hashing are not cached,
+    since a change in the same mtime tick would go unnoticed.
+    The least recently used entries are evicted beyond max_entries.
+
+    e.g., client.hash_cache = BlockHashCache('~/.kamaki.hashes')
+    """
+
+    RACY_TIME = 2
+
+    def __init__(self, path, max_entries=10000):
+        """
+        :param path: (str) the SQLite database file, created if missing
+
+        :param max_entries: (int) the number of files to keep hashes for
+        """
+        self.path, self.max_entries = path_expanduser(path), max_entries
+        self.hits, self.misses = 0, 0
+        self._db, self._lock = None, Lock()
+
+    def _connect(self):
+        if self._db is None:
+            dirname = path_dirname(self.path)
+            if dirname and not path_isdir(dirname):
+                makedirs(dirname)
+            db = sqlite3.connect(
+                self.path, timeout=10, check_same_thread=False)
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS hashes ('
+                'path TEXT, blocksize INTEGER, blockhash TEXT, '
+                'inode INTEGER, size INTEGER, mtime REAL, '
+                'hashes TEXT, used REAL, '
+                'PRIMARY KEY (path, blocksize, blockhash))')
+            db.commit()
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def file_key(fileobj):
+        """:returns: (tuple) (path, inode, size, mtime) of an open regular
+            file, or None if fileobj is not a file opened by path
+        """
+        try:
+            st = fstat(fileobj.fileno())
+            path = path_abspath(fileobj.name)
+            if not S_ISREG(st.st_mode) or stat(path).st_ino != st.st_ino:
+                return None
+        except (AttributeError, TypeError, ValueError, EnvironmentError):
+            return None
+        return (path, st.st_ino, st.st_size, st.st_mtime)
+
+    def get(self, key, blocksize, blockhash):
+        """:returns: (list) the block hashes of the file with this key, or
+            None if they are not cached or the file has changed
+        """
+        path, inode, size, mtime = key
+        where = (path, blocksize, blockhash)
+        with self._lock:
+            try:
+                db = self._connect()
+                row = db.execute(
+                    'SELECT inode, size, mtime, hashes FROM hashes '
+                    'WHERE path=? AND blocksize=? AND blockhash=?',
+                    where).fetchone()
+                if row and tuple(row[:3]) == (inode, size, mtime):
+                    db.execute(
+                        'UPDATE hashes SET used=? '
+                        'WHERE path=? AND blocksize=? AND blockhash=?',
+                        (time(), ) + where)
+                    db.commit()
+                    self.hits += 1
+                    return loads(row[3])
+                if row:
+                    db.execute(
+                        'DELETE FROM hashes '
+                        'WHERE path=? AND blocksize=? AND blockhash=?',
+                        where)
+                    db.commit()
+            except (sqlite3.Error, EnvironmentError, ValueError) as e:
+                log.debug('Failed to read hash cache %s: %s' % (self.path, e))
+            self.misses += 1
+            return None
+
+    def set(self, key, blocksize, blockhash, hashes):
+        """Keep the block hashes of the file with this key
+
+        :returns: (bool) whether they were cached
+        """
+        path, inode, size, mtime = key
+        now = time()
+        if now - mtime < self.RACY_TIME:
+            return False
+        with self._lock:
+            try:
+                db = self._connect()
+                db.execute(
+                    'INSERT OR REPLACE INTO hashes '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (path, blocksize, blockhash, inode, size, mtime,
+                        dumps(hashes), now))
+                db.execute(
+                    'DELETE FROM hashes WHERE rowid IN ('
+                    'SELECT rowid FROM hashes ORDER BY used DESC '
+                    'LIMIT -1 OFFSET ?)', (self.max_entries, ))
+                db.commit()
+            except (sqlite3.Error, EnvironmentError) as e:
+                log.debug('Failed to write hash cache %s: %s' % (
+                    self.path, e))
+                return False
+        return True
+
+
+class UploadJournal(object):
+    """On-disk journals of uploads in progress, so that an interrupted upload
+    resumes without hashing the file again
+
+    A journal starts with the hashmap of the file, along with its inode, size
+    and modification time, and the container block size and hash algorithm.
+    The hash of each block is appended as soon as the block is uploaded.
+    A journal is used only while the file has not changed, and it is removed
+    when the upload completes.
+    Journals are kept in files named after a hash of the account, container
+    and object they upload to.
+
+    e.g., client.upload_journal = UploadJournal('~/.kamaki.journal')
+    """
+
+    def __init__(self, path):
+        """:param path: (str) the journal directory, created if missing"""
+        self.path = path_expanduser(path)
+
+    def _file(self, name):
+        name = name.encode('utf-8') if isinstance(name, unicode) else name
+        return path_join(self.path, sha256(name).hexdigest())
+
+    def load(self, name, key, blocksize, blockhash):
+        """:returns: (list, set) the hashes of the file and the hashes of the
+            uploaded blocks, or None if there is no journal for this file
+        """
+        filename = self._file(name)
+        try:
+            with open(filename) as f:
+                header = loads(f.readline())
+                acked = set([line.strip() for line in f if line.endswith(
+                    '\n')])
+        except (IOError, ValueError):
+            return None
+        if (header.get('name'), tuple(header.get('key', ())),
+                header.get('blocksize'), header.get('blockhash')) != (
+                name, tuple(key), blocksize, blockhash):
+            self.discard(name)
+            return None
+        return header['hashes'], acked
+
+    def start(self, name, key, blocksize, blockhash, hashes):
+        """Start a journal, with the hashmap of the file"""
+        filename = self._file(name)
+        tmp = '%s.%s' % (filename, getpid())
+        try:
+            if not path_isdir(self.path):
+                makedirs(self.path)
+            with open(tmp, 'w') as f:
+                f.write('%s\n' % dumps(dict(
+                    name=name, key=key, blocksize=blocksize,
+                    blockhash=blockhash, hashes=hashes)))
+            rename(tmp, filename)
+        except (IOError, OSError) as e:
+            log.debug('Failed to start upload journal %s: %s' % (name, e))
+
+    def ack(self, name, hash):
+        """Record that a block is uploaded"""
+        try:
+            with open(self._file(name), 'a') as f:
+                f.write('%s\n' % hash)
+        except IOError as e:
+            log.debug('Failed to write upload journal %s: %s' % (name, e))
+
+    def discard(self, name):
+        try:
+            remove(self._file(name))
+        except OSError:
+            pass
+
+
+class BlockRegistry(object):
+    """The blocks uploaded or in flight in an upload session, shared by the
+    uploads of its files, so that a block is uploaded once per session.
+    A block claimed by an upload is waited for by the other uploads, which
+    upload it themselves only if the claim fails
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.uploaded, self.pending = set(), dict()
+
+    def claim(self, hash):
+        """:returns: (Event) set when the block is uploaded or its upload
+            fails, or None if the caller must upload it and release it
+        """
+        with self.lock:
+            if hash in self.uploaded:
+                return _UPLOADED
+            if hash in self.pending:
+                return self.pending[hash]
+            self.pending[hash] = Event()
+
+    def release(self, hash, uploaded):
+        """Release a claimed block and wake up its waiters"""
+        with self.lock:
+            if uploaded:
+                self.uploaded.add(hash)
+            event = self.pending.pop(hash)
+        event.set()
+
+    def wait(self, hash, event):
+        """:returns: (bool) whether the block has been uploaded"""
+        while not event.wait(1):
+            pass
+        with self.lock:
+            return hash in self.uploaded
+
+
+_UPLOADED = Event()
+_UPLOADED.set()
+
+
 class PithosClient(PithosRestClient):
     """Synnefo Pithos+ API client"""
 
+    hash_cache = None
+    upload_journal = None
+    block_registry = None
+
+    HASH_THREADS = _hash_threads()
+    UPLOAD_BUFFER = 256 * 1024 * 1024
+    STREAM_WINDOW = 64 * 1024 * 1024
+    MAX_FILES = 8
+    BATCH_SIZE = 16 * 1024 * 1024
+    RANGE_SIZE = 32 * 1024 * 1024
+    MAX_RANGES = 128
+    SMALL_OBJECT_SIZE = 1024 * 1024
+
     def __init__(self, endpoint_url, token, account=None, container=None):
         super(PithosClient, self).__init__(
             endpoint_url, token, account, container)
@@ -243,20 +680,148 @@ class PithosClient(PithosRestClient):
         return r.headers
 
     # upload_* auxiliary methods
-    def _put_block_async(self, data, hash):
-        event = SilentEvent(method=self._put_block, data=data, hash=hash)
-        event.start()
-        return event
-
     def _put_block(self, data, hash):
         r = self.container_post(
             update=True,
             content_type='application/octet-stream',
             content_length=len(data),
             data=data,
-            format='json')
+            format='json',
+            idempotent=True)
         assert r.json[0] == hash, 'Local hash does not match server'
 
+    def _put_blocks(self, data, hashes):
+        """Upload consecutive blocks in one request. All blocks but the last
+        must be full, since the server splits the data at the block size
+
+        :param data: (list) the data of each block
+
+        :param hashes: (list of str) the hash of each block
+        """
+        if len(data) == 1:
+            return self._put_block(data=data[0], hash=hashes[0])
+        #  one copy of the blocks (str() and join would make two)
+        body = bytearray()
+        for block in data:
+            body += block
+        data = body
+        r = self.container_post(
+            update=True,
+            content_type='application/octet-stream',
+            content_length=len(data),
+            data=data,
+            format='json',
+            idempotent=True)
+        assert r.json == hashes, 'Local hashes do not match server'
+
+    def _clone(self):
+        """:returns: (PithosClient) a client for the same account and
+            container, with its own request headers and params, so that it
+            can run requests in another thread. It shares the concurrency
+            limit, caches, hooks and retry policy of this client
+        """
+        clone = copy(self)
+        clone.headers, clone.params = dict(), dict()
+        clone._concurrency = self._concurrency_limit()
+        return clone
+
+    def create_directories(self, paths):
+        """Create directory objects in parallel
+
+        :param paths: (iterable of str) remote directory paths
+
+        :raises ClientError: the first failure, if any
+        """
+        self._assert_container()
+        futures = (
+            Future(self._clone().create_directory, path) for path in paths)
+        for future in self._run_async(futures):
+            if future.exception:
+                raise future.exception
+
+    def upload_objects(self, uploads, max_files=None, **kwargs):
+        """Upload files in parallel, up to max_files at a time. The blocks of
+        all files share one concurrency limit (up to MAX_THREADS in flight)
+
+        :param uploads: (iterable of tuples) (obj, f) or (obj, f, kwargs),
+            consumed lazily, where kwargs override the common upload_object
+            arguments for this file
+
+        :param max_files: (int) files in flight (default: MAX_FILES)
+
+        :param kwargs: upload_object arguments for all files, except for
+            hash_cb and upload_cb
+
+        :returns: (generator of Future) upload_object runs in order of
+            completion, where future.args is (obj, f) and future.value is the
+            response headers, unless future.exception is set
+
+        Blocks shared by the files are uploaded once (see BlockRegistry).
+        Connections are pre-warmed once, for all files (see POOL_PREWARM)
+        """
+        self._assert_container()
+        kwargs.setdefault('container_info_cache', dict())
+        pool = WorkerPool(max_files or self.MAX_FILES)
+        registry = self.block_registry or BlockRegistry()
+        self._prewarm()
+
+        def upload_futures():
+            for upload in uploads:
+                obj, f = upload[:2]
+                upload_kwargs = dict(kwargs)
+                upload_kwargs.update(upload[2] if len(upload) > 2 else {})
+                client = self._clone()
+                client.block_registry = registry
+                client.POOL_PREWARM = 0
+                yield Future(client.upload_object, obj, f, **upload_kwargs)
+
+        try:
+            for future in pool.run(self._tracked(upload_futures())):
+                yield future
+        finally:
+            pool.shutdown()
+
+    def _put_stream_block(self, data, blockhash):
+        """Hash and upload a block
+
+        :returns: (str) the block hash
+        """
+        hash = _pithos_hash(data, blockhash)
+        self._put_block(data, hash)
+        return hash
+
+    def _upload_small_object(
+            self, obj, data,
+            hash_cb=None,
+            upload_cb=None,
+            etag=None,
+            if_etag_match=None,
+            if_not_exist=None,
+            content_encoding=None,
+            content_disposition=None,
+            content_type=None,
+            sharing=None,
+            public=None):
+        """Upload an object with its data in one request, instead of
+        negotiating a hashmap (HEAD, PUT, POST blocks, PUT)"""
+        for cb in (hash_cb, upload_cb):
+            if cb:
+                for i in cb(1):
+                    pass
+        r = self.object_put(
+            obj,
+            data=data,
+            content_type=content_type or 'application/octet-stream',
+            content_encoding=content_encoding,
+            content_disposition=content_disposition,
+            if_etag_match=if_etag_match,
+            if_etag_not_match='*' if if_not_exist else None,
+            etag=etag,
+            permissions=sharing,
+            public=public,
+            success=201)
+        return r.headers
+
     def _get_file_block_info(self, fileobj, size=None, cache=None):
         """
         :param fileobj: (file descriptor) source
@@ -310,69 +875,202 @@ class PithosClient(PithosRestClient):
 
     def _calculate_blocks_for_upload(
             self, blocksize, blockhash, size, nblocks, hashes, hmap, fileobj,
-            hash_cb=None):
-        offset = 0
+            hash_cb=None, blocks=None, reader=None):
+        """Read the blocks in order and hash up to HASH_THREADS of them in
+        parallel (hashlib releases the GIL while hashing large buffers), with
+        up to 2 * HASH_THREADS blocks read ahead
+
+        :param blocks: (dict) if given, keep {hash: block data} of the first
+            blocks, up to UPLOAD_BUFFER bytes, so that they are not read again
+            if they have to be uploaded. Blocks of memory mapped files are
+            buffers over the map, so they are all kept
+
+        :param reader: (BlockReader) of fileobj, if not given, a new one is
+            used and closed, unless blocks are kept
+
+        Blocks in the holes of sparse files are not read, they get the hash
+        of a zero block
+        """
+        offset, buffered = 0, 0
+        own_reader = reader is None
+        reader = BlockReader(fileobj) if own_reader else reader
+        extents = deque(data_extents(fileobj, size))
+        zero_hash = _pithos_hash('', blockhash)
         if hash_cb:
             hash_gen = hash_cb(nblocks)
             hash_gen.next()
 
-        for i in xrange(nblocks):
-            block = readall(fileobj, min(blocksize, size - offset))
-            bytes = len(block)
-            if bytes <= 0:
-                break
-            hash = _pithos_hash(block, blockhash)
+        threads = max(1, self.HASH_THREADS)
+        pool = get_worker_pool(threads) if threads > 1 else None
+        flying = deque()
+
+        def collect(buffered):
+            future, block_offset, bytes = flying.popleft()
+            hash = future.result()
             hashes.append(hash)
-            hmap[hash] = (offset, bytes)
-            offset += bytes
+            hmap[hash] = (block_offset, bytes)
+            #  blocks in holes are not read, so there is no data to keep
+            if blocks is not None and hash not in blocks and future.args:
+                if reader.map is not None:
+                    blocks[hash] = future.args[0]
+                elif buffered + bytes <= self.UPLOAD_BUFFER:
+                    blocks[hash] = future.args[0]
+                    buffered += bytes
             if hash_cb:
                 hash_gen.next()
+            return buffered
+
+        try:
+            for i in xrange(nblocks):
+                bytes = min(blocksize, size - offset)
+                while extents and extents[0][1] <= offset:
+                    extents.popleft()
+                if bytes > 0 and not (
+                        extents and extents[0][0] < offset + bytes):
+                    future = Future(lambda: zero_hash)
+                    future.run()
+                    flying.append((future, offset, bytes))
+                    offset += bytes
+                    continue
+                block = reader.read(offset, bytes)
+                bytes = len(block)
+                if bytes <= 0:
+                    break
+                future = Future(_pithos_hash, block, blockhash)
+                if pool:
+                    pool.submit(future)
+                else:
+                    future.run()
+                flying.append((future, offset, bytes))
+                offset += bytes
+                while flying and (
+                        flying[0][0].done() or len(flying) >= 2 * threads):
+                    buffered = collect(buffered)
+            while flying:
+                buffered = collect(buffered)
+        finally:
+            for future, block_offset, bytes in flying:
+                future.cancel()
+            if own_reader and blocks is None:
+                reader.close()
         msg = ('Failed to calculate uploading blocks: '
                'read bytes(%s) != requested size (%s)' % (offset, size))
         assert offset == size, msg
 
-    def _upload_missing_blocks(self, missing, hmap, fileobj, upload_gen=None):
-        """upload missing blocks asynchronously"""
+    def _hashes_for_upload(
+            self, blocksize, blockhash, size, nblocks, hashes, hmap, fileobj,
+            hash_cb=None, blocks=None, reader=None):
+        """Get the block hashes of fileobj from hash_cache, if they are there,
+        otherwise calculate them (see _calculate_blocks_for_upload) and keep
+        them in hash_cache. Cached hashes are not checked against the data
+        """
+        args = (blocksize, blockhash, size, nblocks, hashes, hmap, fileobj)
+        key = self.hash_cache.file_key(fileobj) if self.hash_cache else None
+        if key is None or key[2] != size:
+            return self._calculate_blocks_for_upload(
+                *args, hash_cb=hash_cb, blocks=blocks, reader=reader)
+        cached = self.hash_cache.get(key, blocksize, blockhash)
+        if cached is None or len(cached) != nblocks:
+            self._calculate_blocks_for_upload(
+                *args, hash_cb=hash_cb, blocks=blocks, reader=reader)
+            if self.hash_cache.file_key(fileobj) == key:
+                self.hash_cache.set(key, blocksize, blockhash, hashes)
+            return
+        if hash_cb:
+            hash_gen = hash_cb(nblocks)
+            hash_gen.next()
+        for i, hash in enumerate(cached):
+            offset = i * blocksize
+            hashes.append(hash)
+            hmap[hash] = (offset, min(blocksize, size - offset))
+            if hash_cb:
+                hash_gen.next()
 
-        self._init_thread_limit()
+    def _upload_missing_blocks(
+            self, missing, hmap, fileobj, upload_gen=None, blocks=None,
+            ack=None, blocksize=None, reader=None):
+        """upload missing blocks asynchronously, in batches of up to
+        BATCH_SIZE bytes per request
 
-        flying = []
-        failures = []
-        for hash in missing:
-            offset, bytes = hmap[hash]
-            fileobj.seek(offset)
-            data = readall(fileobj, bytes)
-            r = self._put_block_async(data, hash)
-            flying.append(r)
-            unfinished = self._watch_thread_limit(flying)
-            for thread in set(flying).difference(unfinished):
-                if thread.exception:
-                    failures.append(thread)
-                    if isinstance(
-                            thread.exception,
-                            ClientError) and thread.exception.status == 502:
-                        self.POOLSIZE = self._thread_limit
-                elif thread.isAlive():
-                    flying.append(thread)
-                elif upload_gen:
-                    try:
-                        upload_gen.next()
-                    except:
-                        pass
-            flying = unfinished
-
-        for thread in flying:
-            thread.join()
-            if thread.exception:
-                failures.append(thread)
-            elif upload_gen:
+        :param blocks: (dict) {hash: block data} of blocks which are not read
+            from fileobj again. Uploaded blocks are removed from it
+
+        :param ack: (method(hash)) called for each uploaded block
+
+        :param blocksize: (int) the container block size, if not given, each
+            block is uploaded in a request of its own
+
+        :param reader: (BlockReader) of fileobj, if not given, a new one is
+            used and closed
+
+        :returns: (list of str) the hashes of the blocks that failed
+
+        With a block_registry, blocks claimed by other uploads are not sent,
+        they are waited for after the blocks of this upload
+        """
+        blocks = {} if blocks is None else blocks
+        own_reader = reader is None
+        reader = BlockReader(fileobj) if own_reader else reader
+        registry, claimed, waiting = self.block_registry, set(), []
+        if registry:
+            for hash in missing:
+                event = registry.claim(hash)
+                if event is None:
+                    claimed.add(hash)
+                else:
+                    waiting.append((hash, event))
+            missing = [hash for hash in missing if hash in claimed]
+
+        def block_of(hash):
+            data = blocks.get(hash)
+            #  buffers over the map are not read if the file is found truncated
+            if data is None or (
+                    isinstance(data, buffer) and not reader.mapped()):
+                return reader.read(*hmap[hash])
+            return data
+
+        def put_block_futures():
+            for hashes, data in _block_batches(
+                    missing, block_of, blocksize or 0,
+                    self.BATCH_SIZE if blocksize else 0):
+                yield Future(self._put_blocks, data=data, hashes=hashes)
+
+        def uploaded(hash):
+            blocks.pop(hash, None)
+            if ack:
+                ack(hash)
+            if upload_gen:
                 try:
                     upload_gen.next()
                 except:
                     pass
 
-        return [failure.kwargs['hash'] for failure in failures]
+        failures = []
+        try:
+            for future in self._run_async(
+                    put_block_futures(), size_of=_batch_size):
+                for hash in future.kwargs['hashes']:
+                    if hash in claimed:
+                        claimed.remove(hash)
+                        registry.release(hash, not future.exception)
+                    if future.exception:
+                        failures.append(hash)
+                    else:
+                        uploaded(hash)
+        finally:
+            for hash in claimed:
+                registry.release(hash, False)
+            if own_reader:
+                reader.close()
+
+        for hash, event in waiting:
+            if registry.wait(hash, event):
+                uploaded(hash)
+            else:
+                failures.append(hash)
+        return failures
 
+    @retry_budget
     def upload_object(
             self, obj, f,
             size=None,
@@ -420,69 +1118,218 @@ class PithosClient(PithosRestClient):
 
         :param container_info_cache: (dict) if given, avoid redundant calls to
             server for container info (block size and hash information)
+
+        Objects up to SMALL_OBJECT_SIZE bytes, but not larger than a block,
+        are uploaded in one request, from the current position of f
         """
         self._assert_container()
 
-        block_info = (
-            blocksize, blockhash, size, nblocks) = self._get_file_block_info(
-                f, size, container_info_cache)
-        (hashes, hmap, offset) = ([], {}, 0)
-        content_type = content_type or 'application/octet-stream'
+        block_info = self._get_file_block_info(f, size, container_info_cache)
+        blocksize, blockhash, size, nblocks = block_info
+        if size <= min(self.SMALL_OBJECT_SIZE, blocksize):
+            try:
+                position = f.tell()
+            except (AttributeError, IOError):
+                position = 0
+            with BlockReader(f) as reader:
+                data = reader.read(position, size)
+                assert len(data) == size, (
+                    'Failed to read small object: read bytes(%s) != '
+                    'requested size (%s)' % (len(data), size))
+                return self._upload_small_object(
+                    obj, data,
+                    hash_cb=hash_cb,
+                    upload_cb=upload_cb,
+                    etag=etag,
+                    if_etag_match=if_etag_match,
+                    if_not_exist=if_not_exist,
+                    content_encoding=content_encoding,
+                    content_disposition=content_disposition,
+                    content_type=content_type,
+                    sharing=sharing,
+                    public=public)
+
+        #  one reader (one map) for hashing and uploading the blocks
+        with BlockReader(f) as reader:
+            (hashes, hmap, offset, blocks) = ([], {}, 0, {})
+            content_type = content_type or 'application/octet-stream'
+
+            journal, ack = self.upload_journal, None
+            key = BlockHashCache.file_key(f) if journal else None
+            if key and key[2] == size:
+                name = '%s/%s/%s' % (self.account, self.container, obj)
+                ack = partial(journal.ack, name)
+                resumed = journal.load(name, key, blocksize, blockhash)
+            else:
+                journal, resumed = None, None
+
+            if resumed:
+                hashes, acked = resumed
+                for i, hash in enumerate(hashes):
+                    offset = i * blocksize
+                    hmap[hash] = (offset, min(blocksize, size - offset))
+                missing = [h for h in hmap if h not in acked]
+                sendlog.info('resume upload, %s of %s blocks uploaded' % (
+                    len(hmap) - len(missing), len(hmap)))
+                if hash_cb:
+                    hash_gen = hash_cb(nblocks)
+                    for i in range(nblocks + 1):
+                        hash_gen.next()
+                hashmap = dict(bytes=size, hashes=hashes)
+            else:
+                self._hashes_for_upload(
+                    *block_info,
+                    hashes=hashes,
+                    hmap=hmap,
+                    fileobj=f,
+                    hash_cb=hash_cb,
+                    blocks=blocks,
+                    reader=reader)
+                if journal:
+                    journal.start(name, key, blocksize, blockhash, hashes)
+
+                hashmap = dict(bytes=size, hashes=hashes)
+                get_missing = self._create_object_or_get_missing_hashes
+                missing, obj_headers = get_missing(
+                    obj, hashmap,
+                    content_type=content_type,
+                    size=size,
+                    if_etag_match=if_etag_match,
+                    if_etag_not_match='*' if if_not_exist else None,
+                    content_encoding=content_encoding,
+                    content_disposition=content_disposition,
+                    permissions=sharing,
+                    public=public)
+
+                if missing is None:
+                    if journal:
+                        journal.discard(name)
+                    return obj_headers
+                #  repeated blocks (e.g., zero blocks) are uploaded once
+                missing = _unique(missing)
+                for hash in set(blocks).difference(missing):
+                    del blocks[hash]
+
+            if upload_cb:
+                upload_gen = upload_cb(len(missing))
+                for i in range(len(missing), len(hashmap['hashes']) + 1):
+                    try:
+                        upload_gen.next()
+                    except:
+                        upload_gen = None
+            else:
+                upload_gen = None
 
-        self._calculate_blocks_for_upload(
-            *block_info,
-            hashes=hashes,
-            hmap=hmap,
-            fileobj=f,
-            hash_cb=hash_cb)
+            if missing:
+                self._prewarm()
+            retries = 7
+            while retries:
+                sendlog.info('%s blocks missing' % len(missing))
+                num_of_blocks = len(missing)
+                missing = self._upload_missing_blocks(
+                    missing, hmap, f, upload_gen,
+                    blocks=blocks, ack=ack, blocksize=blocksize, reader=reader)
+                if missing:
+                    if num_of_blocks == len(missing):
+                        retries -= 1
+                    else:
+                        num_of_blocks = len(missing)
+                    sleep(self.retry_policy.delay(7 - retries))
+                else:
+                    break
+            if missing:
+                try:
+                    details = ['%s' % thread.exception for thread in missing]
+                except Exception:
+                    details = ['Also, failed to read thread exceptions']
+                raise ClientError(
+                    '%s blocks failed to upload' % len(missing),
+                    details=details)
+
+            put_args = dict(
+                format='json',
+                hashmap=True,
+                content_type=content_type,
+                content_encoding=content_encoding,
+                if_etag_match=if_etag_match,
+                if_etag_not_match='*' if if_not_exist else None,
+                etag=etag,
+                json=hashmap,
+                permissions=sharing,
+                public=public)
+            r = self.object_put(
+                obj, success=(201, 409) if resumed else 201, **put_args)
+            if r.status_code == 409:
+                #  blocks acknowledged in the journal are missing from server
+                missing = self._upload_missing_blocks(
+                    _unique(r.json), hmap, f,
+                    blocks=blocks, ack=ack, blocksize=blocksize, reader=reader)
+                if missing:
+                    raise ClientError(
+                        '%s blocks failed to upload' % len(missing))
+                r = self.object_put(obj, success=201, **put_args)
+            if journal:
+                journal.discard(name)
+            return r.headers
 
-        hashmap = dict(bytes=size, hashes=hashes)
-        missing, obj_headers = self._create_object_or_get_missing_hashes(
-            obj, hashmap,
-            content_type=content_type,
-            size=size,
-            if_etag_match=if_etag_match,
-            if_etag_not_match='*' if if_not_exist else None,
-            content_encoding=content_encoding,
-            content_disposition=content_disposition,
-            permissions=sharing,
-            public=public)
+    @retry_budget
+    def upload_from_stream(
+            self, obj, f,
+            window=None,
+            etag=None,
+            if_etag_match=None,
+            if_not_exist=None,
+            content_encoding=None,
+            content_disposition=None,
+            content_type=None,
+            sharing=None,
+            public=None,
+            container_info_cache=None):
+        """Upload an object from a stream which may not have a size or seek
+        (e.g., stdin or a pipe). Blocks are read, hashed and uploaded as they
+        come, and the object is created from their hashmap at EOF. Since the
+        hashmap is not known in advance, all blocks are uploaded
 
-        if missing is None:
-            return obj_headers
+        :param obj: (str) remote object path
 
-        if upload_cb:
-            upload_gen = upload_cb(len(missing))
-            for i in range(len(missing), len(hashmap['hashes']) + 1):
-                try:
-                    upload_gen.next()
-                except:
-                    upload_gen = None
-        else:
-            upload_gen = None
-
-        retries = 7
-        while retries:
-            sendlog.info('%s blocks missing' % len(missing))
-            num_of_blocks = len(missing)
-            missing = self._upload_missing_blocks(
-                missing, hmap, f, upload_gen)
-            if missing:
-                if num_of_blocks == len(missing):
-                    retries -= 1
-                else:
-                    num_of_blocks = len(missing)
-            else:
-                break
-        if missing:
-            try:
-                details = ['%s' % thread.exception for thread in missing]
-            except Exception:
-                details = ['Also, failed to read thread exceptions']
-            raise ClientError(
-                '%s blocks failed to upload' % len(missing),
-                details=details)
+        :param f: file-like object with a read method
+
+        :param window: (int) max bytes of blocks in memory (default:
+            STREAM_WINDOW), at least one block
+
+        For the rest of the parameters, see upload_object
+
+        :returns: (dict) the response headers of the object creation
+        """
+        self._assert_container()
+        blocksize, blockhash = self._get_file_block_info(
+            f, 0, container_info_cache)[:2]
+        window_blocks = max(1, (window or self.STREAM_WINDOW) // blocksize)
+        hashes, sizes = [], []
+
+        def put_block_futures():
+            while True:
+                block = readall(f, blocksize)
+                if not block:
+                    break
+                sizes.append(len(block))
+                hashes.append(None)
+                future = Future(
+                    self._put_stream_block, data=block, blockhash=blockhash)
+                future.index = len(hashes) - 1
+                yield future
+                if len(block) < blocksize:
+                    break
+
+        for future in self._run_async(
+                put_block_futures(), size_of=_data_size,
+                max_flying=window_blocks):
+            if future.exception:
+                raise future.exception
+            hashes[future.index] = future.value
+            sendlog.info('block %s uploaded' % future.index)
 
+        content_type = content_type or 'application/octet-stream'
         r = self.object_put(
             obj,
             format='json',
@@ -492,12 +1339,13 @@ class PithosClient(PithosRestClient):
             if_etag_match=if_etag_match,
             if_etag_not_match='*' if if_not_exist else None,
             etag=etag,
-            json=hashmap,
+            json=dict(bytes=sum(sizes), hashes=hashes),
             permissions=sharing,
             public=public,
             success=201)
         return r.headers
 
+    @retry_budget
     def upload_from_string(
             self, obj, input_str,
             hash_cb=None,
@@ -544,11 +1392,28 @@ class PithosClient(PithosRestClient):
 
         :param container_info_cache: (dict) if given, avoid redundant calls to
             server for container info (block size and hash information)
+
+        Objects up to SMALL_OBJECT_SIZE bytes, but not larger than a block,
+        are uploaded in one request
         """
         self._assert_container()
 
         blocksize, blockhash, size, nblocks = self._get_file_block_info(
-                fileobj=None, size=len(input_str), cache=container_info_cache)
+            fileobj=None, size=len(input_str), cache=container_info_cache)
+        if size <= min(self.SMALL_OBJECT_SIZE, blocksize):
+            return self._upload_small_object(
+                obj, input_str,
+                hash_cb=hash_cb,
+                upload_cb=upload_cb,
+                etag=etag,
+                if_etag_match=if_etag_match,
+                if_not_exist=if_not_exist,
+                content_encoding=content_encoding,
+                content_disposition=content_disposition,
+                content_type=content_type,
+                sharing=sharing,
+                public=public)
+
         (hashes, hmap, offset) = ([], {}, 0)
         if not content_type:
             content_type = 'application/octet-stream'
@@ -574,6 +1439,7 @@ class PithosClient(PithosRestClient):
             public=public)
         if missing is None:
             return obj_headers
+        missing = _unique(missing)
         num_of_missing = len(missing)
 
         if upload_cb:
@@ -583,39 +1449,27 @@ class PithosClient(PithosRestClient):
 
         tries = 7
         old_failures = 0
-        try:
-            while tries and missing:
-                flying = []
-                failures = []
-                for hash in missing:
-                    offset, block = hmap[hash]
-                    bird = self._put_block_async(block, hash)
-                    flying.append(bird)
-                    unfinished = self._watch_thread_limit(flying)
-                    for thread in set(flying).difference(unfinished):
-                        if thread.exception:
-                            failures.append(thread.kwargs['hash'])
-                        if thread.isAlive():
-                            flying.append(thread)
-                        else:
-                            self._cb_next()
-                    flying = unfinished
-                for thread in flying:
-                    thread.join()
-                    if thread.exception:
-                        failures.append(thread.kwargs['hash'])
+        while tries and missing:
+            failures = []
+            batches = _block_batches(
+                missing, lambda hash: hmap[hash][1], blocksize,
+                self.BATCH_SIZE)
+            futures = [
+                Future(self._put_blocks, data=data, hashes=hashes) for (
+                    hashes, data) in batches]
+            for future in self._run_async(futures, size_of=_batch_size):
+                if future.exception:
+                    failures += future.kwargs['hashes']
+                for hash in future.kwargs['hashes']:
                     self._cb_next()
-                missing = failures
-                if missing and len(missing) == old_failures:
-                    tries -= 1
-                old_failures = len(missing)
+            missing = failures
+            if missing and len(missing) == old_failures:
+                tries -= 1
+            old_failures = len(missing)
             if missing:
-                raise ClientError('%s blocks failed to upload' % len(missing))
-        except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
-            raise
+                sleep(self.retry_policy.delay(7 - tries))
+        if missing:
+            raise ClientError('%s blocks failed to upload' % len(missing))
         self._cb_next()
 
         r = self.object_put(
@@ -652,30 +1506,182 @@ class PithosClient(PithosRestClient):
                 map_dict[h] = [i]
         return (blocksize, blockhash, total_size, hashmap['hashes'], map_dict)
 
-    def _dump_blocks_sync(
-            self, obj, remote_hashes, blocksize, total_size, dst, crange,
-            **args):
+    def _get_ranges(self, obj, ranges, **args):
+        """Download byte ranges of an object in one request
+
+        :param ranges: (list of tuples) (start, end) sorted ranges
+
+        :returns: (list of tuples) (position, data) of the response, sorted.
+            Ranges missing from a multi-range response (the server may send
+            fewer parts, or one range) are requested one by one
+        """
+        args['data_range'] = 'bytes=%s' % ','.join(
+            '%s-%s' % r for r in ranges)
+        r = self.object_get(obj, success=(200, 206), stream=True, **args)
+        pieces = list(_response_ranges(r, ranges))
+        if len(ranges) < 2:
+            return pieces
+        missing = _missing_ranges(
+            [(position, len(data)) for position, data in pieces], ranges)
+        if missing:
+            pieces = list(_clip_pieces(pieces, [
+                rng for rng in ranges if rng not in missing]))
+            for rng in missing:
+                pieces += self._get_ranges(obj, [rng], **args)
+            pieces.sort(key=lambda piece: piece[0])
+        return pieces
+
+    def _iter_blocks(
+            self, obj, remote_hashes, blocksize, total_size, crange,
+            window=None, **args):
+        """Download blocks in parallel and yield their data in order. Blocks
+        out of crange are skipped. Adjacent blocks are fetched in ranges of
+        up to RANGE_SIZE bytes, but small enough for the window to hold
+        MAX_THREADS requests. If crange has more than one range, they are
+        fetched in order of position, up to MAX_RANGES of them per request
+
+        :param window: (int) max bytes of blocks in flight or waiting to be
+            yielded (default: STREAM_WINDOW), at least one request
+
+        :returns: (generator of str) the data of each block, or of each part
+            of a block in crange
+        """
         if not total_size:
             return
-        for blockid, blockhash in enumerate(remote_hashes):
-            if blockhash:
-                start = blocksize * blockid
-                is_last = start + blocksize > total_size
-                end = (total_size - 1) if is_last else (start + blocksize - 1)
-                data_range = _range_up(start, end, total_size, crange)
-                if not data_range:
-                    self._cb_next()
-                    continue
-                args['data_range'] = 'bytes=%s' % data_range
-                r = self.object_get(obj, success=(200, 206), **args)
-                self._cb_next()
-                dst.write(r.content)
-                dst.flush()
-
-    def _get_block_async(self, obj, **args):
-        event = SilentEvent(self.object_get, obj, success=(200, 206), **args)
-        event.start()
-        return event
+        self._prewarm()
+        window = window or self.STREAM_WINDOW
+        span = max(1, min(
+            self.RANGE_SIZE, window // self.MAX_THREADS) // blocksize)
+        window_requests = max(1, window // (span * blocksize))
+        ready = dict()
+
+        def range_futures():
+            index, nblocks = 0, len(remote_hashes)
+            if crange and ',' in crange:
+                selected = _range_up(0, total_size - 1, total_size, crange)
+                groups = _group_ranges(
+                    _parse_ranges(selected) if selected else [],
+                    self.MAX_RANGES, span * blocksize)
+                requests = ((group, sum(
+                    end // blocksize - start // blocksize + 1 for (
+                        start, end) in group)) for group in groups)
+            else:
+                requests = []
+                for first in xrange(0, nblocks, span):
+                    blocks = min(span, nblocks - first)
+                    start = blocksize * first
+                    end = min(start + blocks * blocksize, total_size) - 1
+                    data_range = _range_up(start, end, total_size, crange)
+                    if data_range:
+                        requests.append((_parse_ranges(data_range), blocks))
+                    else:
+                        self._cb_next(blocks)
+            for ranges, blocks in requests:
+                future = Future(self._get_ranges, obj, ranges, **args)
+                future.index, index = index, index + 1
+                future.blocks = blocks
+                yield future
+
+        done = 0
+        for future in self._run_async(
+                range_futures(),
+                size_of=lambda f: sum(len(d) for p, d in f.value),
+                max_flying=lambda: window_requests - len(ready)):
+            if future.exception:
+                raise future.exception
+            ready[future.index] = future
+            while done in ready:
+                future = ready.pop(done)
+                done += 1
+                self._cb_next(future.blocks)
+                for position, data in future.value:
+                    start = 0
+                    while start < len(data):
+                        #  split at block boundaries
+                        end = start + blocksize - (position + start) % (
+                            blocksize)
+                        yield data if (start == 0 and end >= len(data)) else (
+                            data[start:end])
+                        start = end
+
+    def _dump_blocks_in_order(
+            self, obj, remote_hashes, blocksize, total_size, dst, crange,
+            window=None, **args):
+        """Download blocks in parallel and write them in order, so that dst
+        can be a stream (e.g., a pipe or a terminal)
+
+        :param window: (int) see _iter_blocks
+        """
+        for data in self._iter_blocks(
+                obj, remote_hashes, blocksize, total_size, crange,
+                window=window, **args):
+            dst.write(data)
+        dst.flush()
+
+    def _stream_blocks(
+            self, obj, write_at, blocks, blocksize, ranges, **args):
+        """Download ranges of blocks in one request and write each block at
+        each of its positions, chunk by chunk
+
+        :param write_at: (method(position, data)) writes data to destination
+
+        :param blocks: (list of lists) the destination positions of each
+            block, where the first one is the position of the block data
+
+        :param ranges: (list of tuples) (start, end) sorted ranges to request
+
+        :returns: (int) the bytes written. Ranges missing from a multi-range
+            response (the server may send fewer parts, or one range) are
+            requested one by one
+        """
+        args['async_headers'] = {'Range': 'bytes=%s' % ','.join(
+            '%s-%s' % r for r in ranges)}
+        r = self.object_get(obj, success=(200, 206), stream=True, **args)
+        positions, size = dict((b[0], b) for b in blocks), 0
+        received = []
+        for position, chunk in _response_ranges(r, ranges):
+            received.append((position, len(chunk)))
+            start = 0
+            while start < len(chunk):
+                offset = (position + start) % blocksize
+                end = start + blocksize - offset
+                piece = chunk if (
+                    start == 0 and end >= len(chunk)) else chunk[start:end]
+                key = position + start - offset
+                for block_position in positions.get(key, ()):
+                    write_at(block_position + offset, piece)
+                    size += len(piece) if block_position == key else 0
+                start += len(piece)
+        if len(ranges) > 1:
+            for rng in _missing_ranges(received, ranges):
+                size += self._stream_blocks(
+                    obj, write_at, blocks, blocksize, [rng], **args)
+        return size
+
+    def _file_writer(self, local_file, offset=0):
+        """:returns: (method(position, data)) a thread-safe positional writer.
+            Regular files are written with pwrite, so that threads do not
+            wait for each other, other files with seek and write under a lock
+        """
+        try:
+            fd = local_file.fileno()
+            local_file.flush()
+            pwrite(fd, '', 0)
+            fd = fd if S_ISREG(fstat(fd).st_mode) else None
+        except (AttributeError, ValueError, EnvironmentError):
+            fd = None
+        if fd is not None:
+            def write_at(position, data):
+                pwrite(fd, data, position + offset)
+            return write_at
+
+        lock = Lock()
+
+        def write_at(position, data):
+            with lock:
+                local_file.seek(position + offset)
+                local_file.write(data)
+        return write_at
 
     def _hash_from_file(self, fp, start, size, blockhash):
         fp.seek(start)
@@ -684,36 +1690,14 @@ class PithosClient(PithosRestClient):
         h.update(block.strip('\x00'))
         return hexlify(h.digest())
 
-    def _thread2file(self, flying, blockids, local_file, offset=0, **restargs):
-        """write the results of a greenleted rest call to a file
-
-        :param offset: the offset of the file up to blocksize
-        - e.g. if the range is 10-100, all blocks will be written to
-        normal_position - 10
-        """
-        for key, g in flying.items():
-            if g.isAlive():
-                continue
-            if g.exception:
-                raise g.exception
-            block = g.value.content
-            for block_start in blockids[key]:
-                local_file.seek(block_start + offset)
-                local_file.write(block)
-                self._cb_next()
-            flying.pop(key)
-            blockids.pop(key)
-        local_file.flush()
-
     def _dump_blocks_async(
             self, obj, remote_hashes, blocksize, total_size, local_file,
             blockhash=None, resume=False, filerange=None, **restargs):
         file_size = fstat(local_file.fileno()).st_size if resume else 0
-        flying = dict()
-        blockid_dict = dict()
         offset = 0
 
-        self._init_thread_limit()
+        #  Check the local file before any thread starts writing on it
+        unsaved_blocks = []
         for block_hash, blockids in remote_hashes.items():
             blockids = [blk * blocksize for blk in blockids]
             unsaved = [blk for blk in blockids if not (
@@ -721,29 +1705,57 @@ class PithosClient(PithosRestClient):
                         local_file, blk, blocksize, blockhash))]
             self._cb_next(len(blockids) - len(unsaved))
             if unsaved:
-                key = unsaved[0]
-                self._watch_thread_limit(flying.values())
-                self._thread2file(
-                    flying, blockid_dict, local_file, offset,
-                    **restargs)
-                end = total_size - 1 if (
-                    key + blocksize > total_size) else key + blocksize - 1
-                if end < key:
-                    self._cb_next()
-                    continue
-                data_range = _range_up(key, end, total_size, filerange)
-                if not data_range:
-                    self._cb_next()
-                    continue
-                restargs[
-                    'async_headers'] = {'Range': 'bytes=%s' % data_range}
-                flying[key] = self._get_block_async(obj, **restargs)
-                blockid_dict[key] = unsaved
+                unsaved_blocks.append(unsaved)
 
-        for thread in flying.values():
-            thread.join()
-        self._thread2file(flying, blockid_dict, local_file, offset, **restargs)
+        if not filerange and total_size > file_size:
+            try:
+                preallocate(local_file.fileno(), total_size)
+            except (AttributeError, ValueError, EnvironmentError):
+                pass
+        write_at = self._file_writer(local_file, offset)
+        if unsaved_blocks:
+            self._prewarm()
+
+        #  Blocks are downloaded in requests of up to RANGE_SIZE bytes, each
+        #  with up to MAX_RANGES ranges of adjacent blocks (e.g., resume gaps)
+        groups, runs, size = [], 0, 0
+        for unsaved in sorted(unsaved_blocks):
+            adjacent = groups and unsaved[0] == groups[-1][-1][0] + blocksize
+            if groups and size + blocksize <= self.RANGE_SIZE and (
+                    adjacent or runs < self.MAX_RANGES):
+                groups[-1].append(unsaved)
+                runs += 0 if adjacent else 1
+                size += blocksize
+            else:
+                groups.append([unsaved])
+                runs, size = 1, blocksize
+
+        def stream_block_futures():
+            for blocks in groups:
+                selected = []
+                for block in blocks:
+                    key = block[0]
+                    end = min(key + blocksize, total_size) - 1
+                    if end < key:
+                        continue
+                    data_range = _range_up(key, end, total_size, filerange)
+                    if data_range:
+                        selected.append(data_range)
+                if not selected:
+                    self._cb_next(sum(len(positions) for positions in blocks))
+                    continue
+                yield Future(
+                    self._stream_blocks, obj, write_at, blocks, blocksize,
+                    _parse_ranges(','.join(selected)), **restargs)
+
+        for future in self._run_async(
+                stream_block_futures(), size_of=lambda f: f.value):
+            if future.exception:
+                raise future.exception
+            self._cb_next(sum(len(positions) for positions in future.args[2]))
+        local_file.flush()
 
+    @retry_budget
     def download_object(
             self, obj, dst,
             download_cb=None,
@@ -758,7 +1770,8 @@ class PithosClient(PithosRestClient):
 
         :param obj: (str) remote object path
 
-        :param dst: open file descriptor (wb+)
+        :param dst: open file descriptor (wb+), or a stream (e.g., a pipe or
+            stdout), where blocks are written in order
 
         :param download_cb: optional progress.bar object for downloading
 
@@ -795,8 +1808,8 @@ class PithosClient(PithosRestClient):
             self.progress_bar_gen = download_cb(len(hash_list))
             self._cb_next()
 
-        if dst.isatty():
-            self._dump_blocks_sync(
+        if not _is_seekable(dst):
+            self._dump_blocks_in_order(
                 obj,
                 hash_list,
                 blocksize,
@@ -820,6 +1833,7 @@ class PithosClient(PithosRestClient):
 
         self._complete_cb()
 
+    @retry_budget
     def download_to_string(
             self, obj,
             download_cb=None,
@@ -870,35 +1884,76 @@ class PithosClient(PithosRestClient):
             self.progress_bar_gen = download_cb(len(hash_list))
             self._cb_next()
 
-        num_of_blocks = len(remote_hashes)
-        ret = [''] * num_of_blocks
-        self._init_thread_limit()
-        flying = dict()
-        try:
-            for blockid, blockhash in enumerate(remote_hashes):
-                start = blocksize * blockid
-                is_last = start + blocksize > total_size
-                end = (total_size - 1) if is_last else (start + blocksize - 1)
-                data_range_str = _range_up(start, end, end, range_str)
-                if data_range_str:
-                    self._watch_thread_limit(flying.values())
-                    restargs['data_range'] = 'bytes=%s' % data_range_str
-                    flying[blockid] = self._get_block_async(obj, **restargs)
-                for runid, thread in flying.items():
-                    if (blockid + 1) == num_of_blocks:
-                        thread.join()
-                    elif thread.isAlive():
-                        continue
-                    if thread.exception:
-                        raise thread.exception
-                    ret[runid] = thread.value.content
-                    self._cb_next()
-                    flying.pop(runid)
-            return ''.join(ret)
-        except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
+        return ''.join(self._iter_blocks(
+            obj, hash_list, blocksize, total_size, range_str,
+            window=total_size, **restargs))
+
+    def iter_object_blocks(
+            self, obj,
+            window=None,
+            chunk_size=None,
+            download_cb=None,
+            version=None,
+            range_str=None,
+            if_match=None,
+            if_none_match=None,
+            if_modified_since=None,
+            if_unmodified_since=None):
+        """Download an object in parallel and yield its contents in order,
+        so that large objects can be processed without storing them
+
+        :param obj: (str) remote object path
+
+        :param window: (int) max bytes of blocks read ahead, in flight or
+            waiting to be yielded (default: STREAM_WINDOW), at least one block
+
+        :param chunk_size: (int) if given, yield chunks of up to chunk_size
+            bytes, otherwise the data of each block
+
+        :param download_cb: optional progress.bar object for downloading
+
+        :param version: (str) file version
+
+        :param range_str: (str) from, to are file positions (int) in bytes
+
+        :param if_match: (str)
+
+        :param if_none_match: (str)
+
+        :param if_modified_since: (str) formated date
+
+        :param if_unmodified_since: (str) formated date
+
+        :returns: (generator of str) the object contents
+        """
+        restargs = dict(
+            version=version,
+            data_range=None if range_str is None else 'bytes=%s' % range_str,
+            if_match=if_match,
+            if_none_match=if_none_match,
+            if_modified_since=if_modified_since,
+            if_unmodified_since=if_unmodified_since)
+
+        (
+            blocksize,
+            blockhash,
+            total_size,
+            hash_list,
+            remote_hashes) = self._get_remote_blocks_info(obj, **restargs)
+        assert total_size >= 0
+
+        if download_cb:
+            self.progress_bar_gen = download_cb(len(hash_list))
+            self._cb_next()
+
+        for data in self._iter_blocks(
+                obj, hash_list, blocksize, total_size, range_str,
+                window=window, **restargs):
+            if not chunk_size:
+                yield data
+                continue
+            for start in xrange(0, len(data), chunk_size):
+                yield data[start:start + chunk_size]
 
     #Command Progress Bar method
     def _cb_next(self, step=1):
@@ -1297,6 +2352,7 @@ class PithosClient(PithosRestClient):
         """
         return self.set_object_sharing(obj)
 
+    @retry_budget
     def append_object(self, obj, source_file, upload_cb=None):
         """
         :param obj: (str) remote object path
@@ -1310,48 +2366,37 @@ class PithosClient(PithosRestClient):
         blocksize = int(meta['x-container-block-size'])
         filesize = fstat(source_file.fileno()).st_size
         nblocks = 1 + (filesize - 1) // blocksize
-        offset = 0
-        headers = {}
+        headers, blockids = {}, {}
         if upload_cb:
             self.progress_bar_gen = upload_cb(nblocks)
             self._cb_next()
-        flying = {}
-        self._init_thread_limit()
-        try:
+
+        reader = BlockReader(source_file)
+
+        def append_futures():
+            offset = 0
             for i in range(nblocks):
-                block = source_file.read(min(blocksize, filesize - offset))
+                block = reader.read(offset, min(blocksize, filesize - offset))
                 offset += len(block)
-
-                self._watch_thread_limit(flying.values())
-                unfinished = {}
-                flying[i] = SilentEvent(
-                    method=self.object_post,
+                future = Future(
+                    self.object_post,
                     obj=obj,
                     update=True,
                     content_range='bytes */*',
                     content_type='application/octet-stream',
                     content_length=len(block),
                     data=block)
-                flying[i].start()
-
-                for key, thread in flying.items():
-                    if thread.isAlive():
-                        if i < (nblocks - 1):
-                            unfinished[key] = thread
-                            continue
-                        thread.join()
-                    if thread.exception:
-                        raise thread.exception
-                    headers[key] = thread.value.headers
-                    self._cb_next()
-                flying = unfinished
-        except KeyboardInterrupt:
-            sendlog.info('- - - wait for threads to finish')
-            for thread in activethreads():
-                thread.join()
+                blockids[future] = i
+                yield future
+
+        try:
+            for future in self._run_async(
+                    append_futures(), size_of=_data_size):
+                if future.exception:
+                    raise future.exception
+                headers[blockids.pop(future)] = future.value.headers
+                self._cb_next()
         finally:
-            from time import sleep
-            sleep(2 * len(activethreads()))
             self._cb_next()
         return headers.values()
 
@@ -1407,10 +2452,10 @@ class PithosClient(PithosRestClient):
         if upload_cb:
             self.progress_bar_gen = upload_cb(nblocks)
             self._cb_next()
-        headers = []
+        headers, reader = [], BlockReader(source_file)
         for i in range(nblocks):
             read_size = min(blocksize, filesize - offset, datasize - offset)
-            block = source_file.read(read_size)
+            block = reader.read(offset, read_size)
             r = self.object_post(
                 obj,
                 update=True,
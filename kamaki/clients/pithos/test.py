@@ -153,6 +153,9 @@ class FR(object):
     status = None
     status_code = 200
 
+    def iter_content(self, chunk_size=None):
+        yield self.content
+
 
 class PithosRestClient(TestCase):
 
@@ -772,6 +775,111 @@ class PithosMethods(TestCase):
             self.assertEqual(_range_up(*args), expected)
 
 
+class BlockHashCache(TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        self.path = mkdtemp()
+        self.cache = pithos.BlockHashCache('%s/hashes.db' % self.path)
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.path)
+
+    def test_file_key(self):
+        from StringIO import StringIO
+        from os import stat
+        self.assertEqual(self.cache.file_key(StringIO('data')), None)
+        with NamedTemporaryFile() as f:
+            f.write('data')
+            f.flush()
+            st = stat(f.name)
+            self.assertEqual(
+                self.cache.file_key(f),
+                (f.name, st.st_ino, 4, st.st_mtime))
+
+    def test_get_set(self):
+        key, hashes = ('/a/file', 7, 100, 1000.5), ['h0', 'h1']
+        self.assertEqual(self.cache.get(key, 64, 'sha256'), None)
+        self.assertTrue(self.cache.set(key, 64, 'sha256', hashes))
+        self.assertEqual(self.cache.get(key, 64, 'sha256'), hashes)
+        self.assertEqual(self.cache.get(key, 32, 'sha256'), None)
+        self.assertEqual(self.cache.get(key, 64, 'sha1'), None)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+        changed = ('/a/file', 7, 100, 1001.5)
+        self.assertEqual(self.cache.get(changed, 64, 'sha256'), None)
+        self.assertEqual(self.cache.get(key, 64, 'sha256'), None)
+        from time import time
+        racy = ('/a/file', 7, 100, time())
+        self.assertFalse(self.cache.set(racy, 64, 'sha256', hashes))
+
+    def test_eviction(self):
+        self.cache.max_entries = 2
+        keys = [('/a/%s' % i, i, 1, 1000.0) for i in range(3)]
+        for key in keys:
+            self.cache.set(key, 64, 'sha256', [key[0]])
+        self.assertEqual(self.cache.get(keys[0], 64, 'sha256'), None)
+        for key in keys[1:]:
+            self.assertEqual(self.cache.get(key, 64, 'sha256'), [key[0]])
+
+
+class UploadJournal(TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        self.path = mkdtemp()
+        self.journal = pithos.UploadJournal('%s/journal' % self.path)
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.path)
+
+    def test_journal(self):
+        name, key = 'acc/cont/obj', ('/a/file', 7, 100, 1000.5)
+        self.assertEqual(self.journal.load(name, key, 64, 'sha256'), None)
+        self.journal.start(name, key, 64, 'sha256', ['h0', 'h1'])
+        self.assertEqual(
+            self.journal.load(name, key, 64, 'sha256'), (['h0', 'h1'], set()))
+        self.journal.ack(name, 'h1')
+        self.assertEqual(
+            self.journal.load(name, key, 64, 'sha256'),
+            (['h0', 'h1'], set(['h1'])))
+        self.assertEqual(self.journal.load('a/c/o', key, 64, 'sha256'), None)
+        self.journal.discard(name)
+        self.assertEqual(self.journal.load(name, key, 64, 'sha256'), None)
+
+    def test_changed_file(self):
+        name, key = 'acc/cont/obj', ('/a/file', 7, 100, 1000.5)
+        self.journal.start(name, key, 64, 'sha256', ['h0', 'h1'])
+        changed = ('/a/file', 7, 100, 1001.5)
+        self.assertEqual(self.journal.load(name, changed, 64, 'sha256'), None)
+        self.assertEqual(self.journal.load(name, key, 64, 'sha256'), None)
+
+
+class BlockRegistry(TestCase):
+
+    def setUp(self):
+        self.registry = pithos.BlockRegistry()
+
+    def test_claim(self):
+        self.assertEqual(self.registry.claim('h0'), None)
+        event = self.registry.claim('h0')
+        self.assertFalse(event.is_set())
+        self.registry.release('h0', True)
+        self.assertTrue(self.registry.wait('h0', event))
+        self.assertTrue(self.registry.claim('h0').is_set())
+
+    def test_failed_claim(self):
+        from threading import Thread
+        self.assertEqual(self.registry.claim('h0'), None)
+        event = self.registry.claim('h0')
+        t = Thread(target=self.registry.release, args=('h0', False))
+        t.start()
+        self.assertFalse(self.registry.wait('h0', event))
+        t.join()
+        self.assertEqual(self.registry.claim('h0'), None)
+
+
 class PithosClient(TestCase):
 
     files = []
@@ -848,6 +956,177 @@ class PithosClient(TestCase):
         for i in range(len(r)):
             self.assert_dicts_are_equal(r[i], container_list[i])
 
+    def test__calculate_blocks_for_upload(self):
+        from StringIO import StringIO
+        from kamaki.clients.pithos import _pithos_hash
+        blocksize, data = 1024, urandom(10 * 1024 + 100)
+        blocks = [data[i:i + blocksize] for i in range(
+            0, len(data), blocksize)]
+        progress = []
+
+        def hash_cb(n):
+            for i in range(n + 1):
+                progress.append(i)
+                yield
+
+        for threads in (1, 3):
+            self.client.HASH_THREADS = threads
+            hashes, hmap, progress[:] = [], {}, []
+            self.client._calculate_blocks_for_upload(
+                blocksize, 'sha256', len(data), len(blocks), hashes, hmap,
+                StringIO(data), hash_cb=hash_cb)
+            self.assertEqual(
+                hashes, [_pithos_hash(b, 'sha256') for b in blocks])
+            self.assertEqual(hmap[hashes[-1]], (10 * 1024, 100))
+            self.assertEqual(progress, range(len(blocks) + 1))
+        self.client.UPLOAD_BUFFER, kept = 3 * blocksize, {}
+        self.client._calculate_blocks_for_upload(
+            blocksize, 'sha256', len(data), len(blocks), [], {},
+            StringIO(data), blocks=kept)
+        self.assertEqual(sorted(kept.values()), sorted(blocks[:3]))
+
+    @patch('kamaki.clients.pithos.data_extents', return_value=[(1500, 2100)])
+    def test__calculate_blocks_for_sparse_file(self, data_extents):
+        from StringIO import StringIO
+        from kamaki.clients.pithos import _pithos_hash
+        blocksize, data = 1024, urandom(4 * 1024 + 100)
+        zero_hash = _pithos_hash('\x00' * blocksize, 'sha256')
+        hashes, hmap, kept = [], {}, {}
+        self.client._calculate_blocks_for_upload(
+            blocksize, 'sha256', len(data), 5, hashes, hmap, StringIO(data),
+            blocks=kept)
+        #  blocks out of the data extents are holes, they are not read
+        self.assertEqual(hashes, [
+            zero_hash,
+            _pithos_hash(data[1024:2048], 'sha256'),
+            _pithos_hash(data[2048:3072], 'sha256'),
+            zero_hash, zero_hash])
+        self.assertEqual(hmap[zero_hash], (4096, 100))
+        self.assertEqual(sorted(kept), sorted(hashes[1:3]))
+
+    @patch('%s._put_block' % pithos_pkg)
+    def test__upload_missing_blocks(self, put_block):
+        from StringIO import StringIO
+        hmap = dict(h0=(0, 2), h1=(2, 2), h2=(4, 1))
+        blocks = dict(h1='b1')
+        f = StringIO('a0a1a')
+        failed = self.client._upload_missing_blocks(
+            ['h0', 'h1', 'h2'], hmap, f, blocks=blocks)
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            sorted([c[2]['data'] for c in put_block.mock_calls]),
+            ['a', 'a0', 'b1'])
+        self.assertEqual(blocks, {})
+
+    @patch('%s._put_block' % pithos_pkg)
+    @patch('%s.container_post' % pithos_pkg, return_value=FR())
+    def test__upload_missing_blocks_in_batches(self, CP, put_block):
+        from StringIO import StringIO
+        hmap = dict(
+            h0=(0, 2), h1=(2, 2), h2=(4, 2), h3=(6, 2), h4=(8, 2),
+            h5=(10, 1))
+        f = StringIO('a0a1a2a3a4a')
+        FR.json = ['h0', 'h1', 'h2']
+        acked = []
+        self.client.BATCH_SIZE = 6
+        try:
+            failed = self.client._upload_missing_blocks(
+                ['h0', 'h1', 'h2', 'h3', 'h5'], hmap, f,
+                ack=acked.append, blocksize=2)
+        finally:
+            del self.client.BATCH_SIZE
+        self.assertEqual(failed, ['h3', 'h5'])
+        self.assertEqual(acked, ['h0', 'h1', 'h2'])
+        self.assertEqual(
+            [(c[2]['data'], c[2]['content_length']) for c in CP.mock_calls],
+            [('a0a1a2', 6), ('a3a', 3)])
+        self.assertEqual(put_block.mock_calls, [])
+        self.assertEqual(
+            list(pithos._block_batches(
+                ['h0', 'h5', 'h1'], lambda h: f.getvalue()[slice(
+                    hmap[h][0], sum(hmap[h]))], 2, 4)),
+            [(['h0', 'h5'], ['a0', 'a']), (['h1'], ['a1'])])
+
+    @patch('%s.container_post' % pithos_pkg, return_value=FR())
+    def test__put_blocks(self, CP):
+        FR.json = ['h0', 'h1']
+        self.client._put_blocks([buffer('xxa0', 2), buffer('a1')], FR.json)
+        data = CP.mock_calls[-1][2]['data']
+        #  the buffers are copied once, into the body
+        self.assertTrue(isinstance(data, bytearray))
+        self.assertEqual(str(data), 'a0a1')
+        self.assertEqual(CP.mock_calls[-1][2]['content_length'], 4)
+
+    @patch('%s._put_blocks' % pithos_pkg)
+    def test__upload_missing_blocks_default_batch(self, put_blocks):
+        blocksize = container_info['x-container-block-size']
+        block, hashes = 'x' * blocksize, ['h%s' % i for i in range(10)]
+        blocks = dict([(h, block) for h in hashes])
+        hmap = dict([(h, (i * blocksize, blocksize)) for i, h in enumerate(
+            hashes)])
+        self.client._upload_missing_blocks(
+            hashes, hmap, None, blocks=blocks, blocksize=blocksize)
+        #  4 blocks of the default size per request
+        self.assertEqual(
+            sorted([len(c[2]['hashes']) for c in put_blocks.mock_calls]),
+            [2, 4, 4])
+
+    @patch('%s._put_block' % pithos_pkg)
+    def test__upload_missing_blocks_with_registry(self, put_block):
+        from StringIO import StringIO
+        from threading import Timer
+        hmap = dict(h0=(0, 2), h1=(2, 2), h2=(4, 2), h3=(6, 1))
+        f = StringIO('a0a1a2a')
+        registry = self.client.block_registry = pithos.BlockRegistry()
+        try:
+            registry.claim('h0')
+            registry.claim('h1')
+            registry.claim('h2')
+            registry.release('h2', True)
+            Timer(0.1, registry.release, args=('h0', True)).start()
+            Timer(0.1, registry.release, args=('h1', False)).start()
+            acked = []
+            failed = self.client._upload_missing_blocks(
+                ['h0', 'h1', 'h2', 'h3'], hmap, f, ack=acked.append)
+        finally:
+            self.client.block_registry = None
+        self.assertEqual(
+            [c[2]['hash'] for c in put_block.mock_calls], ['h3'])
+        self.assertEqual(acked, ['h3', 'h0', 'h2'])
+        self.assertEqual(failed, ['h1'])
+        self.assertEqual(registry.pending, {})
+        self.assertEqual(registry.uploaded, set(['h0', 'h2', 'h3']))
+
+    @patch('%s._calculate_blocks_for_upload' % pithos_pkg)
+    def test__hashes_for_upload(self, calculate):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from os import utime
+        path = mkdtemp()
+        try:
+            self.client.hash_cache = pithos.BlockHashCache(
+                '%s/hashes.db' % path)
+            with NamedTemporaryFile() as f:
+                f.write('a' * 250)
+                f.flush()
+                utime(f.name, (1000, 1000))
+                calculate.side_effect = lambda *args, **kwargs: (
+                    args[4].extend(['h0', 'h1', 'h2']))
+                for i in range(2):
+                    hashes, hmap = [], {}
+                    self.client._hashes_for_upload(
+                        100, 'sha256', 250, 3, hashes, hmap, f)
+                    self.assertEqual(hashes, ['h0', 'h1', 'h2'])
+                    self.assertEqual(len(calculate.mock_calls), 1)
+                self.assertEqual(hmap['h2'], (200, 50))
+                utime(f.name, (2000, 2000))
+                self.client._hashes_for_upload(
+                    100, 'sha256', 250, 3, [], {}, f)
+                self.assertEqual(len(calculate.mock_calls), 2)
+        finally:
+            self.client.hash_cache = None
+            rmtree(path)
+
     @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
     @patch('%s.container_post' % pithos_pkg, return_value=FR())
     @patch('%s.object_put' % pithos_pkg, return_value=FR())
@@ -972,6 +1251,147 @@ class PithosClient(TestCase):
         self.assertEqual(OP.mock_calls[-1][2]['if_etag_not_match'], '*')
         self.assertEqual(OP.mock_calls[-1][2]['etag'], etag)
 
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_upload_small_object(self, OP, GCI):
+        FR.headers = dict(etag='e')
+        cache, sent = dict(), []
+        #  the data is a buffer over a map, valid only during the upload
+        OP.side_effect = lambda *args, **kw: sent.append(
+            str(kw['data'])) or FR()
+        with NamedTemporaryFile() as f:
+            f.write('..small data')
+            f.flush()
+            f.seek(2)
+            r = self.client.upload_object(
+                obj, f, size=10, etag='e', if_not_exist=True, public=True,
+                sharing=dict(read=['u']), container_info_cache=cache)
+        self.assertEqual(r, FR.headers)
+        self.assertEqual(len(GCI.mock_calls), 1)
+        (args, kwargs) = OP.mock_calls[-1][1:3]
+        self.assertEqual(args, (obj, ))
+        self.assertEqual(sent, ['small data'])
+        for k, v in (
+                ('etag', 'e'), ('if_etag_not_match', '*'), ('public', True),
+                ('permissions', dict(read=['u'])), ('success', 201),
+                ('content_type', 'application/octet-stream')):
+            self.assertEqual(kwargs[k], v)
+        self.client.upload_from_string(
+            obj, 'small', content_type='ctype', container_info_cache=cache)
+        self.assertEqual(len(OP.mock_calls), 2)
+        (args, kwargs) = OP.mock_calls[-1][1:3]
+        self.assertEqual(kwargs['data'], 'small')
+        self.assertEqual(kwargs['content_type'], 'ctype')
+        self.assertEqual(len(GCI.mock_calls), 1)
+
+    @patch('%s.get_container_info' % pithos_pkg)
+    @patch('%s._upload_small_object' % pithos_pkg)
+    @patch('%s._create_object_or_get_missing_hashes' % pithos_pkg)
+    def test_upload_small_object_blocksize(self, missing, small, GCI):
+        GCI.return_value = dict(container_info)
+        GCI.return_value['x-container-block-size'] = 8
+        missing.return_value = (None, dict(etag='e'))
+        self.client.upload_from_string(obj, 'more than a block')
+        self.assertEqual(small.mock_calls, [])
+        self.assertEqual(len(missing.mock_calls), 1)
+
+    @patch('%s.create_directory' % pithos_pkg)
+    def test_create_directories(self, create_directory):
+        self.client.MAX_THREADS = 4
+        paths = ['d%s' % i for i in range(10)]
+        self.client.create_directories(paths)
+        self.assertEqual(
+            sorted([c[1][0] for c in create_directory.mock_calls]), paths)
+        create_directory.side_effect = ClientError('Forbidden', 403)
+        self.assertRaises(
+            ClientError, self.client.create_directories, paths)
+
+    @patch('%s.upload_object' % pithos_pkg, return_value=dict(etag='e'))
+    def test_upload_objects(self, upload_object):
+        uploads = [('o%s' % i, 'f%s' % i) for i in range(5)]
+        uploads.append(('o5', 'f5', dict(public=True)))
+        done = list(self.client.upload_objects(
+            iter(uploads), max_files=3, public=False))
+        self.assertEqual(
+            sorted([f.args for f in done]), [u[:2] for u in uploads])
+        self.assertEqual([f.value for f in done], [dict(etag='e')] * 6)
+        calls = dict([(c[1][0], c[2]) for c in upload_object.mock_calls])
+        self.assertEqual(calls['o0']['public'], False)
+        self.assertEqual(calls['o5']['public'], True)
+        self.assertTrue(
+            calls['o0']['container_info_cache'] is calls['o5'][
+                'container_info_cache'])
+
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s._put_blocks' % pithos_pkg)
+    @patch('%s._calculate_blocks_for_upload' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_upload_object_resume(self, OP, calculate, put_blocks, GCI):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        blocksize = container_info['x-container-block-size']
+        path = mkdtemp()
+        try:
+            journal = self.client.upload_journal = pithos.UploadJournal(path)
+            tmpFile = NamedTemporaryFile()
+            tmpFile.write('a' * blocksize + 'b' * blocksize + 'c')
+            tmpFile.flush()
+            name = '%s/%s/%s' % (
+                self.client.account, self.client.container, obj)
+            key = pithos.BlockHashCache.file_key(tmpFile)
+            hashes = ['ha', 'hb', 'hc']
+            journal.start(name, key, blocksize, 'sha256', hashes)
+            journal.ack(name, 'ha')
+            #  blocks are buffers over a map, valid only during the upload
+            sent = []
+            put_blocks.side_effect = lambda **kw: sent.extend(zip(
+                kw['hashes'], [str(d[:1]) for d in kw['data']]))
+            self.client.upload_object(obj, tmpFile)
+            self.assertEqual(calculate.mock_calls, [])
+            self.assertEqual(sorted(sent), [('hb', 'b'), ('hc', 'c')])
+            (args, kwargs) = OP.mock_calls[-1][1:3]
+            self.assertEqual(len(OP.mock_calls), 1)
+            self.assertEqual(
+                kwargs['json'], dict(bytes=2 * blocksize + 1, hashes=hashes))
+            self.assertEqual(
+                journal.load(name, key, blocksize, 'sha256'), None)
+        finally:
+            self.client.upload_journal = None
+            rmtree(path)
+
+    @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
+    @patch('%s._put_block' % pithos_pkg)
+    @patch('%s.object_put' % pithos_pkg, return_value=FR())
+    def test_upload_from_stream(self, OP, put_block, GCI):
+        from StringIO import StringIO
+        from kamaki.clients.pithos import _pithos_hash
+
+        class Stream(object):
+            """A pipe: no fileno, no seek"""
+            def __init__(self, data):
+                self.src = StringIO(data)
+
+            def read(self, size):
+                return self.src.read(size)
+
+        blocksize = container_info['x-container-block-size']
+        data = urandom(2 * blocksize + 7)
+        blocks = [data[:blocksize], data[blocksize:-7], data[-7:]]
+        FR.headers = dict(id='container id')
+        r = self.client.upload_from_stream(
+            obj, Stream(data), window=1, content_type='ctype')
+        self.assertEqual(r, FR.headers)
+        self.assertEqual(
+            [c[1] for c in put_block.mock_calls],
+            [(b, _pithos_hash(b, 'sha256')) for b in blocks])
+        (args, kwargs) = OP.mock_calls[-1][1:3]
+        self.assertEqual(args, (obj, ))
+        self.assertEqual(kwargs['json'], dict(
+            bytes=len(data),
+            hashes=[_pithos_hash(b, 'sha256') for b in blocks]))
+        self.assertEqual(kwargs['content_type'], 'ctype')
+        self.assertEqual(kwargs['success'], 201)
+
     @patch('%s.get_container_info' % pithos_pkg, return_value=container_info)
     @patch('%s.container_post' % pithos_pkg, return_value=FR())
     @patch('%s.object_put' % pithos_pkg, return_value=FR())
@@ -1291,6 +1711,8 @@ class PithosClient(TestCase):
     @patch('%s.object_get' % pithos_pkg, return_value=FR())
     def test_download_to_string(self, GET, GOH):
         FR.content = 'some sample content'
+        GET.return_value.status_code = 206
+        self.client.RANGE_SIZE = object_hashmap['block_size']
         num_of_blocks = len(object_hashmap['hashes'])
         r = self.client.download_to_string(obj)
         expected_content = FR.content * num_of_blocks
@@ -1318,6 +1740,291 @@ class PithosClient(TestCase):
                 GET.mock_calls[-1][2][k],
                 v or kwargs.get(k))
 
+    @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
+    @patch('%s.object_get' % pithos_pkg, return_value=FR())
+    def test_iter_object_blocks(self, GET, GOH):
+        FR.content = 'some sample content'
+        GET.return_value.status_code = 206
+        self.client.RANGE_SIZE = object_hashmap['block_size']
+        num_of_blocks = len(object_hashmap['hashes'])
+        blocks = self.client.iter_object_blocks(obj, version='v')
+        self.assertEqual(GET.mock_calls, [])
+        self.assertEqual(list(blocks), [FR.content] * num_of_blocks)
+        self.assertEqual(GET.mock_calls[-1][2]['version'], 'v')
+        chunks = list(self.client.iter_object_blocks(obj, chunk_size=7))
+        self.assertEqual(
+            chunks, ['some sa', 'mple co', 'ntent'] * num_of_blocks)
+        blocks = list(self.client.iter_object_blocks(obj, range_str='10-20'))
+        self.assertEqual(blocks, [FR.content])
+        self.assertEqual(GET.mock_calls[-1][2]['data_range'], 'bytes=10-20')
+
+    @patch('%s.object_get' % pithos_pkg)
+    def test__dump_blocks_in_order(self, GET):
+        from StringIO import StringIO
+        from time import sleep
+
+        class Block(FR):
+            status_code = 206
+
+            def __init__(self, data_range, **kwargs):
+                start, end = data_range[6:].split('-')
+                sleep(0.01 * (10 - int(start) // 10))
+                self.content = '%s-%s,' % (start, end)
+
+        GET.side_effect = lambda obj, **kwargs: Block(**kwargs)
+        dst = StringIO()
+        self.client.MAX_THREADS, self.client.RANGE_SIZE = 4, 10
+        self.client._dump_blocks_in_order(
+            obj, ['h'] * 10, 10, 95, dst, None, window=30, version='v')
+        self.assertEqual(dst.getvalue(), ''.join(
+            '%s-%s,' % (i, min(i + 9, 94)) for i in range(0, 95, 10)))
+        self.assertEqual(GET.mock_calls[-1][2]['version'], 'v')
+        dst = StringIO()
+        self.client._dump_blocks_in_order(
+            obj, ['h'] * 10, 10, 95, dst, '15-34', window=30)
+        self.assertEqual(dst.getvalue(), '15-19,20-29,30-34,')
+
+    @patch('%s.object_get' % pithos_pkg)
+    def test__iter_blocks_in_ranges(self, GET):
+        data = ''.join(chr(ord('a') + i) * 10 for i in range(9)) + 'jjjjj'
+
+        class Range(FR):
+            status_code = 206
+
+            def __init__(self, data_range, **kwargs):
+                start, end = data_range[6:].split('-')
+                self.content = data[int(start):int(end) + 1]
+
+        GET.side_effect = lambda obj, **kwargs: Range(**kwargs)
+        self.client.RANGE_SIZE = 40
+        blocks = list(self.client._iter_blocks(
+            obj, ['h'] * 10, 10, 95, None, window=80))
+        self.assertEqual(blocks, [c * 10 for c in 'abcdefghi'] + ['jjjjj'])
+        self.assertEqual(
+            [c[2]['data_range'] for c in GET.mock_calls],
+            ['bytes=0-39', 'bytes=40-79', 'bytes=80-94'])
+        blocks = list(self.client._iter_blocks(
+            obj, ['h'] * 10, 10, 95, '15-44', window=80))
+        self.assertEqual(blocks, ['b' * 5, 'c' * 10, 'd' * 10, 'e' * 5])
+        self.assertEqual(GET.mock_calls[-1][2]['data_range'], 'bytes=40-44')
+
+    @patch('%s.object_get' % pithos_pkg)
+    def test__iter_blocks_concurrency(self, GET):
+        from threading import Condition
+        from time import time
+        blocksize, flying = object_hashmap['block_size'], [0, 0]
+        cond = Condition()
+
+        def get(obj, data_range, **kwargs):
+            with cond:
+                flying[0] += 1
+                flying[1] = max(flying)
+                cond.notify_all()
+                deadline = time() + 1
+                while flying[1] < 8 and time() < deadline:
+                    cond.wait(deadline - time())
+                flying[0] -= 1
+            r = FR()
+            r.status_code, r.content = 206, ''
+            return r
+
+        GET.side_effect = get
+        self.client.MAX_THREADS = 8
+        self.client._concurrency_limit().limit = 8
+        list(self.client._iter_blocks(
+            obj, ['h'] * 32, blocksize, 32 * blocksize, None))
+        #  the default window holds a request per thread
+        self.assertEqual(flying[1], 8)
+        self.assertEqual(len(GET.mock_calls), 16)
+
+    @patch('%s.object_get' % pithos_pkg)
+    def test__stream_blocks(self, GET):
+        class Range(FR):
+            def iter_content(self):
+                return ['aaab', 'bbc']
+
+        GET.return_value = Range()
+        written = []
+        size = self.client._stream_blocks(
+            obj, lambda *args: written.append(args), [[0], [3, 30], [6]], 3,
+            [(0, 6)])
+        self.assertEqual(size, 7)
+        self.assertEqual(written, [
+            (0, 'aaa'), (3, 'b'), (30, 'b'), (4, 'bb'), (31, 'bb'),
+            (6, 'c')])
+        self.assertEqual(
+            GET.mock_calls[-1][2]['async_headers'], dict(Range='bytes=0-6'))
+
+    @patch('%s.object_get' % pithos_pkg)
+    def test__stream_blocks_missing_ranges(self, GET):
+        class Single(FR):
+            status_code = 206
+
+            def __init__(self, async_headers, **kwargs):
+                start, end = async_headers['Range'][6:].split('-')[:2]
+                start, end = int(start), int(end.split(',')[0])
+                self.headers = {
+                    'content-range': 'bytes %s-%s/100' % (start, end)}
+                self.content = data[start:end + 1]
+
+        data = ''.join(chr(ord('a') + i) for i in range(20))
+        GET.side_effect = lambda obj, **kwargs: Single(**kwargs)
+        written = []
+        size = self.client._stream_blocks(
+            obj, lambda *args: written.append(args), [[0], [9, 15]], 3,
+            [(0, 2), (9, 11)])
+        self.assertEqual(size, 6)
+        self.assertEqual(written, [
+            (0, 'abc'), (9, 'jkl'), (15, 'jkl')])
+        self.assertEqual(
+            [c[2]['async_headers']['Range'] for c in GET.mock_calls],
+            ['bytes=0-2,9-11', 'bytes=9-11'])
+
+    @patch('%s.object_get' % pithos_pkg)
+    def test__dump_blocks_async_gaps(self, GET):
+        from hashlib import sha256
+        local = ''.join(c * 10 for c in 'abcdef')
+        GET.return_value = FR()
+        GET.return_value.content = local.upper()
+        remote_hashes = dict(x1=[1], x3=[3], x5=[5])
+        for i in (0, 2, 4):
+            remote_hashes[sha256(local[i * 10:i * 10 + 10]).hexdigest()] = [i]
+        with NamedTemporaryFile() as f:
+            f.write(local)
+            f.flush()
+            self.client._dump_blocks_async(
+                obj, remote_hashes, 10, 60, f, blockhash='sha256',
+                resume=True)
+            f.seek(0)
+            self.assertEqual(
+                f.read(), ''.join(c * 10 for c in 'aBcDeF'))
+        #  resume gaps are fetched in one multi-range request
+        self.assertEqual(len(GET.mock_calls), 1)
+        self.assertEqual(
+            GET.mock_calls[-1][2]['async_headers'],
+            dict(Range='bytes=10-19,30-39,50-59'))
+
+    @patch('%s.object_get' % pithos_pkg)
+    def test__dump_blocks_async_progress(self, GET):
+        class Range(FR):
+            def iter_content(self):
+                return ['abcdef']
+
+        GET.return_value, steps = Range(), []
+
+        def progress():
+            while True:
+                steps.append(1)
+                yield
+
+        self.client.progress_bar_gen = progress()
+        with NamedTemporaryFile() as f:
+            self.client._dump_blocks_async(
+                obj, dict(h0=[0], hx=[1, 2, 3]), 10, 40, f, filerange='0-5')
+            f.seek(0)
+            self.assertEqual(f.read(), 'abcdef')
+        self.assertEqual(len(GET.mock_calls), 1)
+        #  the skipped block is at 3 positions
+        self.assertEqual(len(steps), 4)
+
+    @patch('%s.object_get' % pithos_pkg)
+    def test__get_ranges(self, GET):
+        body = (
+            '--XYZ\r\nContent-Type: text/plain\r\n'
+            'Content-Range: bytes 2-4/100\r\n\r\nabc\r\n'
+            '--XYZ\r\nContent-Range: bytes 50-51/100\r\n\r\nde\r\n'
+            '--XYZ--\r\n')
+
+        class Multipart(FR):
+            status_code = 206
+            headers = {
+                'content-type': 'multipart/byteranges; boundary=XYZ'}
+
+            def iter_content(self):
+                return [body[i:i + 5] for i in range(0, len(body), 5)]
+
+        class Single(FR):
+            status_code = 206
+
+            def __init__(self, data_range):
+                start, end = data_range[6:].split('-')
+                self.headers = {
+                    'content-range': 'bytes %s-%s/100' % (start, end)}
+                self.content = 'x' * (int(end) - int(start) + 1)
+
+        multi = [Multipart()]
+        GET.side_effect = lambda obj, data_range, **kwargs: multi[0] if (
+            ',' in data_range) else Single(data_range)
+
+        def received(pieces):
+            r = dict()
+            for position, piece in pieces:
+                for i, c in enumerate(piece):
+                    r[position + i] = c
+            return r
+
+        pieces = self.client._get_ranges(obj, [(2, 4), (50, 51)])
+        self.assertEqual(
+            GET.mock_calls[-1][2]['data_range'], 'bytes=2-4,50-51')
+        self.assertEqual(
+            received(pieces), dict(zip([2, 3, 4, 50, 51], 'abcde')))
+
+        #  missing parts are requested one by one
+        pieces = self.client._get_ranges(obj, [(2, 4), (50, 51), (60, 70)])
+        self.assertEqual(len(GET.mock_calls), 3)
+        self.assertEqual(GET.mock_calls[-1][2]['data_range'], 'bytes=60-70')
+        self.assertEqual(
+            [p for p, d in pieces], sorted(p for p, d in pieces))
+        self.assertEqual(received(pieces), dict(
+            zip([2, 3, 4, 50, 51], 'abcde') + [(i, 'x') for i in range(
+                60, 71)]))
+
+        #  a single range for a multi-range request
+        multi[0] = FR()
+        multi[0].status_code, multi[0].content = 206, 'abc'
+        multi[0].headers = {'content-range': 'bytes 2-4/100'}
+        pieces = self.client._get_ranges(obj, [(2, 4), (50, 51)])
+        self.assertEqual(len(GET.mock_calls), 5)
+        self.assertEqual(GET.mock_calls[-1][2]['data_range'], 'bytes=50-51')
+        self.assertEqual(pieces, [(2, 'abc'), (50, 'xx')])
+
+        #  the whole object, when the server ignores ranges
+        multi[0] = FR()
+        multi[0].content = ''.join(chr(ord('a') + i % 26) for i in range(100))
+        pieces = self.client._get_ranges(obj, [(2, 4), (50, 51)])
+        self.assertEqual(len(GET.mock_calls), 6)
+        self.assertEqual(pieces, [(2, 'cde'), (50, 'yz')])
+
+        multi[0], body = Multipart(), body[:60]
+        self.assertRaises(
+            ClientError, self.client._get_ranges, obj, [(2, 4), (50, 51)])
+
+    def test__parse_ranges(self):
+        self.assertEqual(
+            pithos._parse_ranges('50-60,0-5,6-9,55-70,80-80'),
+            [(0, 9), (50, 70), (80, 80)])
+        self.assertEqual(
+            list(pithos._group_ranges(
+                [(0, 9), (20, 21), (30, 31), (40, 44)], 2, 5)),
+            [[(0, 4)], [(5, 9)], [(20, 21), (30, 31)], [(40, 44)]])
+
+    def test__file_writer(self):
+        from StringIO import StringIO
+        from threading import Thread
+        chunks = [(i * 100, chr(ord('a') + i) * 100) for i in range(10)]
+        for f in (NamedTemporaryFile(), StringIO()):
+            write_at = self.client._file_writer(f, offset=5)
+            threads = [
+                Thread(target=write_at, args=chunk) for chunk in chunks]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            f.seek(0)
+            self.assertEqual(
+                f.read(), '\x00' * 5 + ''.join(c for p, c in chunks))
+            f.close()
+
     @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
     @patch('%s.object_get' % pithos_pkg, return_value=FR())
     def test_download_object(self, GET, GOH):
@@ -1336,6 +2043,7 @@ class PithosClient(TestCase):
             if_unmodified_since='this happens if not!',
             async_headers=dict(Range='bytes=0-88888888'))
 
+        self.client.RANGE_SIZE = object_hashmap['block_size']
         self.client.download_object(obj, tmpFile)
         self.assertEqual(len(GET.mock_calls), num_of_blocks)
         self.assertEqual(GET.mock_calls[-1][1], (obj,))
@@ -1404,6 +2112,24 @@ class PithosClient(TestCase):
             else:
                 self.assertEqual(GET.mock_calls[-1][2][k], v)
 
+    @patch('%s.get_object_hashmap' % pithos_pkg, return_value=object_hashmap)
+    @patch('%s.object_get' % pithos_pkg, return_value=FR())
+    def test_download_object_in_ranges(self, GET, GOH):
+        FR.content = ''
+        blocksize = object_hashmap['block_size']
+        with NamedTemporaryFile() as f:
+            self.client.download_object(obj, f)
+            self.assertEqual(len(GET.mock_calls), 1)
+            self.assertEqual(
+                GET.mock_calls[-1][2]['async_headers'],
+                dict(Range='bytes=0-%s' % (8 * blocksize - 1)))
+            self.client.download_object(
+                obj, f, range_str='10-%s' % (3 * blocksize))
+            self.assertEqual(len(GET.mock_calls), 2)
+            self.assertEqual(
+                GET.mock_calls[-1][2]['async_headers'],
+                dict(Range='bytes=10-%s' % (3 * blocksize)))
+
     def test_get_object_hashmap(self):
         FR.json = object_hashmap
         for empty in (304, 412):
@@ -1853,5 +2579,14 @@ if __name__ == '__main__':
     if not argv[1:] or argv[1] == 'PithosMethods':
         not_found = False
         runTestCase(PithosRestClient, 'Pithos Methods', argv[2:])
+    if not argv[1:] or argv[1] == 'BlockHashCache':
+        not_found = False
+        runTestCase(BlockHashCache, 'Block Hash Cache', argv[2:])
+    if not argv[1:] or argv[1] == 'UploadJournal':
+        not_found = False
+        runTestCase(UploadJournal, 'Upload Journal', argv[2:])
+    if not argv[1:] or argv[1] == 'BlockRegistry':
+        not_found = False
+        runTestCase(BlockRegistry, 'Block Registry', argv[2:])
     if not_found:
         print('TestCase %s not found' % argv[1])
@@ -43,6 +43,12 @@ class StorageClient(Client):
         self.account = account
         self.container = container
 
+    def _path_template(self, path):
+        """:returns: (str) /{account}[/{container}[/{object}]]"""
+        parts = path.split('?')[0].strip('/').split('/', 2)
+        names = ('{account}', '{container}', '{object}')
+        return '/' + '/'.join(names[:len(parts)]) if parts[0] else '/'
+
     def _assert_account(self):
         if not self.account:
             raise ClientError("No account provided")
@@ -36,7 +36,6 @@ from unittest import makeSuite, TestSuite, TextTestRunner, TestCase
 from time import sleep
 from inspect import getmembers, isclass
 from itertools import product
-from random import randint
 
 from kamaki.clients.utils.test import Utils
 from kamaki.clients.astakos.test import (
@@ -49,9 +48,11 @@ from kamaki.clients.cyclades.test import (
 from kamaki.clients.image.test import ImageClient
 from kamaki.clients.storage.test import StorageClient
 from kamaki.clients.pithos.test import (
-    PithosClient, PithosRestClient, PithosMethods)
+    PithosClient, PithosRestClient, PithosMethods, BlockHashCache,
+    UploadJournal, BlockRegistry)
 from kamaki.clients.blockstorage.test import (
     BlockStorageRestClient, BlockStorageClient)
+from kamaki.clients.benchmark.test import StandInServer, Benchmark
 
 
 class ClientError(TestCase):
@@ -127,15 +128,71 @@ class RequestManager(TestCase):
             self.assertEqual(req.headers, headers)
         self.assertRaises(AssertionError, self.RM, 'GOT', '', '', '', {}, {})
 
+    @patch('httplib.HTTPConnection.connect')
     @patch('httplib.HTTPConnection.getresponse')
     @patch('httplib.HTTPConnection.request')
-    def test_perform(self, request, getresponse):
+    def test_perform(self, request, getresponse, connect):
         from httplib import HTTPConnection
-        self.RM('GET', 'http://example.com', '/').perform(
-            HTTPConnection('http', 'example.com'))
+        from kamaki.clients import TIMEOUT
+        conn = HTTPConnection('http', 'example.com')
+        self.RM('GET', 'http://example.com', '/').perform(conn)
         expected = dict(body=None, headers={}, url='/', method='GET')
         request.assert_called_once_with(**expected)
         getresponse.assert_called_once_with()
+        connect.assert_called_once_with()
+        self.assertEqual(conn.timeout, TIMEOUT)
+
+        conn = HTTPConnection('http', 'example.com')
+        rm = self.RM('GET', 'http://example.com', '/', connect_timeout=4.2)
+        rm.perform(conn)
+        self.assertEqual(conn.timeout, 4.2)
+
+    @patch('httplib.HTTPConnection.connect')
+    @patch('httplib.HTTPConnection.getresponse')
+    @patch('httplib.HTTPConnection.request')
+    def test_perform_quoted_headers(self, request, getresponse, connect):
+        from httplib import HTTPConnection
+        rm = self.RM('PUT', 'http://example.com', '/', headers={
+            'X-Image-Meta-Name': u'caf\xe9 ok',
+            'X-Image-Meta-Property-Os': 'a b', 'X-Other': 'c d'})
+        rm.headers_to_quote = ['X-Image-Meta-Name']
+        rm.header_prefices = ['X-Image-Meta-Property-']
+        expected = {
+            'X-Image-Meta-Name': 'caf%C3%A9%20ok',
+            'X-Image-Meta-Property-Os': 'a%20b', 'X-Other': 'c d'}
+        #  e.g., a retry
+        for i in range(2):
+            rm.perform(HTTPConnection('http', 'example.com'))
+            self.assertEqual(request.mock_calls[-1][2]['headers'], expected)
+
+    @patch('httplib.HTTPConnection.connect')
+    @patch('httplib.HTTPConnection.request')
+    def test_perform_timeout(self, request, connect):
+        from httplib import HTTPConnection
+        from socket import timeout
+        with patch(
+                'httplib.HTTPConnection.getresponse',
+                side_effect=timeout('timed out')):
+            self.assertRaises(
+                timeout,
+                self.RM('GET', 'http://example.com', '/', timeout=1).perform,
+                HTTPConnection('http', 'example.com'))
+
+    def test_read_deadline(self):
+        from socket import timeout
+        from time import sleep, time
+
+        class Trickle(object):
+            def read(self, amt=None):
+                sleep(0.01)
+                return 'x'
+
+        req = self.RM('GET', 'http://example.com', '/', timeout=0.1)
+        self.assertEqual(req.read(Trickle(), 1), 'x')
+        req.deadline = time() + 0.1
+        start = time()
+        self.assertRaises(timeout, req.read, Trickle())
+        self.assertTrue(time() - start < 0.5)
 
 
 class FakeResp(object):
@@ -152,6 +209,23 @@ class FakeResp(object):
     def getheaders(self):
         return self.HEADERS.items()
 
+    def getheader(self, name, default=None):
+        return self.HEADERS.get(name, default)
+
+
+class FakeStreamResp(FakeResp):
+
+    def __init__(self):
+        self._pos = 0
+
+    def read(self, amt=None):
+        end = len(self.READ) if amt is None else self._pos + amt
+        chunk, self._pos = self.READ[self._pos:end], min(end, len(self.READ))
+        return chunk
+
+    def isclosed(self):
+        return self._pos >= len(self.READ)
+
 
 class ResponseManager(TestCase):
 
@@ -205,6 +279,175 @@ class ResponseManager(TestCase):
         self.assertEqual(self.RM.json, FakeResp.HEADERS)
         self.assertTrue(isinstance(perform.call_args[0][0], self.HTTPC))
 
+    def test_iter_content(self):
+        from kamaki.clients import ResponseManager, RequestManager
+        for stream in (False, True):
+            FakeResp.READ = 'something to read'
+            with patch(
+                    'kamaki.clients.RequestManager.perform',
+                    return_value=FakeStreamResp()) as perform:
+                rm = ResponseManager(
+                    RequestManager('GET', 'http://ok', '/'), stream=stream)
+                chunks = list(rm.iter_content(4))
+                self.assertEqual(''.join(chunks), FakeResp.READ)
+                if stream:
+                    self.assertEqual(len(chunks), 5)
+                    self.assertEqual(rm._pooled, None)
+                    self.assertEqual(rm._response, None)
+                else:
+                    self.assertEqual(chunks, [FakeResp.READ])
+                self.assertTrue(isinstance(
+                    perform.call_args[0][0], self.HTTPC))
+
+    @patch(
+        'kamaki.clients.RequestManager.perform', return_value=FakeStreamResp())
+    def test_content_stream(self, perform):
+        from kamaki.clients import ResponseManager, RequestManager
+        rm = ResponseManager(
+            RequestManager('GET', 'http://ok', '/'), stream=True)
+        self.assertEqual(rm.status_code, FakeResp.status)
+        self.assertEqual(rm._content, None)
+        self.assertEqual(rm.content, FakeResp.READ)
+        self.assertEqual(rm.text, FakeResp.READ)
+        self.assertEqual(rm._response, None)
+
+    @patch('kamaki.clients.sleep')
+    def test_retry(self, sleep):
+        from kamaki.clients import (
+            ResponseManager, RequestManager, RetryPolicy, ClientError)
+        from httplib import BadStatusLine
+        busy = FakeResp()
+        busy.status, busy.HEADERS = 503, dict(FakeResp.HEADERS)
+        busy.HEADERS['retry-after'] = '2'
+        gateway = FakeResp()
+        gateway.status = 502
+        for method, responses, idempotent, exp_status, exp_sleeps in (
+                ('GET', [busy, FakeResp()], None, 42, [2.0]),
+                ('POST', [busy, FakeResp()], None, 42, [2.0]),
+                ('GET', [gateway, FakeResp()], None, 42, [0.05]),
+                ('POST', [gateway, FakeResp()], None, 502, []),
+                ('POST', [gateway, FakeResp()], True, 42, [0.05]),
+                ('GET', [gateway] * 4, None, 502, [0.05, 0.1, 0.2])):
+            sleep.reset_mock()
+            with patch(
+                    'kamaki.clients.RequestManager.perform',
+                    side_effect=responses):
+                with patch('kamaki.clients.uniform', side_effect=max):
+                    rm = ResponseManager(
+                        RequestManager(method, 'http://ok', '/'),
+                        retry_policy=RetryPolicy(),
+                        idempotent=idempotent)
+                    self.assertEqual(rm.status_code, exp_status)
+            self.assertEqual(
+                [c[0][0] for c in sleep.call_args_list], exp_sleeps)
+
+        def lost(conn):
+            rm.request.sent = True
+            raise BadStatusLine('')
+
+        for method, exp_sleeps in (('GET', 3), ('POST', 0)):
+            sleep.reset_mock()
+            with patch(
+                    'kamaki.clients.RequestManager.perform',
+                    side_effect=lost):
+                rm = ResponseManager(
+                    RequestManager(method, 'http://ok', '/'),
+                    retry_policy=RetryPolicy())
+                self.assertRaises(ClientError, rm._get_response)
+            self.assertEqual(len(sleep.call_args_list), exp_sleeps)
+
+    @patch('kamaki.clients.sleep')
+    def test_retry_timeout(self, sleep):
+        from kamaki.clients import (
+            ResponseManager, RequestManager, RetryPolicy, ClientError)
+        from socket import timeout
+
+        def slow(conn):
+            rm.request.sent = True
+            raise timeout('timed out')
+
+        for method, exp_sleeps in (('GET', 3), ('POST', 0)):
+            sleep.reset_mock()
+            with patch(
+                    'kamaki.clients.RequestManager.perform',
+                    side_effect=slow):
+                rm = ResponseManager(
+                    RequestManager(method, 'http://ok', '/'),
+                    retry_policy=RetryPolicy())
+                self.assertRaises(ClientError, rm._get_response)
+            self.assertEqual(len(sleep.call_args_list), exp_sleeps)
+        with patch(
+                'kamaki.clients.RequestManager.perform',
+                side_effect=[timeout('timed out'), FakeResp()]):
+            rm = ResponseManager(
+                RequestManager('GET', 'http://ok', '/'),
+                retry_policy=RetryPolicy())
+            self.assertEqual(rm.status_code, FakeResp.status)
+
+    @patch('kamaki.clients.sleep')
+    def test_retry_reported(self, sleep):
+        from kamaki.clients import (
+            ResponseManager, RequestManager, RetryPolicy, Future)
+        busy, missing = FakeResp(), FakeResp()
+        busy.status, missing.status = 503, 404
+
+        def get():
+            return ResponseManager(
+                RequestManager('GET', 'http://ok', '/'),
+                retry_policy=RetryPolicy()).status_code
+
+        for responses, exp_retries, exp_overloaded in (
+                ([FakeResp()], 0, False),
+                ([busy, busy, FakeResp()], 2, True),
+                ([missing], 0, False)):
+            with patch(
+                    'kamaki.clients.RequestManager.perform',
+                    side_effect=responses):
+                future = Future(get)
+                future.run()
+            self.assertEqual(future.value, responses[-1].status)
+            self.assertEqual(future.retries, exp_retries)
+            self.assertEqual(future.overloaded, exp_overloaded)
+
+    def test_hooks(self):
+        from kamaki.clients import ResponseManager, RequestManager
+        for stream in (False, True):
+            events = []
+            FakeResp.READ = 'something to read'
+            with patch(
+                    'kamaki.clients.RequestManager.perform',
+                    return_value=FakeStreamResp()):
+                rm = ResponseManager(
+                    RequestManager(
+                        'PUT', 'http://ok', '/a/42', data='data', params=dict(
+                            k='v')),
+                    stream=stream, hooks=[events.append])
+                self.assertEqual(rm.status_code, FakeResp.status)
+                self.assertEqual(len(events), 0 if stream else 1)
+                self.assertEqual(rm.content, FakeResp.READ)
+            self.assertEqual(len(events), 1)
+            event = events[0]
+            self.assertEqual(event['error'], None)
+            self.assertEqual(
+                (event['method'], event['path'], event['status']),
+                ('PUT', '/a/42', FakeResp.status))
+            self.assertEqual(event['bytes_sent'], 4)
+            self.assertEqual(event['bytes_received'], len(FakeResp.READ))
+            self.assertEqual(event['retries'], 0)
+            self.assertTrue(event['total_time'] >= 0)
+
+        def fail(*args):
+            raise ValueError('failure')
+
+        events = []
+        with patch('kamaki.clients.RequestManager.perform', side_effect=fail):
+            rm = ResponseManager(
+                RequestManager('GET', 'http://ok', '/'),
+                hooks=[fail, events.append], path_template='/{id}')
+            self.assertRaises(ValueError, rm._get_response)
+        self.assertEqual(events[0]['error'], 'failure')
+        self.assertEqual(events[0]['path'], '/{id}')
+
     @patch('kamaki.clients.RequestManager.perform', return_value=FakeResp())
     def test_all(self, perform):
         self.assertEqual(self.RM.content, FakeResp.READ)
@@ -269,6 +512,412 @@ class SilentEvent(TestCase):
                 self.assertFalse(t.exception)
 
 
+class Future(TestCase):
+
+    def setUp(self):
+        from kamaki.clients import Future
+        self.F = Future
+
+    def test_run(self):
+        f = self.F(lambda x, y=0: x + y, 40, y=2)
+        self.assertTrue(f.isAlive())
+        f.run()
+        self.assertFalse(f.isAlive())
+        self.assertEqual(f.value, 42)
+        self.assertFalse(f.exception)
+        self.assertEqual(f.result(), 42)
+
+        def fail():
+            raise ValueError('failed')
+        f = self.F(fail)
+        f.run()
+        self.assertTrue(isinstance(f.exception, ValueError))
+        self.assertRaises(ValueError, f.result)
+
+    def test_add_done_callback(self):
+        done = []
+        f = self.F(lambda: 42)
+        f.add_done_callback(done.append)
+        self.assertEqual(done, [])
+        f.run()
+        self.assertEqual(done, [f])
+        f.add_done_callback(done.append)
+        self.assertEqual(done, [f, f])
+
+    def test_cancel(self):
+        from kamaki.clients import ClientError
+        calls = []
+        f = self.F(calls.append, 'called')
+        self.assertTrue(f.cancel())
+        f.run()
+        self.assertEqual(calls, [])
+        self.assertTrue(f.cancelled)
+        self.assertTrue(isinstance(f.exception, ClientError))
+        f = self.F(calls.append, 'called')
+        f.run()
+        self.assertFalse(f.cancel())
+        self.assertEqual(calls, ['called'])
+
+
+class WorkerPool(TestCase):
+
+    def setUp(self):
+        from kamaki.clients import WorkerPool, Future
+        self.pool = WorkerPool(3)
+        self.F = Future
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_run(self):
+        from threading import Lock
+        lock, flying, max_flying = Lock(), [0], [0]
+
+        def task(i):
+            with lock:
+                flying[0] += 1
+                max_flying[0] = max(max_flying[0], flying[0])
+            sleep(0.01 * (i % 3))
+            with lock:
+                flying[0] -= 1
+            return i
+
+        for limit, exp_max in ((2, 2), (None, 3), (lambda: 1, 1)):
+            max_flying[0] = 0
+            futures = [self.F(task, i) for i in range(9)]
+            results = [f.value for f in self.pool.run(futures, limit=limit)]
+            self.assertEqual(sorted(results), range(9))
+            self.assertTrue(max_flying[0] <= exp_max)
+
+    def test_resize(self):
+        self.assertEqual(self.pool.size, 3)
+        self.pool.resize(5)
+        self.assertEqual(self.pool.size, 5)
+        self.pool.resize(1)
+        self.assertEqual(self.pool.size, 1)
+        self.assertRaises(AssertionError, self.pool.resize, 0)
+        f = self.pool.submit(self.F(lambda: 42))
+        self.assertEqual(f.result(4), 42)
+
+    def test_resize_wakes_submitters(self):
+        from threading import Event, Thread
+        release = Event()
+        pool = self.pool.__class__(1)
+        for i in range(3):
+            pool.submit(self.F(release.wait, 10))
+        submitters = [Thread(target=pool.submit, args=(
+            self.F(release.wait, 10), )) for i in range(3)]
+        for t in submitters:
+            t.daemon = True
+            t.start()
+        pool.resize(2)
+        for t in submitters:
+            t.join(0.5)
+        self.assertFalse(any([t.is_alive() for t in submitters]))
+        release.set()
+        pool.shutdown(timeout=2.0)
+
+    def test_shutdown(self):
+        self.pool.shutdown(timeout=2.0)
+        self.assertTrue(self.pool.closed)
+        self.assertFalse(any([w.is_alive() for w in self.pool._workers]))
+        self.assertRaises(AssertionError, self.pool.submit, self.F(sleep, 0))
+        from kamaki.clients import get_worker_pool
+        pool = get_worker_pool(2)
+        pool.shutdown()
+        self.assertFalse(pool is get_worker_pool(2))
+
+
+class RequestAggregator(TestCase):
+
+    def test_summary(self):
+        from kamaki.clients import RequestAggregator
+        agg = RequestAggregator()
+        event = dict(
+            method='GET', path='/p', status=200, bytes_sent=0,
+            bytes_received=10, connect_time=0.1, ttfb=0.2, total_time=1.0,
+            retries=0, error=None)
+        agg(event)
+        agg(dict(event, status=503, retries=2, total_time=3.0))
+        agg(dict(event, method='PUT', path='/q', bytes_sent=5))
+        agg(dict(event, method='PUT', path='/q', status=None, error='err'))
+        get, put = agg.summary()
+        self.assertEqual((get['method'], get['path']), ('GET', '/p'))
+        for k, v in dict(
+                requests=2, errors=1, retries=2, bytes_received=20,
+                total_time=4.0, max_time=3.0).items():
+            self.assertEqual(get[k], v)
+        self.assertEqual((put['errors'], put['bytes_sent']), (1, 5))
+
+
+class JSONLinesWriter(TestCase):
+
+    def test_call(self):
+        from kamaki.clients import JSONLinesWriter
+        from StringIO import StringIO
+        from json import loads
+        buf = StringIO()
+        writer = JSONLinesWriter(buf)
+        writer(dict(method='GET', path='/p'))
+        writer(dict(method='PUT', path='/q'))
+        lines = [loads(l) for l in buf.getvalue().splitlines()]
+        self.assertEqual([l['method'] for l in lines], ['GET', 'PUT'])
+        self.assertTrue('time' in lines[0])
+
+
+class ResponseCache(TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.path)
+
+    def test_set_get(self):
+        from kamaki.clients import ResponseCache
+        cache = ResponseCache(self.path)
+        url, text = 'http://a/flavors', u'{"flavors": []}'
+        self.assertEqual(cache.get(url, 't0k3n'), None)
+        self.assertEqual(cache.set(url, 't0k3n', dict(), text), None)
+        self.assertEqual(cache.get(url, 't0k3n'), None)
+        entry = cache.set(url, 't0k3n', {'ETag': '"e"'}, text)
+        self.assertEqual(cache.get(url, 't0k3n'), entry)
+        self.assertEqual(cache.get(url, 'other'), None)
+        self.assertEqual(cache.get('%s/detail' % url, 't0k3n'), None)
+        self.assertEqual(cache.validators(entry), {'If-None-Match': '"e"'})
+        self.assertFalse(cache.is_fresh(entry))
+        from os import listdir, stat
+        for name in listdir(self.path):
+            self.assertFalse('t0k3n' in open('%s/%s' % (
+                self.path, name)).read())
+            self.assertEqual(stat('%s/%s' % (
+                self.path, name)).st_mode & 0077, 0)
+
+    def test_new_dir(self):
+        from os import stat
+        from kamaki.clients import ResponseCache
+        cache = ResponseCache('%s/new' % self.path, ttl=60)
+        cache.set('http://a/x', 't', dict(), u'{}')
+        self.assertEqual(stat(cache.path).st_mode & 0077, 0)
+
+    def test_ttl(self):
+        from kamaki.clients import ResponseCache
+        cache = ResponseCache(self.path, ttl=60)
+        entry = cache.set('http://a/x', 't', dict(), u'{}')
+        self.assertTrue(cache.is_fresh(entry))
+        self.assertEqual(cache.validators(entry), dict())
+        entry['time'] -= 120
+        self.assertFalse(cache.is_fresh(entry))
+        cache.refresh('http://a/x', 't', entry)
+        self.assertTrue(cache.is_fresh(cache.get('http://a/x', 't')))
+
+
+class ConnectionStats(TestCase):
+
+    def setUp(self):
+        from kamaki.clients import ConnectionStats
+        self.stats = ConnectionStats()
+
+    def test_count(self):
+        self.stats.count(opened=1)
+        self.stats.count(opened=2, reused=3)
+        self.stats.count_wait(0.0001)
+        self.stats.count_wait(0.5)
+        self.assertEqual(self.stats.as_dict(), dict(
+            opened=3, reused=3, discarded=0, waited=1, wait_time=0.5))
+
+    def test_release(self):
+        class FakeConn(object):
+            def __init__(self, sock):
+                self.sock = sock
+
+            def close(self):
+                self.sock = None
+
+        class FakePooled(object):
+            def __init__(self, sock, cleanup=False):
+                self.obj, self.cleanup = FakeConn(sock), cleanup
+
+            def release(self):
+                if self.cleanup:
+                    self.obj.close()
+                self.released = True
+
+        for pooled, close, exp in (
+                (FakePooled('a socket'), False, 0),
+                (FakePooled('a socket'), True, 1),
+                (FakePooled('a socket', cleanup=True), False, 2),
+                (FakePooled(None), True, 2)):
+            self.stats.release(pooled, close=close)
+            self.assertTrue(pooled.released)
+            self.assertEqual(self.stats.discarded, exp)
+
+    @patch('kamaki.clients.RequestManager.perform', return_value=FakeResp())
+    def test_get_connection_stats(self, perform):
+        from kamaki.clients import (
+            get_connection_stats, ResponseManager, RequestManager)
+        stats = get_connection_stats('stats.example.com')
+        self.assertTrue(stats is get_connection_stats('stats.example.com'))
+        ResponseManager(
+            RequestManager('GET', 'http://stats.example.com', '/')).content
+        self.assertEqual((stats.opened, stats.reused), (1, 0))
+
+
+class RetryPolicy(TestCase):
+
+    def setUp(self):
+        from kamaki.clients import RetryPolicy
+        self.policy = RetryPolicy(budget=2, budget_ratio=0.5)
+
+    def test_delay(self):
+        from email.utils import formatdate
+        from time import time
+        with patch('kamaki.clients.uniform', side_effect=max):
+            for attempt, exp in ((0, 0.05), (2, 0.2), (10, 5.0)):
+                self.assertEqual(self.policy.delay(attempt), exp)
+        self.assertEqual(self.policy.delay(0, retry_after='3'), 3.0)
+        self.assertEqual(self.policy.delay(0, retry_after='300'), 30.0)
+        delay = self.policy.delay(0, retry_after=formatdate(time() + 10))
+        self.assertTrue(8 < delay <= 10)
+        self.assertTrue(0 <= self.policy.delay(0, retry_after='bad') <= 0.05)
+
+    def test_retry(self):
+        p = self.policy
+        for method, kwargs, exp in (
+                ('GET', dict(status=503), True),
+                ('POST', dict(status=429), True),
+                ('GET', dict(status=502), True),
+                ('POST', dict(status=504), False),
+                ('POST', dict(status=504, idempotent=True), True),
+                ('DELETE', dict(status=500), False),
+                ('GET', dict(status=404), False),
+                ('POST', dict(sent=False), True),
+                ('POST', dict(), False),
+                ('PUT', dict(), True),
+                ('GET', dict(idempotent=False), False)):
+            p.retried = 0
+            self.assertEqual(exp, p.retry(method, 0, **kwargs) is not None)
+        p.retried = 0
+        self.assertEqual(p.retry('GET', p.retries, status=503), None)
+
+    def test_budget(self):
+        p = self.policy
+        results = [p.retry('GET', 0, status=503) for i in range(3)]
+        self.assertEqual([r is not None for r in results], [1, 1, 0])
+        for i in range(2):
+            p.count_request()
+        self.assertNotEqual(p.retry('GET', 0, status=503), None)
+        self.assertEqual(p.retry('GET', 0, status=503), None)
+        fresh = p.operation()
+        self.assertEqual((fresh.retried, fresh.requests), (0, 0))
+        self.assertEqual(fresh.budget, p.budget)
+        self.assertNotEqual(fresh.retry('GET', 0, status=503), None)
+
+
+class ConcurrencyLimit(TestCase):
+
+    class FakeFuture(object):
+        def __init__(self, exception=False, elapsed=1.0, overloaded=False):
+            self.exception, self.elapsed = exception, elapsed
+            self.overloaded = overloaded
+
+    def setUp(self):
+        from kamaki.clients import ConcurrencyLimit
+        self.limit = ConcurrencyLimit(16)
+        self.now = [0.0]
+        self.patched = patch(
+            'kamaki.clients.time', side_effect=lambda: self.now[0])
+        self.patched.start()
+        self.limit._reset_window()
+
+    def tearDown(self):
+        self.patched.stop()
+
+    def _window(self, nbytes, elapsed=1.0):
+        """Complete a window of operations moving nbytes in elapsed secs"""
+        ops = self.limit()
+        self.now[0] += elapsed
+        for i in range(ops):
+            self.limit.update(self.FakeFuture(), nbytes / ops)
+
+    def test___init__(self):
+        from kamaki.clients import ConcurrencyLimit
+        for faulty in (-1, 0, 0.5, 'a string'):
+            self.assertRaises(AssertionError, ConcurrencyLimit, faulty)
+        self.assertEqual(ConcurrencyLimit(4, limit=10)(), 4)
+        self.assertEqual(ConcurrencyLimit(4, limit=0)(), 1)
+
+    def test_slow_start(self):
+        for i, exp in enumerate((2, 4, 8, 16, 16)):
+            self._window(100 * 2 ** i)
+            self.assertEqual(self.limit(), exp)
+        self.assertTrue(self.limit.slow_start)
+
+    def test_goodput_drop(self):
+        for rate in (100, 200, 400):
+            self._window(rate)
+        self.assertEqual(self.limit(), 8)
+        self._window(200)
+        self.assertEqual(self.limit(), 7)
+        self.assertFalse(self.limit.slow_start)
+        self._window(300)
+        self.assertEqual(self.limit(), 8)
+
+    def test_plateau(self):
+        self._window(100)
+        self._window(200)
+        self.assertEqual(self.limit(), 4)
+        for i in range(self.limit.PROBE_AFTER - 1):
+            self._window(200)
+            self.assertEqual(self.limit(), 4)
+        self._window(200)
+        self.assertEqual(self.limit(), 5)
+
+    def test_latency(self):
+        self._window(100, elapsed=1.0)
+        self.assertEqual(self.limit(), 2)
+        self.now[0] += 3.0
+        for i in range(2):
+            self.limit.update(self.FakeFuture(elapsed=3.0), 150)
+        self.assertEqual(self.limit(), 1)
+
+    def test_overload(self):
+        from kamaki.clients import ClientError
+        for rate in (100, 200, 400, 800):
+            self._window(rate)
+        self.assertEqual(self.limit(), 16)
+        for status in (503, 502, 503):
+            self.limit.update(self.FakeFuture(ClientError('e', status)))
+        self.assertEqual(self.limit(), 8)
+        self.assertFalse(self.limit.slow_start)
+        self.limit.update(self.FakeFuture(ClientError('Not found', 404)))
+        self.assertEqual(self.limit(), 8)
+
+    def test_overload_retried(self):
+        for rate in (100, 200, 400, 800):
+            self._window(rate)
+        self.assertEqual(self.limit(), 16)
+        self.limit.update(self.FakeFuture(overloaded=True), 100)
+        self.assertEqual(self.limit(), 8)
+        self.assertFalse(self.limit.slow_start)
+
+    def test_share(self):
+        from kamaki.clients import Future
+        self.limit.limit = 4
+        futures = [Future(lambda: None) for i in range(3)]
+        for future in futures:
+            self.limit.started(future)
+        self.assertEqual(self.limit.flying, 3)
+        self.assertEqual(self.limit.share(3), 4)
+        self.assertEqual(self.limit.share(1), 2)
+        self.assertEqual(self.limit.share(0), 1)
+        futures[0].run()
+        self.assertEqual(self.limit.flying, 2)
+        self.assertEqual(self.limit.share(0), 2)
+
+
 class FR(object):
     json = None
     text = None
@@ -309,49 +958,106 @@ class Client(TestCase):
         DATE_FORMATS = ['%a %b %d %H:%M:%S %Y']
         self.assertEqual(self.client.DATE_FORMATS, DATE_FORMATS)
 
-    def test__init_thread_limit(self):
-        exp = 'Nothing set here'
-        for faulty in (-1, 0.5, 'a string', {}):
-            self.assertRaises(
-                AssertionError,
-                self.client._init_thread_limit,
-                faulty)
-            self.assertEqual(exp, getattr(self.client, '_thread_limit', exp))
-            self.assertEqual(exp, getattr(self.client, '_elapsed_old', exp))
-            self.assertEqual(exp, getattr(self.client, '_elapsed_new', exp))
-        self.client._init_thread_limit(42)
-        self.assertEqual(42, self.client._thread_limit)
-        self.assertEqual(0.0, self.client._elapsed_old)
-        self.assertEqual(0.0, self.client._elapsed_new)
-
-    def test__watch_thread_limit(self):
-        waits = (
-            dict(args=((0.1, 1), (0.1, 2), (0.2, 1), (0.7, 1), (0.3, 2))),
-            dict(args=((1.0 - (i / 10.0), (i + 1)) for i in range(7))),
-            dict(max=1, args=tuple([(randint(1, 10) / 3.0, 1), ] * 10)),
-            dict(
-                limit=5,
-                args=tuple([
-                    (1.0 + (i / 10.0), (5 - i - 1)) for i in range(4)] + [
-                    (2.0, 1), (1.9, 2), (2.0, 1), (2.0, 2)])),
-            dict(args=tuple(
-                [(1.0 - (i / 10.0), (i + 1)) for i in range(7)] + [
-                (0.1, 7), (0.2, 6), (0.4, 5), (0.3, 6), (0.2, 7), (0.1, 7)])),)
-        for wait_dict in waits:
-            if 'max' in wait_dict:
-                self.client.MAX_THREADS = wait_dict['max']
-            else:
-                self.client.MAX_THREADS = 7
-            if 'limit' in wait_dict:
-                self.client._init_thread_limit(wait_dict['limit'])
-            else:
-                self.client._init_thread_limit()
-                self.client._watch_thread_limit(list())
-                self.assertEqual(1, self.client._thread_limit)
-            for wait, exp_limit in wait_dict['args']:
-                self.client._elapsed_new = wait
-                self.client._watch_thread_limit(list())
-                self.assertEqual(exp_limit, self.client._thread_limit)
+    def test__concurrency_limit(self):
+        self.client.MAX_THREADS = 7
+        limit = self.client._concurrency_limit()
+        self.assertEqual(limit.max_limit, 7)
+        self.assertTrue(limit is self.client._concurrency_limit())
+        self.client.MAX_THREADS = 3
+        self.assertEqual(self.client._concurrency_limit().max_limit, 3)
+        self.client.poolsize = 2
+        self.assertEqual(self.client._concurrency_limit().max_limit, 2)
+
+    def test__path_template(self):
+        for path, exp in (
+                ('/servers/42/action', '/servers/{id}/action'),
+                ('/images/9d6a5e3c-1a7b-4f9e-8e1b-8f6c7a7e6b2a?x=1',
+                    '/images/{id}'),
+                ('/flavors/detail', '/flavors/detail')):
+            self.assertEqual(self.client._path_template(path), exp)
+
+    def test_prewarm_connections(self):
+        from httplib import HTTPConnection
+        from objpool.http import PooledHTTPConnection
+        from kamaki.clients import get_connection_stats
+        self.client.endpoint_url = 'http://prewarm.example.com'
+        stats = get_connection_stats('prewarm.example.com')
+        self.client.poolsize = 2
+        with patch.object(HTTPConnection, 'connect') as connect:
+            self.assertEqual(self.client.prewarm_connections(3), 2)
+            self.assertEqual(len(connect.mock_calls), 2)
+            self.assertEqual(stats.opened, 2)
+            #  the pool is not resized, and busy slots are not waited for
+            self.client.poolsize = 4
+            busy = PooledHTTPConnection('prewarm.example.com', 'http')
+            busy.acquire()
+            self.assertEqual(self.client.prewarm_connections(3), 1)
+            busy.release()
+        self.assertEqual(self.client.connection_stats()['opened'], 3)
+
+    def test_async_run(self):
+        def foo(a, b=0):
+            if a < 0:
+                raise ValueError('negative')
+            return a + b
+
+        self.client.MAX_THREADS = 3
+        kwarg_list = [dict(a=i, b=i) for i in range(10)]
+        self.assertEqual(
+            self.client.async_run(foo, kwarg_list), range(0, 20, 2))
+        kwarg_list.append(dict(a=-1))
+        self.assertRaises(ValueError, self.client.async_run, foo, kwarg_list)
+
+    def test_stop_workers(self):
+        from threading import Event
+        from kamaki.clients import Future, get_worker_pool
+        self.client.MAX_THREADS = 1
+        started, release = Event(), Event()
+
+        def block():
+            started.set()
+            release.wait(4)
+
+        futures = [Future(block)] + [Future(sleep, 0) for i in range(3)]
+        run = self.client._run_async(futures, max_flying=4)
+        first = Future(next, run)
+        get_worker_pool(2).submit(first)
+        started.wait(4)
+        self.client.stop_workers()
+        release.set()
+        first.join(4)
+        done = [first.value] + list(run)
+        self.assertEqual(len(done), 4)
+        self.assertEqual([f.cancelled for f in futures], [False] + [True] * 3)
+        self.assertFalse(get_worker_pool().closed)
+        self.assertEqual(self.client._pending, set())
+
+    def test_join_workers(self):
+        from threading import Event, Thread
+        from kamaki.clients import Future, get_worker_pool
+        self.client.MAX_THREADS = 2
+        started, release = Event(), Event()
+
+        def block():
+            started.set()
+            release.wait(4)
+
+        futures = [Future(block)] + [Future(sleep, 0.5) for i in range(4)]
+        transfer = Thread(target=list, args=(self.client._run_async(
+            futures, max_flying=1),))
+        transfer.daemon = True
+        transfer.start()
+        started.wait(4)
+        #  as on KeyboardInterrupt
+        self.client.stop_workers()
+        self.assertFalse(self.client.join_workers(0.1))
+        release.set()
+        self.assertTrue(self.client.join_workers(4))
+        self.assertEqual(self.client._pending, set())
+        #  the shared workers stay alive
+        self.assertTrue(any(w.is_alive() for w in get_worker_pool()._workers))
+        transfer.join(4)
+        self.assertEqual([f.cancelled for f in futures], [False] + [True] * 4)
 
     @patch('kamaki.clients.Client.set_header')
     def test_set_header(self, SH):
@@ -398,7 +1104,26 @@ class Client(TestCase):
             self.client.request(method, path, **kwargs)
             self.assertEqual(
                 RespInit.mock_calls[-1],
-                call(FR, connection_retry_limit=0, poolsize=None))
+                call(
+                    FR,
+                    poolsize=None, stream=False,
+                    retry_policy=self.client.retry_policy, idempotent=None,
+                    hooks=[], path_template=None))
+
+    @patch('kamaki.clients.RequestManager', return_value=FR)
+    @patch('kamaki.clients.ResponseManager', return_value=FakeResp())
+    @patch('kamaki.clients.ResponseManager.__init__')
+    def test_request_retry_limit(self, Requ, RespInit, Resp):
+        from kamaki.clients import retry_budget
+        FakeResp.status_code = 200
+        self.client.CONNECTION_RETRY_LIMIT = 7
+        self.client.request('get', '/path')
+        self.assertEqual(RespInit.mock_calls[-1][2]['retry_policy'].retries, 7)
+        self.client.CONNECTION_RETRY_LIMIT = 0
+        self.client.RETRY_LIMIT = 1
+        retries = retry_budget(lambda client: client.retry_policy.retries)
+        self.assertEqual(retries(self.client), 1)
+        self.assertEqual(self.client.retry_policy.retries, 1)
 
     @patch('kamaki.clients.Client.request', return_value='lala')
     def _test_foo(self, foo, request):
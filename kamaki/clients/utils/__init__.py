@@ -31,6 +31,17 @@
 # interpreted as representing official policies, either expressed
 # or implied, of GRNET S.A.
 
+from os import fstat, lseek, strerror
+from stat import S_ISREG
+from mmap import mmap, ACCESS_READ
+from errno import ENXIO
+from sys import platform
+import ctypes
+import ctypes.util
+
+#  lseek whence values for sparse files on Linux (not in os of Python 2)
+SEEK_DATA, SEEK_HOLE = 3, 4
+
 
 def _matches(val1, val2, exactMath=True):
     """Case Insensitive match"""
@@ -95,13 +106,219 @@ def path4url(*args):
 def readall(openfile, size, retries=7):
     """Read a file until size is reached"""
     remains = size if size > 0 else 0
-    buf = ''
+    bufs = []
     for i in range(retries):
         tmp_buf = openfile.read(remains)
         if tmp_buf:
-            buf += tmp_buf
+            bufs.append(tmp_buf)
             remains -= len(tmp_buf)
             if remains > 0:
                 continue
-        return buf
+        return bufs[0] if len(bufs) == 1 else ''.join(bufs)
     raise IOError('Failed to read %s bytes from file' % size)
+
+
+def _libc_function(names, argtypes):
+    """:returns: the first libc function found in names, or None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except (OSError, TypeError):
+        return None
+    for name in names:
+        function = getattr(libc, name, None)
+        if function:
+            function.argtypes, function.restype = argtypes, ctypes.c_ssize_t
+            return function
+    return None
+
+#  pwrite and fallocate of libc (not in os of Python 2), None if missing
+_pwrite = _libc_function(('pwrite64', 'pwrite'), [
+    ctypes.c_int, ctypes.c_char_p, ctypes.c_size_t, ctypes.c_int64])
+_fallocate = _libc_function(('fallocate64', 'fallocate'), [
+    ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64])
+
+
+def pwrite(fd, data, offset):
+    """Write all data at offset of a file descriptor, without moving the
+    file position, so that threads can write on the same file without
+    locking. The GIL is released while writing
+
+    :param data: (str)
+
+    :raises OSError: if the write fails or pwrite is not supported
+    """
+    if not _pwrite:
+        raise OSError(0, 'pwrite is not supported')
+    written, size = 0, len(data)
+    while written < size:
+        n = _pwrite(fd, data[written:], size - written, offset + written)
+        if n < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, strerror(errno))
+        written += n
+
+
+def preallocate(fd, size):
+    """Allocate disk space for the first size bytes of a file descriptor,
+    if the system and the file system support it (Linux fallocate)
+
+    :returns: (bool) whether the space is allocated
+    """
+    return bool(_fallocate) and size > 0 and _fallocate(fd, 0, 0, size) == 0
+
+
+def content_range(value):
+    """:param value: (str) a Content-Range header, e.g., bytes 10-20/100
+
+    :returns: (tuple) (start, end) byte positions
+
+    :raises ValueError: if value is not a byte range
+    """
+    unit, sep, positions = value.strip().partition(' ')
+    start, sep, end = positions.partition('/')[0].partition('-')
+    if unit != 'bytes' or not sep:
+        raise ValueError('Invalid Content-Range: %s' % value)
+    return int(start), int(end)
+
+
+def iter_byteranges(chunks, boundary):
+    """Parse a multipart/byteranges body as it arrives
+
+    :param chunks: (iterable of str) the body
+
+    :param boundary: (str) the boundary parameter of the Content-Type
+
+    :returns: (generator of tuples) (position, data) where position is the
+        offset of data in the resource, in the order of the body
+
+    :raises ValueError: if the body is malformed or truncated
+    """
+    delimiter, buf, position, left = '--%s' % boundary, '', 0, 0
+    for chunk in chunks:
+        buf += chunk
+        while buf:
+            if left:
+                data = buf if len(buf) <= left else buf[:left]
+                yield position, data
+                position, left, buf = (
+                    position + len(data), left - len(data), buf[len(data):])
+                continue
+            start = buf.find(delimiter)
+            rest = buf[start + len(delimiter):] if start >= 0 else ''
+            if rest.startswith('--'):
+                return
+            end = rest.find('\r\n\r\n')
+            if end < 0:
+                break  # wait for the rest of the part headers
+            for header in rest[:end].split('\r\n'):
+                name, sep, value = header.partition(':')
+                if name.strip().lower() == 'content-range':
+                    position, last = content_range(value)
+                    left = last - position + 1
+                    break
+            else:
+                raise ValueError('A multipart/byteranges part has no range')
+            buf = rest[end + 4:]
+    raise ValueError('Truncated multipart/byteranges body')
+
+
+def data_extents(openfile, size):
+    """Find the byte ranges of a sparse file that hold data, with lseek
+    SEEK_DATA/SEEK_HOLE, so that holes are not read. The file position is
+    restored
+
+    :param openfile: open file object
+
+    :param size: (int) the bytes of openfile to check
+
+    :returns: (list of tuples) (start, end) of each data range, in order.
+        If holes cannot be found (e.g., not a file, not Linux), the whole
+        file is one range
+    """
+    whole = [(0, size)] if size > 0 else []
+    if not platform.startswith('linux'):
+        return whole
+    try:
+        fd, position = openfile.fileno(), openfile.tell()
+    except (AttributeError, ValueError, EnvironmentError):
+        return whole
+    extents, offset = [], 0
+    try:
+        while offset < size:
+            try:
+                start = lseek(fd, offset, SEEK_DATA)
+            except OSError as oe:
+                if oe.errno == ENXIO:
+                    break  # a hole up to the end of the file
+                raise
+            if start >= size:
+                break
+            offset = min(lseek(fd, start, SEEK_HOLE), size)
+            extents.append((start, offset))
+    except OSError:
+        return whole
+    finally:
+        openfile.seek(position)
+    return extents
+
+
+class BlockReader(object):
+    """Read parts of a file by offset
+
+    Regular files are memory mapped and parts are buffer objects over the
+    map, so that they are not copied. Buffers are valid until the reader is
+    closed. Reading the map past the end of the file crashes the process
+    with SIGBUS, so once the file is found truncated, parts are read from
+    the file instead. This is checked when a part is read and when callers
+    call mapped, not while a buffer is read: a file truncated by another
+    process between the check and the read still crashes the process.
+    Other files (e.g., pipes, StringIO) are read with readall, and seek is
+    called only if the offset is not the current position.
+
+    e.g., with BlockReader(f) as reader: reader.read(0, 4096)
+    """
+
+    def __init__(self, openfile):
+        self.file, self.map, self._position = openfile, None, None
+        try:
+            if S_ISREG(fstat(openfile.fileno()).st_mode):
+                self.map = mmap(openfile.fileno(), 0, access=ACCESS_READ)
+        except (AttributeError, ValueError, OverflowError, EnvironmentError):
+            #  not a real file, an empty file or failed to map it
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def mapped(self):
+        """:returns: (bool) if the map is open and the file is not truncated
+            since it was mapped, i.e., buffers over the map can be read now"""
+        if self.map is None:
+            return False
+        try:
+            return fstat(self.file.fileno()).st_size >= len(self.map)
+        except (ValueError, EnvironmentError):
+            return False
+
+    def close(self):
+        """Close the map, buffers returned by read are not valid after"""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def read(self, offset, size):
+        """:returns: (str or buffer) up to size bytes, starting at offset"""
+        if self.mapped():
+            return buffer(self.map, offset, max(size, 0))
+        if offset != self._position:
+            try:
+                self.file.seek(offset)
+            except (AttributeError, IOError):
+                if self._position is not None:
+                    raise
+        data = readall(self.file, size)
+        self._position = offset + len(data)
+        return data
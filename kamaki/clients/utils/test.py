@@ -140,6 +140,96 @@ class Utils(TestCase):
             self.assertEqual(utils.readall(f, 1), '')
             self.assertRaises(IOError, utils.readall, f, 1, 0)
 
+    def test_BlockReader(self):
+        from StringIO import StringIO
+        tstr = '1234567890'
+        with TemporaryFile() as f:
+            f.write(tstr)
+            f.flush()
+            reader = utils.BlockReader(f)
+            self.assertNotEqual(reader.map, None)
+            self.assertEqual(str(reader.read(5, 3)), tstr[5:8])
+            self.assertEqual(str(reader.read(8, 5)), tstr[8:])
+            self.assertEqual(str(reader.read(0, 4)), tstr[:4])
+        reader = utils.BlockReader(StringIO(tstr))
+        self.assertEqual(reader.map, None)
+        self.assertEqual(reader.read(5, 3), tstr[5:8])
+        self.assertEqual(reader.read(8, 5), tstr[8:])
+        self.assertEqual(reader.read(0, 4), tstr[:4])
+
+    def test_BlockReader_close(self):
+        tstr = '1234567890' * 1000
+        with TemporaryFile() as f:
+            f.write(tstr)
+            f.flush()
+            with utils.BlockReader(f) as reader:
+                self.assertTrue(reader.mapped())
+                self.assertEqual(str(reader.read(0, 4)), tstr[:4])
+            self.assertEqual(reader.map, None)
+            self.assertFalse(reader.mapped())
+            self.assertEqual(reader.read(4, 4), tstr[4:8])
+
+    def test_BlockReader_truncated(self):
+        tstr = '1234567890' * 1000
+        with TemporaryFile() as f:
+            f.write(tstr)
+            f.flush()
+            with utils.BlockReader(f) as reader:
+                f.truncate(5000)
+                self.assertFalse(reader.mapped())
+                self.assertEqual(reader.read(4990, 20), tstr[4990:5000])
+                self.assertEqual(reader.read(9000, 20), '')
+
+    def test_pwrite(self):
+        with TemporaryFile() as f:
+            fd = f.fileno()
+            if utils.preallocate(fd, 100):
+                self.assertEqual(utils.fstat(fd).st_size, 100)
+            utils.pwrite(fd, 'data', 10)
+            utils.pwrite(fd, 'more', 0)
+            self.assertEqual(f.tell(), 0)
+            self.assertEqual(f.read(14), 'more' + '\x00' * 6 + 'data')
+        self.assertRaises(OSError, utils.pwrite, -1, 'data', 0)
+
+    def test_iter_byteranges(self):
+        self.assertEqual(utils.content_range('bytes 10-20/100'), (10, 20))
+        self.assertRaises(ValueError, utils.content_range, 'items 1-2/3')
+        body = (
+            '\r\n--B\r\nContent-Range: bytes 5-9/100\r\n\r\n01234\r\n'
+            '--B\r\ncontent-range: bytes 50-51/100\r\n\r\nab\r\n--B--')
+        for size in (1, 3, 7, len(body)):
+            chunks = [body[i:i + size] for i in range(0, len(body), size)]
+            received = dict()
+            for position, data in utils.iter_byteranges(chunks, 'B'):
+                for i, c in enumerate(data):
+                    received[position + i] = c
+            self.assertEqual(
+                received, dict(zip([5, 6, 7, 8, 9, 50, 51], '01234ab')))
+        self.assertRaises(
+            ValueError, list, utils.iter_byteranges([body[:40]], 'B'))
+        self.assertRaises(ValueError, list, utils.iter_byteranges(
+            ['--B\r\nContent-Type: a\r\n\r\nab'], 'B'))
+
+    def test_data_extents(self):
+        from StringIO import StringIO
+        mb = 1024 * 1024
+        self.assertEqual(utils.data_extents(StringIO('abc'), 3), [(0, 3)])
+        with TemporaryFile() as f:
+            self.assertEqual(utils.data_extents(f, 0), [])
+            f.seek(4 * mb)
+            f.write('data')
+            f.truncate(8 * mb)
+            f.flush()
+            f.seek(10)
+            extents = utils.data_extents(f, 8 * mb)
+            self.assertEqual(f.tell(), 10)
+            #  file systems without holes report a single data range
+            self.assertTrue(extents)
+            self.assertTrue(all(
+                s < e and e <= 8 * mb for s, e in extents))
+            self.assertTrue(any(
+                s <= 4 * mb and 4 * mb + 4 <= e for s, e in extents))
+
 if __name__ == '__main__':
     from sys import argv
     from kamaki.clients.test import runTestCase
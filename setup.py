@@ -77,6 +77,7 @@ setup(
         'kamaki.clients.network',
         'kamaki.clients.cyclades',
         'kamaki.clients.blockstorage',
+        'kamaki.clients.benchmark',
     ],
     classifiers=[
         'Operating System :: OS Independent',